@@ -0,0 +1,137 @@
+#!/usr/bin/python
+"""Asynchronous reading and analysis of many files
+
+:class:`~fragment_analyser.plate.Plate` reads and analyses its files one
+after the other. With files on a network file system, most of the time is
+spent waiting for the data. :func:`analyse_files` reads several files at
+once and interprets them in an executor while the next files are read; the
+lines are yielded as soon as they are ready::
+
+    import asyncio
+    from fragment_analyser.aio import analyse_files
+
+    async def run(filenames):
+        async for line in analyse_files(filenames, concurrency=8):
+            print(line.filename, line.get_peaks())
+
+    asyncio.run(run(filenames))
+
+The interpretation of a file is CPU-bound. It runs in the default thread
+pool of the event loop unless an **executor** is given (e.g. a
+:class:`concurrent.futures.ProcessPoolExecutor`).
+"""
+import asyncio
+import collections
+import io
+import logging
+
+from .line import Line
+
+
+logger = logging.getLogger(__name__)
+
+
+def read_file(filename):
+    """Return the content of a file (bytes)"""
+    with open(filename, "rb") as fin:
+        return fin.read()
+
+
+def read_line(data, filename, guess=None, sigma=50, lower_bound=120,
+              upper_bound=6000, peak_mode="max", geometry=None):
+    """Interpret the content of a file as a :class:`~fragment_analyser.line.Line`
+
+    The guess of the wells is set as in
+    :class:`~fragment_analyser.plate.Plate` so that the line is ready to be
+    analysed (e.g. with :meth:`Line.get_selected_peaks`).
+
+    :param data: the content of the file (bytes)
+    :param filename: the name of the file (stored in :attr:`Line.filename`)
+    """
+    line = Line(io.StringIO(data.decode("utf-8")), sigma=sigma,
+                lower_bound=lower_bound, upper_bound=upper_bound,
+                peak_mode=peak_mode, geometry=geometry)
+    line.filename = filename
+    if line.strategy.uses_guess:
+        line.set_guess(guess)
+    return line
+
+
+async def _analyse_file(filename, executor, kwargs):
+    loop = asyncio.get_running_loop()
+    # I/O in the default thread pool, interpretation in the executor
+    data = await loop.run_in_executor(None, read_file, filename)
+    return await loop.run_in_executor(executor, _read_line, data, filename,
+                                      kwargs)
+
+
+def _read_line(data, filename, kwargs):
+    # module function so that it can be sent to a process pool
+    return read_line(data, filename, **kwargs)
+
+
+async def analyse_files(filenames, concurrency=4, executor=None, ordered=True,
+                        errors="warn", **kwargs):
+    """Read and interpret files concurrently (asynchronous generator)
+
+    At most **concurrency** files are read or interpreted at once; the next
+    file starts when a line is yielded, so that lines that are not consumed
+    do not pile up in memory.
+
+    :param filenames: list of input files
+    :param concurrency: maximum number of files in progress
+    :param executor: a :class:`concurrent.futures.Executor` that interprets
+        the files (default to the thread pool of the event loop)
+    :param ordered: yield the lines in the order of the filenames. If False,
+        lines are yielded as soon as they are ready.
+    :param errors: **warn** to skip files that cannot be interpreted (as
+        :class:`~fragment_analyser.plate.Plate` does) or **raise**
+    :param kwargs: guess, sigma, lower_bound, upper_bound, peak_mode and
+        geometry (see :func:`read_line`)
+    :return: yields :class:`~fragment_analyser.line.Line`
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be positive")
+    if errors not in ("warn", "raise"):
+        raise ValueError("errors must be warn or raise")
+    filenames = iter(filenames)
+    pending = collections.OrderedDict()
+
+    def start():
+        for filename in filenames:
+            task = asyncio.ensure_future(_analyse_file(filename, executor,
+                                                       kwargs))
+            pending[task] = filename
+            return True
+        return False
+
+    def get_result(task):
+        filename = pending.pop(task)
+        try:
+            return task.result()
+        except Exception as err:
+            if errors == "raise":
+                raise
+            logger.warning("%s could not be interpreted (%s)" % (filename, err))
+            return None
+
+    try:
+        while len(pending) < concurrency and start():
+            pass
+        while pending:
+            if ordered:
+                task = next(iter(pending))
+                await asyncio.wait([task])
+                done = [task]
+            else:
+                done, _ = await asyncio.wait(list(pending),
+                                             return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                line = get_result(task)
+                start()
+                if line is not None:
+                    yield line
+    finally:
+        # the consumer stopped early or an error was raised
+        for task in pending:
+            task.cancel()
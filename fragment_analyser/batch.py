@@ -0,0 +1,145 @@
+#!/usr/bin/python
+"""Vectorised peak selection over many wells
+
+The peaks of all wells are padded into 2D arrays (one row per well) so that
+the best peaks of all wells are found at once::
+
+    from fragment_analyser import Line, fa_data
+    from fragment_analyser.batch import get_top_peaks
+    line = Line(fa_data("alternate/peaktable.csv"))
+    line.set_guess()
+    positions, indices = get_top_peaks(line.wells, k=2)
+
+This is used by :meth:`Line.get_peaks` and :meth:`Line.get_selected_peaks`
+when several products are expected in each well (**top_k** parameter).
+"""
+import numpy as np
+
+
+def pad_wells(wells, column="RFU"):
+    """Return the sizes and values of the peaks of all wells as 2D arrays
+
+    :param wells: list of :class:`~fragment_analyser.well.Well`
+    :param column: the values to return (e.g. RFU or % (Conc.))
+    :return: sizes and values arrays of shape (number of wells, maximum
+        number of peaks in a well). Missing peaks are NaN.
+    """
+    lengths = [len(well.df) for well in wells]
+    width = max(lengths + [1])
+    sizes = np.full((len(wells), width), np.nan)
+    values = np.full((len(wells), width), np.nan)
+    for i, well in enumerate(wells):
+        if lengths[i]:
+            sizes[i, :lengths[i]] = well.df["Size (bp)"].astype(float).values
+            values[i, :lengths[i]] = well.df[column].astype(float).values
+    return sizes, values
+
+
+def pad_scores(scores, offsets, width):
+    """Return flat scores (see :class:`~fragment_analyser.strategies.WellBatch`)
+    as a 2D array of shape (number of wells, width) padded with -inf"""
+    offsets = np.asarray(offsets)
+    segments = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    padded = np.full((len(offsets) - 1, width), -np.inf)
+    padded[segments, np.arange(len(scores)) - offsets[segments]] = scores
+    return padded
+
+
+def get_top_peaks(wells, k=1, guesses=None, column="RFU", weighted=True,
+                  strategy=None):
+    """Return the k best peaks of each well
+
+    Without **guesses**, the values of each well are weighted by a gaussian
+    centered on the guess of the well (:attr:`Well.guess`, no weight if not
+    set) with the sigma of the well, as in :meth:`Well.get_peak_and_index`,
+    and the k highest weighted peaks are returned in decreasing order.
+
+    With **guesses** (one position per expected product), the values are
+    weighted by a gaussian centered on each guess and the best peak of each
+    product is returned in the order of the guesses. Two products with close
+    guesses may select the same peak.
+
+    With a **strategy**, the peaks are ranked by the scores of the strategy
+    instead (see :meth:`Strategy.get_valid_scores` and, with **guesses**,
+    :meth:`Strategy.get_product_scores`) so that the first peak is the one
+    selected by the strategy; **column** and **weighted** are then ignored.
+
+    :param wells: list of :class:`~fragment_analyser.well.Well`
+    :param k: number of peaks per well (ignored if guesses are provided)
+    :param guesses: list of expected positions (in bp)
+    :param column: the values to rank
+    :param weighted: set to False to ignore the guess of the wells
+    :param strategy: a strategy or its name (see
+        :mod:`~fragment_analyser.strategies`)
+    :return: positions (in bp) and indices (labels of :attr:`Well.df`) of the
+        selected peaks, both of shape (number of wells, k). Missing peaks
+        have a NaN position and a None index.
+    """
+    if strategy is not None:
+        from .strategies import WellBatch, get_strategy
+        strategy = get_strategy(strategy)
+        batch = WellBatch(wells)
+        sizes = pad_wells(wells)[0]
+        width = sizes.shape[1]
+    else:
+        sizes, values = pad_wells(wells, column)
+        # peaks without size (e.g. ladder) cannot be selected
+        invalid = np.isnan(sizes) | np.isnan(values)
+        sigmas = np.array([well.sigma for well in wells], dtype=float)[:, None]
+
+    if guesses is not None:
+        guesses = np.asarray(guesses, dtype=float)
+        k = len(guesses)
+        # one copy of the scores per product: (k, wells, peaks)
+        if strategy is not None:
+            scores = np.array([pad_scores(strategy.get_product_scores(batch, x),
+                                          batch.offsets, width)
+                               for x in guesses])
+        else:
+            weights = np.exp(-0.5 * ((guesses[:, None, None] - sizes[None]) /
+                                     sigmas[None]) ** 2)
+            scores = np.where(invalid[None], -np.inf, values[None] * weights)
+        order = np.argmax(scores, axis=2).T
+        best = np.take_along_axis(scores.transpose(1, 0, 2), order[:, :, None],
+                                  axis=2)[:, :, 0]
+    else:
+        if strategy is not None:
+            scores = pad_scores(strategy.get_valid_scores(batch), batch.offsets,
+                                width)
+        else:
+            scores = values.copy()
+            if weighted:
+                well_guesses = np.array([np.nan if well.guess is None else
+                                         well.guess for well in wells],
+                                        dtype=float)[:, None]
+                weights = np.exp(-0.5 * ((well_guesses - sizes) / sigmas) ** 2)
+                has_guess = ~np.isnan(well_guesses)
+                scores = np.where(has_guess, scores * weights, scores)
+            scores[invalid] = -np.inf
+
+        width = scores.shape[1]
+        if k < width:
+            # partial sort: the k best peaks of each well, in any order
+            order = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            order = np.tile(np.arange(width), (len(wells), 1))
+        best = np.take_along_axis(scores, order, axis=1)
+        # sort the k selected peaks; ties are broken by position in the table
+        rank = np.lexsort((order, -best), axis=1)
+        order = np.take_along_axis(order, rank, axis=1)
+        best = np.take_along_axis(best, rank, axis=1)
+
+    found = np.isfinite(best)
+    positions = np.where(found, np.take_along_axis(sizes, order, axis=1), np.nan)
+    indices = np.full(order.shape, None, dtype=object)
+    for i, well in enumerate(wells):
+        for j in np.nonzero(found[i])[0]:
+            indices[i, j] = well.df.index[order[i, j]]
+
+    if positions.shape[1] < k:
+        # fewer peaks than requested in all wells
+        extra = k - positions.shape[1]
+        positions = np.hstack([positions, np.full((len(wells), extra), np.nan)])
+        indices = np.hstack([indices, np.full((len(wells), extra), None,
+                                              dtype=object)])
+    return positions, indices
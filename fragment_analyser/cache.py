@@ -0,0 +1,135 @@
+#!/usr/bin/python
+"""On-disk cache of per-file results
+
+Used by :class:`~fragment_analyser.plate.Plate` and the standalone
+application (option --cache-dir) to skip the files that did not change
+since a previous run::
+
+    from fragment_analyser import Plate
+    from fragment_analyser.cache import ResultCache
+    plate = Plate(filenames, cache=ResultCache(".fa_cache"))
+
+Results are keyed by the content of the input file and the parameters of
+the analysis (bounds, sigma, guess, method, geometry and version of the
+reader), so changing any of them invalidates the cached results.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+
+#: to be increased when the interpretation of the files changes
+CACHE_VERSION = 1
+
+
+def get_file_hash(filename, blocksize=1 << 20):
+    """Return the SHA-1 of a file content"""
+    sha = hashlib.sha1()
+    with open(filename, "rb") as fin:
+        for block in iter(lambda: fin.read(blocksize), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=60):
+    """Exclusive access to a directory shared by several processes
+
+    The lock is a file created with O_EXCL and removed on exit::
+
+        with file_lock(os.path.join(directory, "index.lock")):
+            ...
+
+    :param timeout: seconds to wait for another process before raising a
+        RuntimeError
+    """
+    start = time.time()
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            if time.time() - start > timeout:
+                raise RuntimeError("%s is locked by another run (remove "
+                                   "the file if there is none)" % path)
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.remove(path)
+
+
+def get_key(filename, parameters):
+    """Return the key of a file analysed with some parameters
+
+    :param parameters: a dictionary with the parameters of the analysis
+    """
+    from fragment_analyser import version
+    params = dict(parameters, cache_version=CACHE_VERSION, version=version)
+    sha = hashlib.sha1(get_file_hash(filename).encode("utf-8"))
+    sha.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return sha.hexdigest()
+
+
+class ResultCache(object):
+    """Store the selected peaks (and diagnostic image) of each input file
+
+    :param directory: where results are stored (created if needed)
+    :param images: if True (or the image format, png or svg), results without
+        diagnostic image are considered as missing.
+    """
+    def __init__(self, directory=".fa_cache", images=False):
+        self.directory = directory
+        self.images = images
+        self.image_format = images if images in ("png", "svg") else "png"
+        if os.path.isdir(directory) is False:
+            os.makedirs(directory)
+
+    def get_key(self, filename, parameters):
+        """Return the key of a file analysed with some parameters (see
+        :func:`get_key`)"""
+        return get_key(filename, parameters)
+
+    def _get_path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def get_rows(self, key):
+        """Return the cached results (dataframe) or None if missing"""
+        rows = self._get_path(key, ".pkl")
+        if os.path.exists(rows) is False:
+            return None
+        if self.images and self.get_image(key) is None:
+            return None
+        try:
+            return pd.read_pickle(rows)
+        except Exception:
+            # e.g. truncated file or incompatible pandas version
+            return None
+
+    def set_rows(self, key, rows):
+        """Store the results of a file"""
+        path = self._get_path(key, ".pkl")
+        rows.to_pickle(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def get_image(self, key):
+        """Return the path of the cached image or None if missing"""
+        path = self._get_path(key, "." + self.image_format)
+        return path if os.path.exists(path) else None
+
+    def set_image(self, key, filename):
+        """Store a copy of an image"""
+        path = self._get_path(key, "." + self.image_format)
+        shutil.copyfile(filename, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def clear(self):
+        """Remove all cached results"""
+        for filename in os.listdir(self.directory):
+            if filename.endswith((".pkl", ".png", ".svg")):
+                os.remove(os.path.join(self.directory, filename))
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+"""Confidence of the peak selected in each well
+
+Three metrics are computed for the selected peak of all wells at once
+(broadcasted NumPy arrays, see :mod:`~fragment_analyser.batch`):
+
+- **Margin**: relative difference between the score of the selected peak
+  and of the runner-up, (best - second) / best, where the scores are those
+  of the strategy (e.g. the weighted height with max, see
+  :meth:`Strategy.get_scores`). 1 if there is a single peak, close to 0 if
+  another peak could have been selected, NaN if the best score is not
+  positive (e.g. closest strategy).
+- **Sigma stability**: fraction of the sigma values (the sigma of the well
+  multiplied by each of **sigma_factors**) for which the same peak is
+  selected. 1 if the selection does not depend on the sigma.
+- **Line MAD distance** and **Plate MAD distance**: distance between the
+  selected peak and the median of the selected peaks of the line (or of the
+  plate) in MAD units, as shown by the bands of :meth:`Line.diagnostic`.
+
+::
+
+    from fragment_analyser import Plate, fa_data
+    plate = Plate([fa_data("alternate/peaktable.csv")], confidence=True)
+    plate.analyse()
+    plate.data[["Well", "Margin", "Sigma stability", "Line MAD distance"]]
+
+"""
+import numpy as np
+import pandas as pd
+
+from .batch import pad_scores, pad_wells
+from .filters import get_mad_statistics
+from .strategies import WellBatch, get_strategy
+
+
+#: the columns added to the results
+columns = ["Margin", "Sigma stability", "Line MAD distance",
+           "Plate MAD distance"]
+
+
+def get_mad_distance(values, minmad=25):
+    """Return the distance to the median of values in MAD units
+
+    :param values: array of values (NaN are ignored)
+    :param minmad: minimal MAD (as in :meth:`Line.get_mad`)
+    """
+    values = np.asarray(values, dtype=float)
+    # a single group (see filters.get_mad_statistics)
+    median, mad = get_mad_statistics(values, np.zeros(len(values), dtype=int),
+                                     minmad=minmad)
+    return np.abs(values - median) / mad
+
+
+def get_plate_distance(data, minmad=25):
+    """Return the Plate MAD distance of each row of the results
+
+    :param data: the results of a plate (e.g. :attr:`Plate.data`)
+    :return: the distance of the selected peaks (of rank 1 if several peaks
+        are reported) to their median; NaN for the other rows
+    """
+    selected = data["Size (bp)"].notnull().values
+    if "Rank" in data.columns:
+        selected &= (data["Rank"] == 1).values
+    distance = np.full(len(data), np.nan)
+    distance[selected] = get_mad_distance(
+        data["Size (bp)"].values[selected].astype(float), minmad)
+    return distance
+
+
+def get_confidence(wells, peak_mode="max", sigma_factors=(0.5, 1, 2),
+                   minmad=25, guess=None):
+    """Return the confidence of the selected peak of each well
+
+    :param wells: list of :class:`~fragment_analyser.well.Well` (a line)
+    :param peak_mode: the strategy that selects the peaks, whose scores are
+        used (see :mod:`~fragment_analyser.strategies`)
+    :param sigma_factors: the sigma values tested for the stability
+    :param guess: the expected position of the product reported with rank 1
+        when several products are expected (**guesses** of
+        :meth:`Line.get_selected_peaks`). The peaks are then scored for this
+        product (see :meth:`Strategy.get_product_scores`).
+    :return: a dataframe indexed by the well names with the selected peak
+        (**Size (bp)**), the **Margin**, **Sigma stability** and **Line MAD
+        distance**
+    """
+    strategy = get_strategy(peak_mode)
+    batch = WellBatch(wells)
+    sizes = pad_wells(wells)[0]
+
+    # scores for the sigma of the well and for each of the factors:
+    # (factors + 1, wells, peaks)
+    scores = []
+    for factor in np.r_[1, np.asarray(sigma_factors, dtype=float)]:
+        scaled = batch.with_sigmas(batch.sigmas * factor)
+        if guess is None:
+            values = strategy.get_valid_scores(scaled)
+        else:
+            values = strategy.get_product_scores(scaled, guess)
+        scores.append(pad_scores(values, batch.offsets, sizes.shape[1]))
+    scores = np.array(scores)
+
+    # padding so that the runner-up of wells with a single peak is -inf
+    padded = np.concatenate([scores[0], np.full((len(wells), 1), -np.inf)],
+                            axis=1)
+    top = -np.partition(-padded, 1, axis=1)[:, 0:2]
+    best, second = top[:, 0], top[:, 1]
+    found = np.isfinite(best)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(np.isfinite(second), (best - second) / best, 1.)
+    margin = np.where(found & (best > 0), margin, np.nan)
+
+    choices = np.argmax(scores, axis=2)
+    stability = (choices[1:] == choices[0]).mean(axis=0)
+    stability = np.where(found, stability, np.nan)
+
+    peaks = np.where(found, sizes[np.arange(len(wells)), choices[0]], np.nan)
+    names = [well.name for well in wells]
+    return pd.DataFrame({"Size (bp)": peaks, "Margin": margin,
+                         "Sigma stability": stability,
+                         "Line MAD distance": get_mad_distance(peaks, minmad)},
+                        index=names)
+
+
+def add_confidence(rows, confidence):
+    """Add the confidence of the wells of a line to its results
+
+    :param rows: the results of a line (see :meth:`Line.get_selected_peaks`)
+    :param confidence: the output of :func:`get_confidence` for this line
+    :return: a copy of the rows. With several peaks per well, only the rows
+        of rank 1 get values.
+    """
+    rows = rows.copy()
+    if "Rank" in rows.columns:
+        selected = (rows["Rank"] == 1).values
+    else:
+        selected = np.ones(len(rows), dtype=bool)
+    for column in ["Margin", "Sigma stability", "Line MAD distance"]:
+        values = rows["Well"].map(confidence[column]).values.astype(float)
+        rows[column] = np.where(selected, values, np.nan)
+    return rows
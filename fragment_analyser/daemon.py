@@ -0,0 +1,181 @@
+#!/usr/bin/python
+"""Pre-forked worker daemon
+
+Python, pandas and matplotlib are imported once by the daemon; the workers
+are forked from it and wait for requests on a Unix socket::
+
+    fragment_analyser daemon --workers 4
+
+Requests are sent by the thin client (see :mod:`fragment_analyser_client`),
+which accepts the same options as the standalone application::
+
+    fragment_analyser_client --pattern "2015*csv" --tag test
+
+Each request runs :func:`fragment_analyser.pipelines.main` in the working
+directory of the client; outputs and logs are streamed back to the client.
+Workers are replaced after **--max-requests** requests or if they die.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import traceback
+
+from fragment_analyser_client import get_default_socket, send_message, \
+    read_messages
+
+
+class _Stream(object):
+    # file-like object sending what is written to the client
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+
+    def write(self, data):
+        if data:
+            send_message(self.conn, {"stream": self.name, "data": data})
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def handle(conn):
+    """Run the request of a client connected to **conn**"""
+    from . import pipelines
+    request = next(read_messages(conn.makefile("rb")))
+    args = request.get("args", [])
+
+    cwd = os.getcwd()
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _Stream(conn, "stdout"), _Stream(conn, "stderr")
+    try:
+        os.chdir(request.get("cwd", cwd))
+        if args and args[0] in ("daemon", "serve"):
+            sys.stderr.write("%s cannot be run by the daemon\n" % args[0])
+            code = 2
+        else:
+            pipelines.main(["fragment_analyser"] + args)
+            code = 0
+    except SystemExit as err:
+        # e.g. --help or invalid options
+        code = err.code if isinstance(err.code, int) else int(err.code is not None)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        os.chdir(cwd)
+    send_message(conn, {"exit": code})
+
+
+def _worker(sock, max_requests):
+    count = 0
+    while max_requests == 0 or count < max_requests:
+        conn, _ = sock.accept()
+        count += 1
+        try:
+            handle(conn)
+        except Exception:
+            # the client may have disconnected
+            pass
+        finally:
+            conn.close()
+
+
+def serve(path, workers=4, max_requests=100):
+    """Start the workers and replace them when they exit
+
+    :param path: path of the Unix socket
+    :param workers: number of worker processes
+    :param max_requests: number of requests handled by a worker before it is
+        replaced (0 for no limit)
+    """
+    if hasattr(os, "fork") is False:
+        raise OSError("The daemon requires fork and Unix sockets")
+
+    # warm up: import everything a request needs before forking
+    import pandas
+    import pylab
+    from . import pipelines
+
+    if os.path.exists(path):
+        os.remove(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(64)
+
+    children = set()
+
+    def spawn():
+        # signals received while forking are delayed, otherwise the exception
+        # raised by stop() may be swallowed by the handlers run at fork
+        signals = [signal.SIGTERM, signal.SIGINT]
+        signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+            try:
+                _worker(sock, max_requests)
+            finally:
+                os._exit(0)
+        children.add(pid)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for i in range(workers):
+            spawn()
+        while True:
+            pid, status = os.wait()
+            if pid in children:
+                children.remove(pid)
+                spawn()
+    except (SystemExit, KeyboardInterrupt):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        sock.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class Options(argparse.ArgumentParser):
+    def __init__(self, prog="fragment_analyser daemon"):
+        usage = """
+
+    fragment_analyser daemon --workers 4
+    fragment_analyser_client --pattern "2015*csv"
+        """
+        super(Options, self).__init__(usage=usage, prog=prog,
+            description="Keep warm workers to run fragment_analyser requests",
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument("--socket", default=get_default_socket(), type=str,
+                          help="Path of the Unix socket (default to %(default)s)")
+        self.add_argument("-w", "--workers", default=4, type=int,
+                          help="Number of worker processes")
+        self.add_argument("--max-requests", default=100, type=int,
+                          help="""Requests handled by a worker before it is
+                          replaced (0 for no limit)""")
+
+
+def main(args):
+    """Entry point of ``fragment_analyser daemon``"""
+    options = Options().parse_args(args[1:])
+    print("Listening on %s with %s worker(s)" % (options.socket, options.workers))
+    sys.stdout.flush()
+    serve(options.socket, workers=options.workers,
+          max_requests=options.max_requests)
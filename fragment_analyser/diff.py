@@ -0,0 +1,352 @@
+#!/usr/bin/python
+"""Compare two sets of results
+
+After an upgrade or a change of parameters, the summary files of a new run
+are compared with those of a reference run::
+
+    fragment_analyser diff old/summary_all.csv new/summary_all.csv --tolerance "Size (bp)=2"
+
+or, to compare all the summary files found in both directories::
+
+    fragment_analyser diff old new --rtol 1e-6 -o changes.csv
+
+The rows are aligned on their Well and Sample ID (and Rank when several
+peaks per well are reported). As the same well is found in several input
+files, the n-th occurrence of a key in the old file is aligned with its n-th
+occurrence in the new file (files are analysed in the same order). Numeric
+values match if::
+
+    |new - old| <= atol + rtol * |old|
+
+or if both are missing. A changed **Size (bp)** is a changed call: another
+peak (or no peak) is selected in the well.
+
+The same comparison is available from Python::
+
+    from fragment_analyser.diff import SummaryDiff
+    diff = SummaryDiff("old/summary_all.csv", "new/summary_all.csv", atol=0.01)
+    print(diff)
+    diff.changes   # one row per changed value
+"""
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+
+#: columns used to align the rows (Rank is added if found in both files)
+default_keys = ["Well", "Sample ID"]
+#: the column of the selected peak
+call_column = "Size (bp)"
+
+
+def read_summary(filename, keys=None):
+    """Read a summary file; key columns are read as strings"""
+    keys = default_keys + ["Rank"] if keys is None else keys
+    return pd.read_csv(filename, dtype=dict((key, str) for key in keys))
+
+
+def parse_tolerance(text):
+    """Return (column, tolerance) from a string such as **Size (bp)=2**"""
+    try:
+        column, value = text.rsplit("=", 1)
+        return column.strip(), float(value)
+    except ValueError:
+        raise ValueError("Invalid tolerance %s (expected COLUMN=VALUE)" % text)
+
+
+def _get_codes(df, keys):
+    # a hash of the keys of each row and the occurrence of the key
+    hashes = pd.util.hash_pandas_object(df[keys], index=False).values
+    occurrences = pd.Series(hashes).groupby(hashes).cumcount().values
+    return hashes, occurrences
+
+
+def align(old, new, keys):
+    """Align the rows of two dataframes on their keys (hashed join)
+
+    :return: the positions of the matched rows in **old** and **new**, the
+        positions of the rows only found in **old** (removed) and only found
+        in **new** (added) and the occurrence of the key of each row of
+        **old** and **new**
+    """
+    old_hashes, old_occurrences = _get_codes(old, keys)
+    new_hashes, new_occurrences = _get_codes(new, keys)
+    left = pd.DataFrame({"hash": old_hashes, "n": old_occurrences,
+                         "old": np.arange(len(old))})
+    right = pd.DataFrame({"hash": new_hashes, "n": new_occurrences,
+                          "new": np.arange(len(new))})
+    joined = left.merge(right, on=["hash", "n"], how="outer", sort=False)
+    matched = joined["old"].notnull().values & joined["new"].notnull().values
+    ileft = joined["old"].values[matched].astype(np.int64)
+    iright = joined["new"].values[matched].astype(np.int64)
+    removed = np.sort(joined["old"].values[joined["new"].isnull().values]).astype(np.int64)
+    added = np.sort(joined["new"].values[joined["old"].isnull().values]).astype(np.int64)
+
+    # the keys of the matched rows are checked (collisions of the hashes)
+    for key in keys:
+        lhs = old[key].values[ileft]
+        rhs = new[key].values[iright]
+        same = (lhs == rhs) | (pd.isnull(lhs) & pd.isnull(rhs))
+        if not same.all():
+            raise ValueError("Rows could not be aligned on %s" % ", ".join(keys))
+
+    order = np.argsort(ileft, kind="mergesort")
+    return (ileft[order], iright[order], removed, added,
+            old_occurrences, new_occurrences)
+
+
+def get_changed(old, new, atol=0., rtol=0.):
+    """Return a boolean array: True where two columns differ
+
+    Numeric values are compared with the tolerances, other values exactly.
+    Missing values are equal to each other.
+    """
+    old = np.asarray(old)
+    new = np.asarray(new)
+    missing = pd.isnull(old) & pd.isnull(new)
+    if old.dtype.kind in "biuf" and new.dtype.kind in "biuf":
+        old = old.astype(float)
+        new = new.astype(float)
+        with np.errstate(invalid="ignore"):
+            close = np.abs(new - old) <= atol + rtol * np.abs(old)
+        return ~(close | missing)
+    return ~((old == new) | missing)
+
+
+class SummaryDiff(object):
+    """Differences between two summary files
+
+    :param old: the reference results (filename or dataframe)
+    :param new: the new results (filename or dataframe)
+    :param keys: columns used to align the rows (default to Well, Sample ID
+        and Rank if found in both)
+    :param atol: absolute tolerance of the numeric columns
+    :param rtol: relative tolerance of the numeric columns
+    :param tolerances: dictionary with the absolute tolerance of some
+        columns (replaces **atol** and **rtol** for these columns)
+    """
+    def __init__(self, old, new, keys=None, atol=0., rtol=0., tolerances=None):
+        if isinstance(old, str):
+            self.old_filename = old
+            old = read_summary(old, keys)
+        else:
+            self.old_filename = None
+        if isinstance(new, str):
+            self.new_filename = new
+            new = read_summary(new, keys)
+        else:
+            self.new_filename = None
+        if keys is None:
+            keys = list(default_keys)
+            if "Rank" in old.columns and "Rank" in new.columns:
+                keys.append("Rank")
+        for key in keys:
+            if key not in old.columns or key not in new.columns:
+                raise ValueError("Column %s not found in both results" % key)
+        self.old = old.reset_index(drop=True)
+        self.new = new.reset_index(drop=True)
+        self.keys = keys
+        self.atol = atol
+        self.rtol = rtol
+        self.tolerances = tolerances or {}
+        #: columns only found in the old or new results
+        self.columns_removed = [x for x in old.columns if x not in new.columns]
+        self.columns_added = [x for x in new.columns if x not in old.columns]
+        #: compared columns (found in both, except the keys)
+        self.columns = [x for x in old.columns
+                        if x in new.columns and x not in keys]
+        self._compare()
+
+    def _compare(self):
+        (self._old_rows, self._new_rows, self._removed, self._added,
+         self._old_n, self._new_n) = align(self.old, self.new, self.keys)
+
+        # one column of changes per compared column
+        self._changed = np.zeros((len(self._old_rows), len(self.columns)),
+                                 dtype=bool)
+        for j, column in enumerate(self.columns):
+            atol, rtol = self.atol, self.rtol
+            if column in self.tolerances:
+                atol, rtol = self.tolerances[column], 0.
+            self._changed[:, j] = get_changed(
+                self.old[column].values[self._old_rows],
+                self.new[column].values[self._new_rows], atol, rtol)
+
+    @property
+    def matched(self):
+        """Number of rows found in both results"""
+        return len(self._old_rows)
+
+    @property
+    def removed(self):
+        """The rows only found in the old results"""
+        return self.old.iloc[self._removed]
+
+    @property
+    def added(self):
+        """The rows only found in the new results"""
+        return self.new.iloc[self._added]
+
+    def get_changed_rows(self):
+        """Return a boolean array: True for matched rows with a change"""
+        return self._changed.any(axis=1)
+
+    def get_changed_calls(self):
+        """Return the matched rows where another peak is selected
+
+        :return: the keys, occurrence and old and new sizes of the rows
+        """
+        if call_column not in self.columns:
+            return pd.DataFrame(columns=self.keys + ["Occurrence", "Old", "New"])
+        changed = self._changed[:, self.columns.index(call_column)]
+        old_rows = self._old_rows[changed]
+        df = self.old.loc[old_rows, self.keys].reset_index(drop=True)
+        df["Occurrence"] = self._old_n[old_rows]
+        df["Old"] = self.old[call_column].values[old_rows]
+        df["New"] = self.new[call_column].values[self._new_rows[changed]]
+        return df
+
+    @property
+    def changes(self):
+        """One row per changed value of the matched rows
+
+        Columns are the keys, Occurrence, Column, Old, New and Delta (for
+        numeric columns).
+        """
+        rows, columns = np.nonzero(self._changed)
+        old_rows = self._old_rows[rows]
+        new_rows = self._new_rows[rows]
+        df = self.old.loc[old_rows, self.keys].reset_index(drop=True)
+        df["Occurrence"] = self._old_n[old_rows]
+        names = np.array(self.columns, dtype=object)
+        df["Column"] = names[columns]
+        old = np.empty(len(rows), dtype=object)
+        new = np.empty(len(rows), dtype=object)
+        delta = np.full(len(rows), np.nan)
+        for j, column in enumerate(self.columns):
+            mask = columns == j
+            if not mask.any():
+                continue
+            lhs = self.old[column].values[old_rows[mask]]
+            rhs = self.new[column].values[new_rows[mask]]
+            old[mask] = lhs
+            new[mask] = rhs
+            if lhs.dtype.kind in "biuf" and rhs.dtype.kind in "biuf":
+                delta[mask] = rhs.astype(float) - lhs.astype(float)
+        df["Old"] = old
+        df["New"] = new
+        df["Delta"] = delta
+        return df
+
+    def get_counts(self):
+        """Return the number of changed values of each compared column"""
+        return pd.Series(self._changed.sum(axis=0), index=self.columns)
+
+    @property
+    def identical(self):
+        """True if no row, column or value differs"""
+        return (len(self._removed) == 0 and len(self._added) == 0 and
+                not self.columns_added and not self.columns_removed and
+                not self._changed.any())
+
+    def __str__(self):
+        msg = ""
+        if self.old_filename is not None:
+            msg += "--- %s\n+++ %s\n" % (self.old_filename, self.new_filename)
+        msg += "rows: %s old, %s new, %s matched, %s removed, %s added\n" % (
+            len(self.old), len(self.new), self.matched, len(self._removed),
+            len(self._added))
+        if self.columns_removed:
+            msg += "columns removed: %s\n" % ", ".join(self.columns_removed)
+        if self.columns_added:
+            msg += "columns added: %s\n" % ", ".join(self.columns_added)
+        if call_column in self.columns:
+            ncalls = self._changed[:, self.columns.index(call_column)].sum()
+            msg += "changed calls: %s\n" % ncalls
+        msg += "changed rows: %s\n" % self.get_changed_rows().sum()
+        counts = self.get_counts()
+        for column, count in counts[counts > 0].items():
+            msg += " - %s: %s\n" % (column, count)
+        return msg
+
+
+def get_pairs(old, new):
+    """Return the pairs of files to compare
+
+    Two files are compared as is. With two directories, the summary files
+    (summary*.csv) found in both are compared.
+    """
+    if os.path.isdir(old) and os.path.isdir(new):
+        names = sorted(set(os.path.basename(x)
+                           for x in glob.glob(os.path.join(old, "summary*.csv")))
+                       & set(os.listdir(new)))
+        return [(os.path.join(old, x), os.path.join(new, x)) for x in names]
+    return [(old, new)]
+
+
+class Options(argparse.ArgumentParser):
+    def __init__(self, prog="fragment_analyser diff"):
+        usage = """
+
+    fragment_analyser diff old/summary_all.csv new/summary_all.csv
+    fragment_analyser diff old new --tolerance "Size (bp)=2" --rtol 1e-6
+        """
+        super(Options, self).__init__(usage=usage, prog=prog,
+            description="""Compare the results of two runs (summary files or
+directories with summary files). The exit code is 1 if results differ""",
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument("old", type=str,
+                          help="The reference summary file (or directory)")
+        self.add_argument("new", type=str,
+                          help="The new summary file (or directory)")
+        self.add_argument("--keys", nargs="+", default=None,
+                          help="Columns used to align the rows (defaults to "
+                               "Well and Sample ID, and Rank if found)")
+        self.add_argument("--atol", default=0., type=float,
+                          help="Absolute tolerance of the numeric columns")
+        self.add_argument("--rtol", default=0., type=float,
+                          help="Relative tolerance of the numeric columns")
+        self.add_argument("--tolerance", nargs="+", default=[],
+                          help="""Absolute tolerance of some columns given as
+COLUMN=VALUE (e.g. "Size (bp)=2")""")
+        self.add_argument("-o", "--output", default=None, type=str,
+                          help="Save the changed values in this CSV file")
+        self.add_argument("--calls-only", action="store_true",
+                          help="Only report the changed calls (Size (bp))")
+        self.add_argument("--max-rows", default=20, type=int,
+                          help="Number of changes printed per file")
+
+
+def main(args):
+    """Entry point of ``fragment_analyser diff``"""
+    options = Options().parse_args(args[1:])
+    tolerances = dict(parse_tolerance(x) for x in options.tolerance)
+    pairs = get_pairs(options.old, options.new)
+    if len(pairs) == 0:
+        print("No summary file found in both %s and %s" % (options.old,
+                                                          options.new))
+        return 1
+    different = False
+    reports = []
+    for old, new in pairs:
+        diff = SummaryDiff(old, new, keys=options.keys, atol=options.atol,
+                           rtol=options.rtol, tolerances=tolerances)
+        print(diff)
+        if options.calls_only:
+            changes = diff.get_changed_calls()
+            different |= len(changes) > 0
+        else:
+            changes = diff.changes
+            different |= not diff.identical
+        if len(changes):
+            print(changes.head(options.max_rows).to_string(index=False))
+            print()
+        if options.output:
+            changes.insert(0, "File", os.path.basename(new))
+            reports.append(changes)
+    if options.output:
+        pd.concat(reports, ignore_index=True).to_csv(options.output, index=False)
+    return 1 if different else 0
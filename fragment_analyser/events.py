@@ -0,0 +1,131 @@
+#!/usr/bin/python
+"""Progress events of an analysis
+
+A :class:`~fragment_analyser.plate.Plate` reports its progress as events
+(dictionaries) sent to callbacks, which is more convenient than parsing the
+messages of the logger for applications that embed the library::
+
+    from fragment_analyser import Plate
+    from fragment_analyser.events import JSONLinesWriter
+
+    def callback(event):
+        if event["event"] == "file_end":
+            print(event["filename"], event["eta"])
+
+    plate = Plate(filenames, events=[callback, JSONLinesWriter("events.jsonl")])
+
+or from the command line (use - for the standard output)::
+
+    fragment_analyser --pattern "*.csv" --events events.jsonl --quiet
+
+Events have an **event** (the type) and a **time** (seconds since the epoch)
+key. Types and their other keys are:
+
+=============== ==============================================================
+run_start       files (number of files to read)
+file_start      filename, index (position of the file, from 0)
+file_end        filename, index, status (analysed, cached, journal,
+                failed or invalid), wells (number of wells), seconds,
+                wells_per_second (throughput since the start of the run)
+                and eta (seconds left, estimated from the mean time per
+                file)
+output          filename (a file written by the command line application)
+run_end         files, wells, seconds and wells_per_second
+=============== ==============================================================
+"""
+import json
+import sys
+import time
+
+
+class EventStream(object):
+    """Sends progress events to callbacks
+
+    :param callbacks: a callable or list of callables called with each
+        event (a dictionary)
+    """
+    def __init__(self, callbacks=None):
+        if callbacks is None:
+            callbacks = []
+        elif callable(callbacks):
+            callbacks = [callbacks]
+        self.callbacks = list(callbacks)
+        self._start = None
+        self._total = 0
+        self._done = 0
+        self._wells = 0
+
+    def add_callback(self, callback):
+        """Add a callable called with each event"""
+        self.callbacks.append(callback)
+
+    def emit(self, event, **fields):
+        """Send an event to all callbacks"""
+        fields["event"] = event
+        fields["time"] = time.time()
+        for callback in self.callbacks:
+            callback(fields)
+
+    def start(self, total):
+        """Start a run of **total** files"""
+        self._start = time.time()
+        self._total, self._done, self._wells = total, 0, 0
+        self.emit("run_start", files=total)
+
+    def file_start(self, filename, index):
+        self._file_start = time.time()
+        self.emit("file_start", filename=str(filename), index=index)
+
+    def file_end(self, filename, index, status, wells=0):
+        now = time.time()
+        self._done += 1
+        self._wells += wells
+        elapsed = now - self._start
+        eta = elapsed / self._done * (self._total - self._done)
+        self.emit("file_end", filename=str(filename), index=index,
+                  status=status, wells=wells,
+                  seconds=now - self._file_start,
+                  wells_per_second=self._wells / elapsed if elapsed else None,
+                  eta=eta)
+
+    def end(self):
+        """End the run"""
+        elapsed = time.time() - self._start
+        self.emit("run_end", files=self._done, wells=self._wells,
+                  seconds=elapsed,
+                  wells_per_second=self._wells / elapsed if elapsed else None)
+
+
+def get_stream(events):
+    """Return an :class:`EventStream` (None if **events** is None)
+
+    :param events: an :class:`EventStream`, a callable or a list of
+        callables
+    """
+    if events is None or isinstance(events, EventStream):
+        return events
+    return EventStream(events)
+
+
+class JSONLinesWriter(object):
+    """Callback that writes each event as a JSON document on its own line
+
+    :param filename: the output file (appended) or - for the standard
+        output
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        if filename == "-":
+            self._stream = None
+        else:
+            self._stream = open(filename, "a")
+
+    def __call__(self, event):
+        stream = self._stream or sys.stdout
+        stream.write(json.dumps(event) + "\n")
+        stream.flush()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
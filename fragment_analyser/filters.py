@@ -0,0 +1,251 @@
+#!/usr/bin/python
+"""Robust outlier filters computed per group
+
+The filters return boolean masks (True for outliers) computed in a single
+vectorised pass over all rows, whatever the number of groups::
+
+    from fragment_analyser import Plate, fa_data
+    from fragment_analyser.filters import get_outlier_mask, apply_mask
+    plate = Plate([fa_data("alternate/peaktable.csv")])
+    plate.analyse()
+    mask = get_outlier_mask(plate.data, by="row")
+    filtered = apply_mask(plate.data, mask)
+
+Groups (**by** parameter) are given as:
+
+- None: all rows are in the same group
+- "row" or "column": the line letter or column number of the well name
+- "prefix:N": the first N characters of the Sample ID
+- the name of a column of the data (e.g. Sample ID)
+- an array or series of keys, one per row
+- a function called with the data that returns such keys, e.g.
+  ``lambda df: df["Sample ID"].str[0:3]`` for a Sample ID prefix
+- a list of the above, combined
+
+Missing values are NaN and never reported as outliers.
+"""
+import numpy as np
+import pandas as pd
+
+from .geometry import get_geometry
+from .kernels import get_group_statistics
+
+
+def get_group_codes(data, by=None, geometry=None):
+    """Return an integer code per row identifying the group of the row
+
+    :param data: a dataframe such as :attr:`Plate.data`
+    :param by: the groups (see module documentation)
+    :param geometry: used to interpret the well names with "row" and
+        "column" (default to 96-well plates)
+    :return: an array of integers. Rows with a missing key get -1.
+    """
+    if by is None:
+        return np.zeros(len(data), dtype=int)
+    if isinstance(by, list):
+        keys = by
+    else:
+        keys = [by]
+
+    codes = np.zeros(len(data), dtype=np.int64)
+    missing = np.zeros(len(data), dtype=bool)
+    for key in keys:
+        if callable(key):
+            key = key(data)
+        elif isinstance(key, str) and key in data.columns:
+            key = data[key]
+        elif isinstance(key, str) and key in ("row", "column"):
+            rows, cols = get_geometry(geometry).split(data["Well"].values)
+            key = rows if key == "row" else cols
+            key = np.where(key >= 0, key, np.nan)
+        elif isinstance(key, str) and key.startswith("prefix:"):
+            key = data["Sample ID"].astype(str).str[0:int(key.split(":")[1])]
+        elif isinstance(key, str):
+            raise ValueError("Unknown group %s" % key)
+        labels, uniques = pd.factorize(np.asarray(key, dtype=object))
+        missing |= labels < 0
+        codes = codes * (len(uniques) + 1) + labels + 1
+    codes = pd.factorize(codes)[0]
+    codes[missing] = -1
+    return codes
+
+
+def get_mad_statistics(values, codes, minmad=25):
+    """Return the median and MAD of the group of each value
+
+    :param values: array of values with NaN for missing values
+    :param codes: the group of each value (see :func:`get_group_codes`)
+    :param minmad: minimal MAD
+    :return: median and MAD (arrays)
+    """
+    median, mad = get_group_statistics(values, codes)
+    # groups without values keep a NaN MAD
+    return median, np.maximum(mad, minmad)
+
+
+def get_mad_bounds(values, codes, minmad=25, nmad=3):
+    """Return the median -/+ nmad times the MAD of the group of each value
+
+    :param values: array of values with NaN for missing values
+    :param codes: the group of each value (see :func:`get_group_codes`)
+    :return: lower and upper bounds (arrays)
+    """
+    median, mad = get_mad_statistics(values, codes, minmad=minmad)
+    return median - nmad * mad, median + nmad * mad
+
+
+def get_hampel_bounds(values, codes, window=2, minmad=25, nmad=3):
+    """Return the bounds of a Hampel filter applied within each group
+
+    The median and MAD are computed over a sliding window of 2 * window + 1
+    values (in the order of the rows) that does not cross group boundaries.
+
+    :return: lower and upper bounds (arrays)
+    """
+    import warnings
+    from numpy.lib.stride_tricks import sliding_window_view
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(codes, kind="mergesort")
+    sorted_codes = np.asarray(codes)[order]
+
+    # groups are surrounded by NaN so that windows stay within a group
+    starts = np.r_[0, np.nonzero(np.diff(sorted_codes))[0] + 1]
+    group = np.searchsorted(starts, np.arange(len(values)), side="right") - 1
+    position = np.arange(len(values)) + window * (2 * group + 1)
+    padded = np.full(len(values) + 2 * window * len(starts), np.nan)
+    padded[position] = values[order]
+
+    windows = sliding_window_view(padded, 2 * window + 1)[position - window]
+    with warnings.catch_warnings():
+        # windows without values
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(windows, axis=1)
+        mad = np.nanmedian(np.abs(windows - median[:, None]), axis=1)
+    mad = np.fmax(mad, minmad)
+
+    lower = np.empty(len(values))
+    upper = np.empty(len(values))
+    lower[order] = median - nmad * mad
+    upper[order] = median + nmad * mad
+    return lower, upper
+
+
+def get_outlier_mask(data, by=None, column="Size (bp)", method="mad",
+                     minmad=25, nmad=3, window=2, geometry=None):
+    """Return True for the rows whose value is an outlier in its group
+
+    :param data: a dataframe such as :attr:`Plate.data`
+    :param by: the groups (see module documentation)
+    :param column: the values to test
+    :param method: **mad** (median +/- nmad times the MAD of the group) or
+        **hampel** (median +/- nmad times the MAD of the neighbouring rows
+        of the group, see **window**)
+    :param minmad: minimal MAD
+    :param window: number of rows on each side for the Hampel filter
+    :return: a boolean series with the index of the data
+    """
+    values = pd.to_numeric(data[column], errors="coerce").values.astype(float)
+    codes = get_group_codes(data, by, geometry=geometry)
+    if method == "mad":
+        lower, upper = get_mad_bounds(values, codes, minmad=minmad, nmad=nmad)
+    elif method == "hampel":
+        lower, upper = get_hampel_bounds(values, codes, window=window,
+                                         minmad=minmad, nmad=nmad)
+    else:
+        raise ValueError("method must be mad or hampel (%s)" % method)
+    with np.errstate(invalid="ignore"):
+        mask = (values < lower) | (values > upper)
+    mask &= codes >= 0
+    return pd.Series(mask, index=data.index)
+
+
+def apply_mask(data, mask, keep=("Well", "Sample ID", "Rank")):
+    """Return a copy of the data where masked rows are emptied
+
+    All columns but the **keep** columns are set to None for the rows where
+    **mask** is True.
+    """
+    df = data.copy()
+    columns = [x for x in df.columns if x not in keep]
+    df.loc[np.asarray(mask), columns] = None
+    return df
+
+
+def write_views(data, mask=None, all=None, filtered=None, outliers=None,
+                keep=("Well", "Sample ID", "Rank")):
+    """Write the results, filtered results and outliers in CSV files
+
+    The data is serialised once; the rows of the filtered view are the same
+    lines except for the outliers, which are emptied (see
+    :func:`apply_mask`). The data is not modified.
+
+    :param data: the results (e.g. :attr:`Plate.data`)
+    :param mask: True for outliers (no outliers if not provided)
+    :param all: the file of all results (optional)
+    :param filtered: the file of the filtered results (optional)
+    :param outliers: the file with the outliers only (optional)
+    :param keep: the columns not emptied in the filtered view
+    """
+    if mask is None:
+        mask = np.zeros(len(data), dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    lines = data.to_csv(index=False).splitlines(True)
+    header, lines = lines[0:1], np.array(lines[1:], dtype=object)
+    if len(lines) != len(data):
+        # some values span several lines: each view is serialised
+        views = {all: data, filtered: apply_mask(data, mask, keep=keep),
+                 outliers: data[mask]}
+        for filename, df in views.items():
+            if filename is not None:
+                df.to_csv(filename, index=False)
+        return
+
+    views = {all: lines}
+    if filtered is not None:
+        views[filtered] = lines.copy()
+        if mask.any():
+            emptied = apply_mask(data[mask], np.ones(mask.sum(), dtype=bool),
+                                 keep=keep)
+            views[filtered][mask] = emptied.to_csv(index=False,
+                                                   header=False).splitlines(True)
+    views[outliers] = lines[mask]
+    for filename, rows in views.items():
+        if filename is not None:
+            with open(filename, "w") as fout:
+                fout.write("".join(header + list(rows)))
+
+
+def filterout_plates(plates, by=None, **kwargs):
+    """Filter the outliers of several plates at once
+
+    The data of all plates are concatenated so that groups (e.g. a Sample
+    ID prefix) may span several plates; use by="plate" to keep the plates
+    apart, or by="line" to filter each input file separately. The mask of
+    each plate is stored in its :attr:`masks` attribute (**outliers** key);
+    the data is not modified.
+
+    :param plates: list of analysed :class:`~fragment_analyser.plate.Plate`
+    :param kwargs: see :func:`get_outlier_mask`
+    :return: the masks of each plate
+    """
+    data = pd.concat([plate.data for plate in plates], ignore_index=True)
+    sizes = [len(plate.data) for plate in plates]
+    number = np.repeat(np.arange(len(plates)), sizes)
+    origins = np.concatenate([plate.origins for plate in plates])
+    keys = []
+    for key in (by if isinstance(by, list) else [by]):
+        if isinstance(key, str) and key == "plate":
+            keys.append(number)
+        elif isinstance(key, str) and key == "line":
+            # the input file within its plate
+            keys.extend([number, origins])
+        elif key is not None:
+            keys.append(key)
+    if "Rank" in data.columns:
+        keys.append("Rank")
+    mask = get_outlier_mask(data, by=keys or None, **kwargs).values
+    masks = []
+    for plate, start, end in zip(plates, np.cumsum([0] + sizes), np.cumsum(sizes)):
+        masks.append(pd.Series(mask[start:end], index=plate.data.index))
+        plate.masks["outliers"] = masks[-1]
+    return masks
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+"""Plate geometries (number of lines and wells per line)"""
+import string
+
+import numpy as np
+import pandas as pd
+
+
+class PlateGeometry(object):
+    """Describe the layout of a plate
+
+    A plate is made of :attr:`nlines` lines labelled with letters (A, B, C...)
+    and :attr:`nwells` wells per line labelled with numbers starting at 1. The
+    well names are therefore A1, A2, ..., B1, B2 and so on::
+
+        from fragment_analyser.geometry import PlateGeometry
+        g = PlateGeometry(16, 24)  # a 384-well plate: lines A to P
+        g.is_well_name("P24")      # True
+        g.is_well_name("Q1")       # False
+
+    The common geometries can be retrieved with :func:`get_geometry`
+    using the number of wells (96 or 384).
+    """
+    #: regular expression used to split a well name into line and column
+    pattern = r"^\s*([A-Z]{1,2})(\d+)\s*$"
+
+    def __init__(self, nlines=8, nwells=12):
+        """.. rubric:: Constructor
+
+        :param nlines: number of lines on the plate (8 for a 96-well plate)
+        :param nwells: number of wells per line (12 for a 96-well plate)
+        """
+        if nlines < 1 or nwells < 1:
+            raise ValueError("nlines and nwells must be positive integers")
+        self.nlines = int(nlines)
+        self.nwells = int(nwells)
+        self.lines = self._get_line_names(self.nlines)
+
+    def _get_line_names(self, N):
+        # A..Z then AA, AB... as used on 1536-well plates
+        letters = string.ascii_uppercase
+        names = list(letters[0:N])
+        for first in letters:
+            if len(names) >= N:
+                break
+            names += [first + x for x in letters][0:N-len(names)]
+        return names
+
+    def __len__(self):
+        return self.nlines * self.nwells
+
+    def __eq__(self, other):
+        return isinstance(other, PlateGeometry) and \
+            (self.nlines, self.nwells) == (other.nlines, other.nwells)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "PlateGeometry(nlines=%s, nwells=%s)" % (self.nlines, self.nwells)
+
+    def get_well_names(self, line=None):
+        """Return the names of all wells (of a given line if provided)"""
+        lines = self.lines if line is None else [line]
+        return [x + str(i) for x in lines for i in range(1, self.nwells+1)]
+
+    def split(self, names):
+        """Split well names into (line index, column index) arrays
+
+        Both indices start at 0. Names that are not valid for this geometry
+        get -1 in both arrays. The split is vectorised over the names.
+
+        :param names: a list or series of well names
+        :return: two arrays of integers
+        """
+        names = pd.Series(names, dtype=object).astype(str).str.upper()
+        parts = names.str.extract(self.pattern, expand=True)
+        lookup = dict((name, i) for i, name in enumerate(self.lines))
+        rows = parts[0].map(lookup).fillna(-1).values.astype(int)
+        cols = pd.to_numeric(parts[1], errors="coerce").fillna(0).values
+        cols = cols.astype(int) - 1
+        valid = (rows >= 0) & (cols >= 0) & (cols < self.nwells)
+        rows[~valid] = -1
+        cols[~valid] = -1
+        return rows, cols
+
+    def is_well_name(self, names):
+        """Return True for names that are valid well names on this plate
+
+        :param names: a single name or a list of names. In the later case,
+            an array of booleans is returned.
+        """
+        if isinstance(names, str):
+            return bool(self.split([names])[0][0] >= 0)
+        rows, _ = self.split(names)
+        return rows >= 0
+
+    def index(self, names):
+        """Return the position of the wells in the plate (row major order)
+
+        Invalid names get -1.
+        """
+        rows, cols = self.split(names)
+        return np.where(rows >= 0, rows * self.nwells + cols, -1)
+
+
+#: the standard geometries keyed by their number of wells
+geometries = {
+    96: PlateGeometry(8, 12),
+    384: PlateGeometry(16, 24),
+    1536: PlateGeometry(32, 48),
+}
+
+
+def get_geometry(geometry=None):
+    """Return a :class:`PlateGeometry` instance
+
+    :param geometry: None (default 96-well plate), the number of wells
+        (96, 384 or 1536, as an integer or a string), a tuple with the number
+        of lines and the number of wells per line (or a string such as
+        "16x24"), or a :class:`PlateGeometry` instance that is returned as is.
+    """
+    if geometry is None:
+        return geometries[96]
+    elif isinstance(geometry, PlateGeometry):
+        return geometry
+    elif isinstance(geometry, (tuple, list)):
+        nlines, nwells = geometry
+        return PlateGeometry(nlines, nwells)
+    elif isinstance(geometry, str) and "x" in geometry.lower():
+        nlines, nwells = geometry.lower().split("x")
+        return PlateGeometry(int(nlines), int(nwells))
+
+    try:
+        return geometries[int(geometry)]
+    except (KeyError, ValueError, TypeError):
+        raise ValueError("Unknown geometry %s. Use one of %s or a tuple "
+            "(nlines, nwells)" % (geometry, sorted(geometries.keys())))
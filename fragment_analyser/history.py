@@ -0,0 +1,305 @@
+#!/usr/bin/python
+"""Historical log of the runs to follow the drift of the instrument
+
+The aggregates of each analysed plate (median and MAD of the selected peaks,
+rate of empty wells, errors of the ladder and markers) are appended to a log
+stored in a directory::
+
+    from fragment_analyser import Plate
+    from fragment_analyser.history import History
+    history = History("fa_history", by="prefix:3")
+    plate = Plate(filenames, history=history)
+    plate.analyse()
+    history.trend()
+
+or from the command line::
+
+    fragment_analyser --pattern "*.csv" --history fa_history
+    fragment_analyser trend --history fa_history
+
+Each run is a row group (a NumPy archive with one array per column and one
+row per assay) that is never modified. The aggregates are computed per assay
+(**by** parameter): the whole run by default, the first N characters of the
+Sample ID with "prefix:N" or any column of the results.
+
+:meth:`History.trend` follows each metric of each assay with an
+exponentially weighted moving average (EWMA) and standard deviation. A value
+beyond **nsigma** standard deviations of the average of the previous runs
+raises an alarm. The averages are stored with the log so that only the runs
+added since the last call are read.
+"""
+import argparse
+import contextlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .cache import file_lock, get_file_hash
+
+
+class History(object):
+    """Append-only log of the aggregates of the runs
+
+    :param directory: where the log is stored (created if needed)
+    :param by: the assays: None (the whole run), "prefix:N" (first N
+        characters of the Sample ID) or the name of a column of the results
+    """
+    #: numeric columns of each row group
+    numeric = ["time", "run", "wells", "empty_rate", "median", "mad",
+               "ladder_error", "um_error"]
+    #: text columns of each row group
+    text = ["assay"]
+    #: the metrics followed by :meth:`trend`
+    metrics = ["median", "mad", "empty_rate", "ladder_error", "um_error"]
+
+    def __init__(self, directory, by=None):
+        self.directory = directory
+        self.by = by
+        if os.path.isdir(directory) is False:
+            os.makedirs(directory)
+        self._manifest = os.path.join(directory, "history.json")
+        self._read()
+
+    def _read(self):
+        if os.path.exists(self._manifest):
+            with open(self._manifest) as fin:
+                self._state = json.load(fin)
+        else:
+            self._state = {"runs": [], "trend": None}
+        self._hashes = set(run["hash"] for run in self._state["runs"])
+
+    @contextlib.contextmanager
+    def _lock(self, timeout=60):
+        # exclusive access to the log (runs may be added concurrently); the
+        # manifest is read again once the lock is acquired
+        with file_lock(os.path.join(self.directory, "history.lock"), timeout):
+            self._read()
+            yield
+
+    def __len__(self):
+        return len(self._state["runs"])
+
+    @property
+    def runs(self):
+        """The runs in the log"""
+        return pd.DataFrame(self._state["runs"],
+                            columns=["id", "name", "hash", "time"])
+
+    def _save(self):
+        with open(self._manifest + ".tmp", "w") as fout:
+            json.dump(self._state, fout, indent=1)
+        os.replace(self._manifest + ".tmp", self._manifest)
+
+    def _get_path(self, run):
+        return os.path.join(self.directory, "run-%06d.npz" % run)
+
+    def _get_assays(self, data):
+        if self.by is None:
+            return np.repeat("all", len(data)).astype(object)
+        if self.by.startswith("prefix:"):
+            keys = data["Sample ID"].astype(str).str[0:int(self.by.split(":")[1])]
+        elif self.by in data.columns:
+            keys = data[self.by].astype(str)
+        else:
+            raise ValueError("Unknown assay column %s" % self.by)
+        return keys.values.astype(object)
+
+    def get_aggregates(self, plate):
+        """Return the aggregates of an analysed plate
+
+        Ladders are not included in the assays. Only the best peak of each
+        well is used when several peaks are reported. The ladder and marker
+        errors are computed from the files analysed by the plate: files whose
+        results were read from the cache or the journal are not read again.
+
+        :return: a dictionary of arrays (see :attr:`numeric` and
+            :attr:`text`) with one value per assay
+        """
+        data = plate.data
+        if "Rank" in data.columns:
+            data = data[data["Rank"] == 1]
+        data = data[data["Sample ID"].astype(str).str.lower() != "ladder"]
+        sizes = pd.to_numeric(data["Size (bp)"], errors="coerce").values
+
+        assays = self._get_assays(data)
+        labels, names = pd.factorize(assays)
+        groups = pd.Series(sizes).groupby(labels)
+        median = groups.median()
+        deviations = np.abs(sizes - median.reindex(labels).values)
+        mad = pd.Series(deviations).groupby(labels).median()
+        wells = groups.size()
+        empty = pd.Series(np.isnan(sizes)).groupby(labels).mean()
+
+        qc = plate.get_sizing_qc(cached=False)
+        if len(qc):
+            ladder_error = np.nanmedian(qc["Ladder error (%)"].values) \
+                if qc["Ladder error (%)"].notnull().any() else np.nan
+            um_error = np.nanmedian(qc["UM error (bp)"].values) \
+                if qc["UM error (bp)"].notnull().any() else np.nan
+        else:
+            ladder_error, um_error = np.nan, np.nan
+
+        index = np.arange(len(names))
+        return {"assay": np.array(names, dtype=object),
+                "wells": wells.reindex(index).values,
+                "empty_rate": empty.reindex(index).values,
+                "median": median.reindex(index).values,
+                "mad": mad.reindex(index).values,
+                "ladder_error": np.repeat(ladder_error, len(names)),
+                "um_error": np.repeat(um_error, len(names))}
+
+    def add_plate(self, plate, name=None):
+        """Append the aggregates of an analysed plate
+
+        A plate made of the same files (identified by their content) as a
+        run of the log is ignored.
+
+        :param name: name of the run (default to the first input file)
+        :return: the identifier of the run or None
+        """
+        filenames = [x for x in plate.filenames if isinstance(x, str)]
+        digest = "-".join(sorted(get_file_hash(x) for x in filenames))
+        if digest in self._hashes or len(plate.data) == 0:
+            return None
+        arrays = self.get_aggregates(plate)
+        with self._lock():
+            if digest in self._hashes:
+                return None
+            run = len(self._state["runs"])
+            now = time.time()
+            arrays["time"] = np.repeat(now, len(arrays["assay"]))
+            arrays["run"] = np.repeat(run, len(arrays["assay"]))
+            columns = dict((key, arrays[key].astype(float))
+                           for key in self.numeric)
+            columns.update((key, arrays[key].astype(str)) for key in self.text)
+            with open(self._get_path(run), "wb") as fout:
+                np.savez(fout, **columns)
+
+            if name is None:
+                name = os.path.basename(filenames[0]) if filenames else str(run)
+            self._state["runs"].append({"id": run, "name": name,
+                                        "hash": digest, "time": now})
+            self._hashes.add(digest)
+            self._save()
+        return run
+
+    def _load(self, run):
+        with np.load(self._get_path(run)) as data:
+            return dict((key, data[key]) for key in self.numeric + self.text)
+
+    def get_data(self, start=0):
+        """Return the aggregates of the runs (from run **start**)
+
+        :return: a dataframe with one row per run and assay
+        """
+        frames = [pd.DataFrame(self._load(run["id"]))
+                  for run in self._state["runs"][start:]]
+        if len(frames) == 0:
+            return pd.DataFrame(columns=self.numeric + self.text)
+        df = pd.concat(frames, ignore_index=True)
+        df["run"] = df["run"].astype(int)
+        return df
+
+    def trend(self, alpha=0.3, nsigma=3, warmup=3, recompute=False):
+        """Update the moving averages with the runs added since the last call
+
+        :param alpha: weight of a new run in the averages
+        :param nsigma: a value beyond nsigma standard deviations of the
+            average raises an alarm
+        :param warmup: number of runs of an assay before alarms are raised
+        :param recompute: start again from the first run. This is also the
+            case if the parameters differ from the previous call.
+        :return: a dataframe with one row per new run, assay and metric with
+            the value, the average and standard deviation of the previous
+            runs and the **Alarm** flag
+        """
+        with self._lock():
+            rows = self._update_trend(alpha, nsigma, warmup, recompute)
+
+        df = pd.DataFrame(rows, columns=["Run", "Name", "Time", "Assay",
+                                         "Metric", "Value", "EWMA", "Std",
+                                         "Alarm"])
+        df["Time"] = pd.to_datetime(df["Time"], unit="s")
+        return df
+
+    def _update_trend(self, alpha, nsigma, warmup, recompute):
+        # the rows of the new runs; the averages are saved in the manifest
+        parameters = [alpha, nsigma, warmup]
+        state = self._state.get("trend")
+        if recompute or state is None or state["parameters"] != parameters:
+            state = {"parameters": parameters, "runs": 0, "averages": {}}
+
+        data = self.get_data(state["runs"])
+        averages = state["averages"]
+        rows = []
+        names = dict((run["id"], run["name"]) for run in self._state["runs"])
+        for record in data.to_dict("records"):
+            assay = averages.setdefault(record["assay"], {})
+            for metric in self.metrics:
+                value = record[metric]
+                if np.isnan(value):
+                    continue
+                mean, var, count = assay.get(metric, [value, 0., 0])
+                std = np.sqrt(var)
+                alarm = bool(count >= warmup and abs(value - mean) > nsigma * std)
+                rows.append([record["run"], names[record["run"]], record["time"],
+                             record["assay"], metric, value, mean, std, alarm])
+                # exponentially weighted mean and variance
+                diff = value - mean
+                mean += alpha * diff
+                var = (1 - alpha) * (var + alpha * diff ** 2)
+                assay[metric] = [mean, var, count + 1]
+        state["runs"] = len(self._state["runs"])
+        self._state["trend"] = state
+        self._save()
+        return rows
+
+
+class Options(argparse.ArgumentParser):
+    def __init__(self, prog="fragment_analyser trend"):
+        usage = """
+
+    fragment_analyser trend --history fa_history
+    fragment_analyser trend --history fa_history --recompute --alarms
+        """
+        super(Options, self).__init__(usage=usage, prog=prog,
+            description="""Follow the drift of the runs logged with --history.
+Only the runs added since the previous call are reported (see --recompute)""",
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument("--history", required=True, type=str,
+                          help="Directory of the log")
+        self.add_argument("--alpha", default=0.3, type=float,
+                          help="Weight of a new run in the moving averages")
+        self.add_argument("--nsigma", default=3, type=float,
+                          help="""Alarm if a value is beyond nsigma standard
+deviations of the moving average""")
+        self.add_argument("--warmup", default=3, type=int,
+                          help="Number of runs of an assay before alarms")
+        self.add_argument("--recompute", action="store_true",
+                          help="Report all runs from the first one")
+        self.add_argument("--alarms", action="store_true",
+                          help="Only report the alarms")
+        self.add_argument("-o", "--output", default=None, type=str,
+                          help="Save the trend in a CSV file instead of printing it")
+
+
+def main(args):
+    """Entry point of ``fragment_analyser trend``"""
+    options = Options().parse_args(args[1:])
+    if os.path.isdir(options.history) is False:
+        raise IOError("History %s not found" % options.history)
+    df = History(options.history).trend(alpha=options.alpha,
+                                        nsigma=options.nsigma,
+                                        warmup=options.warmup,
+                                        recompute=options.recompute)
+    if options.alarms:
+        df = df[df["Alarm"]]
+    if options.output:
+        df.to_csv(options.output, index=False)
+    elif len(df) == 0:
+        print("No new runs")
+    else:
+        print(df.to_string(index=False))
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+"""Journal of the files analysed by a long run
+
+A :class:`Journal` records each file as soon as it is analysed so that a run
+killed midway (crash, preemption on a cluster) continues from the last
+completed file::
+
+    from fragment_analyser import Plate
+    from fragment_analyser.journal import Journal
+    plate = Plate(filenames, journal=Journal("fa_journal"))
+    plate.analyse()
+
+or from the command line::
+
+    fragment_analyser --pattern "*.csv" --resume
+
+The journal is a directory with an append-only file (**journal.jsonl**, one
+JSON document per completed file with its hash, the parameters of the
+analysis and the location of its results) and the results of each file
+(stored as in :class:`~fragment_analyser.cache.ResultCache`).
+"""
+import json
+import os
+import shutil
+import time
+
+from .cache import ResultCache, get_file_hash
+
+
+class Journal(object):
+    """Append-only record of the analysed files
+
+    :param directory: where the journal is stored (created if needed)
+    :param resume: if False, a previous journal in the directory is removed
+        (only its files: a directory that is not empty and has no journal is
+        refused)
+    """
+    def __init__(self, directory=".fa_journal", resume=True):
+        self.directory = directory
+        self.filename = os.path.join(directory, "journal.jsonl")
+        if resume is False and os.path.isdir(directory):
+            self._clear()
+        self.results = ResultCache(os.path.join(directory, "rows"))
+        self.entries = {}
+        self.images = {}
+        if os.path.exists(self.filename):
+            self._read()
+        else:
+            # marks the directory as a journal
+            open(self.filename, "a").close()
+
+    def _clear(self):
+        # remove the files of a previous journal and nothing else
+        if not os.path.exists(self.filename):
+            if os.listdir(self.directory):
+                raise ValueError("%s is not empty and does not contain a "
+                                 "journal" % self.directory)
+            return
+        os.remove(self.filename)
+        rows = os.path.join(self.directory, "rows")
+        if os.path.isdir(rows):
+            shutil.rmtree(rows)
+
+    def _read(self):
+        with open(self.filename, "rb+") as fin:
+            data = fin.read()
+            # the last line may be truncated if the run was killed; it is
+            # removed so that new entries start on a new line
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                fin.truncate(end)
+        for line in data[:end].decode("utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "image" in entry:
+                self.images[entry["key"]] = entry["image"]
+            else:
+                self.entries[entry["key"]] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def _append(self, entry):
+        with open(self.filename, "a") as fout:
+            fout.write(json.dumps(entry) + "\n")
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    def get_rows(self, key):
+        """Return the results of a completed file or None"""
+        if key not in self.entries:
+            return None
+        return self.results.get_rows(key)
+
+    def add(self, filename, key, rows, parameters=None):
+        """Record the results of a file
+
+        The results are saved before the entry is appended so that the
+        entries of the journal always point to complete results.
+        """
+        self.results.set_rows(key, rows)
+        entry = {"key": key, "filename": filename,
+                 "hash": get_file_hash(filename),
+                 "parameters": parameters or {},
+                 "rows": os.path.relpath(self.results._get_path(key, ".pkl"),
+                                         self.directory),
+                 "time": time.time()}
+        self._append(entry)
+        self.entries[key] = entry
+
+    def get_image(self, key):
+        """Return the image created for a file (if it still exists) or None"""
+        image = self.images.get(key)
+        if image and os.path.exists(image):
+            return image
+        return None
+
+    def add_image(self, key, image):
+        """Record the image created for a file"""
+        image = os.path.abspath(image)
+        self._append({"key": key, "image": image})
+        self.images[key] = image
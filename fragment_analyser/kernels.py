@@ -0,0 +1,264 @@
+#!/usr/bin/python
+"""Kernels of the peak selection over many wells
+
+The peaks of the wells are stored in flat arrays; the peaks of well i are
+the items offsets[i] to offsets[i + 1] (see :func:`flatten_wells`)::
+
+    from fragment_analyser import Line, fa_data
+    from fragment_analyser.kernels import flatten_wells, segmented_argmax
+    line = Line(fa_data("alternate/peaktable.csv"))
+    line.set_guess()
+    sizes, values, offsets = flatten_wells(line.wells)
+    guesses = [well.guess for well in line.wells]
+    sigmas = [well.sigma for well in line.wells]
+    positions = segmented_argmax(sizes, values, offsets, guesses, sigmas)
+
+If `numba <https://numba.pydata.org>`_ is installed, the kernels are
+compiled on first use; otherwise, a NumPy implementation that gives the same
+results is used. The speedup is measured with::
+
+    python -m fragment_analyser.kernels
+
+"""
+import time
+
+import numpy as np
+
+try:
+    import numba
+except ImportError: # optional dependency
+    numba = None
+
+
+def flatten_wells(wells, column="RFU"):
+    """Return the sizes and values of the peaks of all wells as flat arrays
+
+    :param wells: list of :class:`~fragment_analyser.well.Well`
+    :param column: the values to return (e.g. RFU or % (Conc.))
+    :return: sizes, values and offsets (the peaks of well i are in
+        [offsets[i], offsets[i + 1]])
+    """
+    lengths = [len(well.df) for well in wells]
+    offsets = np.zeros(len(wells) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    sizes = np.full(offsets[-1], np.nan)
+    values = np.full(offsets[-1], np.nan)
+    for i, well in enumerate(wells):
+        if lengths[i]:
+            sizes[offsets[i]:offsets[i + 1]] = well.df["Size (bp)"].astype(float).values
+            values[offsets[i]:offsets[i + 1]] = well.df[column].astype(float).values
+    return sizes, values, offsets
+
+
+def _get_segments(offsets):
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def _argmax_numpy(sizes, values, offsets, guesses, sigmas):
+    segments = _get_segments(offsets)
+    guesses = guesses[segments]
+    weights = np.exp(-0.5 * ((guesses - sizes) / sigmas[segments]) ** 2)
+    scores = np.where(np.isnan(guesses), values, values * weights)
+    scores[np.isnan(sizes) | np.isnan(scores)] = -np.inf
+
+    # the best score of each segment comes first (the first one if tied)
+    order = np.lexsort((np.arange(len(scores)), -scores, segments))
+    positions = np.full(len(offsets) - 1, -1, dtype=np.int64)
+    filled = np.diff(offsets) > 0
+    best = order[offsets[:-1][filled]]
+    positions[filled] = np.where(scores[best] > -np.inf,
+                                 best - offsets[:-1][filled], -1)
+    return positions
+
+
+def _median_numpy(values, offsets):
+    segments = _get_segments(offsets)
+    # missing values are sorted last in each segment
+    order = np.lexsort((values, segments))
+    values = values[order]
+    counts = np.bincount(segments[~np.isnan(values)], minlength=len(offsets) - 1)
+    found = counts > 0
+    lower = offsets[:-1] + np.maximum(counts - 1, 0) // 2
+    upper = offsets[:-1] + counts // 2
+    median = np.full(len(counts), np.nan)
+    median[found] = (values[lower[found]] + values[upper[found]]) / 2.
+    return median
+
+
+def _mad_numpy(values, offsets):
+    median = _median_numpy(values, offsets)
+    deviations = np.abs(values - median[_get_segments(offsets)])
+    return median, _median_numpy(deviations, offsets)
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _argmax_numba(sizes, values, offsets, guesses, sigmas):
+        positions = np.full(len(offsets) - 1, -1, dtype=np.int64)
+        for i in range(len(offsets) - 1):
+            best = -np.inf
+            for j in range(offsets[i], offsets[i + 1]):
+                score = values[j]
+                if np.isnan(sizes[j]) or np.isnan(score):
+                    continue
+                if not np.isnan(guesses[i]):
+                    score = score * np.exp(-0.5 * ((guesses[i] - sizes[j]) /
+                                                   sigmas[i]) ** 2)
+                if score > best:
+                    best = score
+                    positions[i] = j - offsets[i]
+        return positions
+
+    @numba.njit(cache=True)
+    def _median_numba(values, offsets):
+        median = np.full(len(offsets) - 1, np.nan)
+        for i in range(len(offsets) - 1):
+            segment = values[offsets[i]:offsets[i + 1]]
+            segment = segment[~np.isnan(segment)]
+            if len(segment):
+                segment = np.sort(segment)
+                n = len(segment)
+                median[i] = (segment[(n - 1) // 2] + segment[n // 2]) / 2.
+        return median
+
+    @numba.njit(cache=True)
+    def _mad_numba(values, offsets):
+        median = _median_numba(values, offsets)
+        deviations = np.empty(len(values))
+        for i in range(len(offsets) - 1):
+            for j in range(offsets[i], offsets[i + 1]):
+                deviations[j] = abs(values[j] - median[i])
+        return median, _median_numba(deviations, offsets)
+
+
+def _use_numba(use_numba):
+    if use_numba is None:
+        return numba is not None
+    if use_numba and numba is None:
+        raise ImportError("numba is not installed")
+    return use_numba
+
+
+def segmented_argmax(sizes, values, offsets, guesses, sigmas, use_numba=None):
+    """Return the position of the best peak of each well
+
+    The values of a well are weighted by a gaussian centered on its guess
+    (no weight if the guess is None or NaN) as in
+    :meth:`Well.get_peak_and_index`. Peaks with a missing size or value are
+    ignored.
+
+    :param sizes: flat array of sizes (see :func:`flatten_wells`)
+    :param values: flat array of values
+    :param offsets: the offsets of the wells
+    :param guesses: the guess of each well
+    :param sigmas: the sigma of each well
+    :param use_numba: use the compiled kernel (default if numba is installed)
+    :return: the position of the best peak within each well (-1 if none)
+    """
+    guesses = np.array([np.nan if x is None else x for x in guesses], dtype=float)
+    sigmas = np.asarray(sigmas, dtype=float)
+    args = (np.asarray(sizes, dtype=float), np.asarray(values, dtype=float),
+            np.asarray(offsets, dtype=np.int64), guesses, sigmas)
+    if _use_numba(use_numba):
+        return _argmax_numba(*args)
+    return _argmax_numpy(*args)
+
+
+def segmented_median(values, offsets, use_numba=None):
+    """Return the median of each segment (NaN are ignored)
+
+    :return: array of medians (NaN for segments without values)
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if _use_numba(use_numba):
+        return _median_numba(values, offsets)
+    return _median_numpy(values, offsets)
+
+
+def segmented_mad(values, offsets, use_numba=None):
+    """Return the median and median absolute deviation of each segment
+
+    :return: median and MAD arrays (NaN for segments without values)
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if _use_numba(use_numba):
+        return _mad_numba(values, offsets)
+    return _mad_numpy(values, offsets)
+
+
+def get_group_statistics(values, codes, use_numba=None):
+    """Return the median and MAD of the group of each value
+
+    :param values: array of values (NaN are ignored)
+    :param codes: the group of each value
+    :return: median and MAD arrays (one value per item of **values**)
+    """
+    values = np.asarray(values, dtype=float)
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind="mergesort")
+    labels = np.zeros(len(codes), dtype=np.int64)
+    labels[order[1:]] = np.cumsum(codes[order][1:] != codes[order][:-1])
+    offsets = np.r_[0, np.cumsum(np.bincount(labels))] if len(codes) else [0]
+    median, mad = segmented_mad(values[order], offsets, use_numba=use_numba)
+    return median[labels], mad[labels]
+
+
+def benchmark(nwells=96 * 20, npeaks=15, repeat=3):
+    """Compare the kernels with the loops over the wells
+
+    :param nwells: number of wells (96 wells per plate)
+    :param npeaks: number of peaks per well
+    :return: dictionary with the best time (seconds) of each method
+    """
+    import pandas as pd
+    from .tools import nonemedian
+
+    rng = np.random.RandomState(0)
+    sizes = rng.uniform(120, 6000, nwells * npeaks)
+    values = rng.uniform(0, 1000, nwells * npeaks)
+    offsets = np.arange(0, nwells * npeaks + 1, npeaks)
+    guesses = rng.uniform(300, 900, nwells)
+    sigmas = np.full(nwells, 50.)
+    frames = [pd.DataFrame({"Size (bp)": sizes[i:j], "RFU": values[i:j]})
+              for i, j in zip(offsets[:-1], offsets[1:])]
+
+    def loop_argmax():
+        for df, guess, sigma in zip(frames, guesses, sigmas):
+            data = df["RFU"].astype(float)
+            weights = np.exp(-0.5 * ((guess - df["Size (bp)"].values) / sigma) ** 2)
+            (data * weights).idxmax()
+
+    def loop_median():
+        for df in frames:
+            peaks = df["Size (bp)"].values
+            nonemedian(abs(peaks - nonemedian(peaks)))
+
+    methods = {
+        "argmax (loop)": loop_argmax,
+        "argmax (numpy)": lambda: segmented_argmax(sizes, values, offsets,
+                                                   guesses, sigmas, False),
+        "median/MAD (loop)": loop_median,
+        "median/MAD (numpy)": lambda: segmented_mad(sizes, offsets, False)}
+    if numba is not None:
+        methods["argmax (numba)"] = lambda: segmented_argmax(
+            sizes, values, offsets, guesses, sigmas, True)
+        methods["median/MAD (numba)"] = lambda: segmented_mad(sizes, offsets, True)
+
+    timings = {}
+    for name, method in methods.items():
+        method() # compilation
+        best = None
+        for _ in range(repeat):
+            t0 = time.time()
+            method()
+            elapsed = time.time() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    return timings
+
+
+if __name__ == "__main__":
+    for name, elapsed in sorted(benchmark().items()):
+        print("%-20s %.5f s" % (name, elapsed))
@@ -1,12 +1,10 @@
 #!/usr/bin/python
 
 import numpy as np
+import pandas as pd
 
 from .tools import nonemedian
 
-# Used to avoid issue with missing DISPLAY on the cluster.
-import pylab
-
 from .peaktable import PeakTableReader
 
 
@@ -14,26 +12,33 @@ class Line(object):
     """Class dedicated to a Line
 
 
-    A line has 12 :class:`~fragment_analyser.well.Well`.
+    A line has 12 :class:`~fragment_analyser.well.Well` on a 96-well plate
+    and 24 on a 384-well plate (see the **geometry** parameter).
 
     Used by :class:`~fragment_analyser.plate.Plate`
     """
     def __init__(self, filename, sigma=50, lower_bound=120, upper_bound=6000,
-                 control="Ladder", peak_mode="max"):
+                 control="Ladder", peak_mode="max", geometry=None):
         """.. rubric:: constructor
 
         :param  peak_mode: if set to max, the peak is found based on the max
             height and the guessed peak based on median maximum across all wells. 
             if set to "concentration", the column "(% Conc)" is used to find the
             peak based on the max concentration irrespetive of other wells.
-
+            Other strategies (closest, area, molarity or a
+            :class:`~fragment_analyser.strategies.Strategy` instance) are
+            described in :mod:`~fragment_analyser.strategies`.
+        :param geometry: the plate geometry (default to 96-well plates). See
+            :func:`~fragment_analyser.geometry.get_geometry`.
 
         """
 
         self.number = None
+        self.filename = filename
 
         ptr = PeakTableReader(filename, sigma=sigma, lower_bound=lower_bound,
-                              upper_bound=upper_bound)
+                              upper_bound=upper_bound, geometry=geometry)
+        self.geometry = ptr.geometry
         self._nwells = ptr._nwells
         self.wells = ptr.wells
         self.peak_mode = peak_mode
@@ -58,21 +63,139 @@ class Line(object):
         for well in self.wells:
             well.guess = guess
 
-    def get_peaks(self):
-        """Return list of max peaks in the N wells"""
-        if self.peak_mode == "max":
-            peaks = [well.get_peak() for well in self.wells]
-        else:
-            peaks = [well.get_most_concentrated_peak() for well in self.wells]
-            # we want the maximum; some peak are set to None 
-            peaks = [x[0] if x else x for x in peaks]
+    def get_peaks(self, top_k=None, guesses=None):
+        """Return list of max peaks in the N wells
+
+        :param top_k: if set, return the **top_k** best peaks of each well
+            (a list per well, None for missing peaks) instead of the best one
+        :param guesses: list of expected positions, one per product in the
+            wells. The best peak around each guess is returned (a list per
+            well). See :func:`~fragment_analyser.batch.get_top_peaks`.
+        """
+        if top_k is not None or guesses is not None:
+            positions, indices = self._get_top_peaks(top_k, guesses)
+            return [[None if np.isnan(x) else float(x) for x in row]
+                    for row in positions]
+        # the peaks of all wells are selected at once by the strategy
+        peaks = []
+        for well, index in zip(self.wells, self.strategy.get_indices(self.wells)):
+            peak = None if index is None else well.df['Size (bp)'].loc[index]
+            # some peak are set to None (e.g. ladder)
+            peaks.append(None if peak is None or peak != peak else float(peak))
         return peaks
 
+    @property
+    def strategy(self):
+        """The :class:`~fragment_analyser.strategies.Strategy` of
+        :attr:`peak_mode`"""
+        from .strategies import get_strategy
+        return get_strategy(self.peak_mode)
+
+    def _get_top_peaks(self, top_k, guesses):
+        from .batch import get_top_peaks
+        return get_top_peaks(self.wells, k=top_k or 1, guesses=guesses,
+                             strategy=self.strategy)
+
+    def get_selected_peaks(self, top_k=None, guesses=None):
+        """Return a dataframe with the selected peak of each well
+
+        The peak is selected according to :attr:`peak_mode`. Wells without
+        valid peak are reported with their name and sample ID only.
+
+        :param top_k: if set, up to **top_k** peaks are reported for each
+            well (one row each) with their rank in an additional **Rank**
+            column (1 for the best peak)
+        :param guesses: list of expected positions, one per product. The best
+            peak around each guess is reported; **Rank** is the index of the
+            guess (starting at 1).
+        """
+        if top_k is not None or guesses is not None:
+            return self._get_top_selected_peaks(top_k, guesses)
+        data = []
+        indices = self.strategy.get_indices(self.wells)
+        for well, index in zip(self.wells, indices):
+            if index is not None:
+                data.append(well.df.ix[index])
+            else:
+                # If no peak detected, create a line with well name and ID
+                # but no data
+                df = well.df.copy()
+                N = len(df.columns)
+                df.ix[0] = [well.name, well.well_ID] + [None] * (N-2)
+                data.append(df.ix[0])
+        return pd.DataFrame(data)
+
+    def _get_top_selected_peaks(self, top_k, guesses):
+        positions, indices = self._get_top_peaks(top_k, guesses)
+        frames = []
+        for well, row in zip(self.wells, indices):
+            ranks = [i + 1 for i, index in enumerate(row) if index is not None]
+            if ranks:
+                df = well.df.loc[[row[i - 1] for i in ranks]].copy()
+                df.insert(2, "Rank", ranks)
+            else:
+                df = well.df.iloc[0:0].copy()
+                df.insert(2, "Rank", [])
+                df.loc[0] = [well.name, well.well_ID] + [None] * (len(df.columns) - 2)
+            frames.append(df)
+        return pd.concat(frames)
+
+    def get_confidence(self, sigma_factors=(0.5, 1, 2), guess=None):
+        """Return the confidence of the peak selected in each well
+
+        See :func:`~fragment_analyser.confidence.get_confidence`.
+
+        :param guess: the position of the product of rank 1 when several
+            products are expected
+        :return: a dataframe indexed by the well names
+        """
+        from .confidence import get_confidence
+        return get_confidence(self.wells, peak_mode=self.peak_mode,
+                              sigma_factors=sigma_factors, guess=guess)
+
+    def get_sizing_qc(self):
+        """Return the sizing metrics of each well (markers and ladder)
+
+        See :func:`~fragment_analyser.sizing.get_sizing_qc`.
+
+        :return: a dataframe indexed by the well names
+        """
+        from .sizing import get_sizing_qc
+        return get_sizing_qc(self.wells)
+
+    def recalibrate(self):
+        """Correct the sizes of the peaks of each well using its markers
+
+        Must be called before the guess is set (see :meth:`set_guess`). See
+        :func:`~fragment_analyser.sizing.recalibrate`.
+
+        :return: slope and offset of the correction of each well
+        """
+        from .sizing import recalibrate
+        self._regions = None
+        return recalibrate(self.wells)
+
+    def integrate(self, windows):
+        """Sum the concentrations and molarities within windows for all wells
+
+        Sizes and cumulative sums are computed once (see
+        :class:`~fragment_analyser.regions.RegionIndex`) so that any set of
+        windows is then answered by binary search.
+
+        :param windows: a window (lower, upper) in bp, a list of windows or a
+            dictionary of named windows. Bounds are inclusive.
+        :return: a dataframe with one row per well and window
+        """
+        from .regions import RegionIndex
+        if getattr(self, "_regions", None) is None:
+            self._regions = RegionIndex(self.wells)
+        return self._regions.integrate(windows)
+
     def get_well_names(self):
         """Return the names of all wells"""
         return [well.well_ID for well in self.wells]
 
-    def diagnostic(self, ymax=None):
+    def diagnostic(self, ymax=None, ax=None, legend=True):
         """Shows detected peaks for each well and confidence.
 
 
@@ -100,21 +223,33 @@ class Line(object):
             l = Line(fa_data('standard_mix_cases/peak_table.csv'))
             l.diagnostic()
 
+        :param ax: the matplotlib axes to draw on. If not provided, the
+            current pylab figure is cleared and used. Provide axes of a
+            figure created without pylab (e.g. :class:`matplotlib.figure.Figure`)
+            to draw lines from several threads.
+        :param legend: show the legend
+        :return: the axes
         """
+        if ax is None:
+            # Used to avoid issue with missing DISPLAY on the cluster.
+            import pylab
+            pylab.clf()
+            ax = pylab.gca()
+
         peaks = self.get_peaks()
         names = [well.name for well in self.wells]
 
-        pylab.clf()
-        pylab.plot(peaks, 'o-', mfc='red', label="selected peak")
-        pylab.axhline(self.guess_peak(), linestyle='--', lw=2, color='k', label='median')
-        pylab.grid(True)
-        pylab.xlabel('Wells\' names')
-        pylab.ylabel('Size bp')
-        pylab.xticks(range(0, self._nwells-1), names)
-        pylab.ylim([0, pylab.ylim()[1]*1.4])
-        pylab.xlim([-0.5, 10.5])
+        ax.plot(peaks, 'o-', mfc='red', label="selected peak")
+        ax.axhline(self.guess_peak(), linestyle='--', lw=2, color='k', label='median')
+        ax.grid(True)
+        ax.set_xlabel('Wells\' names')
+        ax.set_ylabel('Size bp')
+        ax.set_xticks(range(0, self._nwells))
+        ax.set_xticklabels(names)
+        ax.set_ylim([0, ax.get_ylim()[1]*1.4])
+        ax.set_xlim([-0.5, self._nwells - 0.5])
 
-        peaks = pylab.array(self.get_peaks())
+        peaks = np.array(self.get_peaks())
 
         # sigma is biased the presence of outliers, so we better off using the MAD
         sigma = self.get_mad()
@@ -146,12 +281,12 @@ class Line(object):
                 X = np.array(X)
                 Y = np.array(Y)
 
-                pylab.fill_between(X, nanadd(Y, -sigma * 3), nanadd(Y, sigma * 3),
-                                   color='red', alpha=0.5)
-                pylab.fill_between(X, nanadd(Y, -sigma * 2), nanadd(Y, sigma * 2),
-                               color='orange', alpha=0.5)
-                pylab.fill_between(X, nanadd(Y, -sigma), nanadd(Y, sigma),
-                               color='green', alpha=0.5)
+                ax.fill_between(X, nanadd(Y, -sigma * 3), nanadd(Y, sigma * 3),
+                                color='red', alpha=0.5)
+                ax.fill_between(X, nanadd(Y, -sigma * 2), nanadd(Y, sigma * 2),
+                                color='orange', alpha=0.5)
+                ax.fill_between(X, nanadd(Y, -sigma), nanadd(Y, sigma),
+                                color='green', alpha=0.5)
                 X = []
                 Y = []
             else:
@@ -159,7 +294,9 @@ class Line(object):
                 X.append(i)
                 Y.append(peak)
 
-        pylab.legend()
+        if legend:
+            ax.legend()
+        return ax
 
     def get_mad(self, minimum=25):
         # The crux of the problem is that the standard deviation is based on squared distances, 
@@ -167,7 +304,7 @@ class Line(object):
         # A good candidate is the median absolute deviation from median, commonly shortened to 
         # the median absolute deviation (MAD). It is the median of the set comprising the absolute 
         #values of the differences between the median and each data point
-        peaks = pylab.array(self.get_peaks())
+        peaks = np.array(self.get_peaks())
 
         # we may have None in the list of peaks
         peaks = [x for x in peaks if x is not None]
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+"""Overview of all lines of plates in a single figure
+
+The diagnostic of each line (see :meth:`Line.diagnostic`) is drawn in one
+panel of a single figure with shared axes, which is rendered once::
+
+    from fragment_analyser import Plate, fa_data
+    plate = Plate([fa_data("examples/test_input_well_A.csv"),
+                   fa_data("examples/test_input_well_B.csv")])
+    plate.analyse()
+    plate.montage("montage.png")
+
+or from the command line (per-line images may be disabled with
+--no-images)::
+
+    fragment_analyser --pattern "*.csv" --montage montage.png --no-images
+
+"""
+import math
+import os
+
+import numpy as np
+
+
+def get_panels(plates):
+    """Return (title, line) for each line of a plate or list of plates
+
+    Lines whose results were read from a cache or a journal are read again.
+    """
+    if hasattr(plates, "sources"):
+        plates = [plates]
+    panels = []
+    for plate in plates:
+        for source, line in plate.sources:
+            if line is None:
+                line = plate.get_line(source)
+            panels.append((os.path.basename(str(source)), line))
+    return panels
+
+
+def plot_montage(plates, filename=None, ncols=2, width=7, height=2.5,
+                 dpi=100):
+    """Draw the diagnostic of all lines of plates in a single figure
+
+    Panels share the same axes: the x-axis shows the well number and the
+    y-axis the size of the selected peaks.
+
+    :param plates: a :class:`~fragment_analyser.plate.Plate` or a list of
+        plates
+    :param filename: save the figure in this file (format given by the
+        extension, e.g. png or svg)
+    :param ncols: number of panels per row
+    :param width: width of a panel (inches)
+    :param height: height of a panel (inches)
+    :return: the :class:`matplotlib.figure.Figure`
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    panels = get_panels(plates)
+    ncols = max(1, min(ncols, len(panels)))
+    nrows = max(1, int(math.ceil(len(panels) / float(ncols))))
+    fig = Figure(figsize=(width * ncols, height * nrows))
+    canvas = FigureCanvasAgg(fig)
+    if len(panels) == 0:
+        fig.text(0.5, 0.5, "No data", ha="center")
+    else:
+        axes = fig.subplots(nrows, ncols, sharex=True, sharey=True,
+                            squeeze=False).ravel()
+        ymax, nwells = 0, 1
+        for i, (title, line) in enumerate(panels):
+            ax = axes[i]
+            line.diagnostic(ax=ax, legend=i == 0)
+            ax.set_title(title, fontsize="small")
+            nwells = max(nwells, line._nwells)
+            peaks = np.array([np.nan if x is None else x
+                              for x in line.get_peaks()], dtype=float)
+            if not np.isnan(peaks).all():
+                ymax = max(ymax, np.nanmax(peaks) + 3 * line.get_mad())
+            if i % ncols:
+                ax.set_ylabel("")
+            if i < len(panels) - ncols:
+                ax.set_xlabel("")
+            else:
+                # last panel of its column
+                ax.xaxis.set_tick_params(labelbottom=True)
+        for ax in axes[len(panels):]:
+            ax.set_visible(False)
+
+        # the axes are shared: the ticks are the well numbers
+        axes[0].set_xticks(range(nwells))
+        axes[0].set_xticklabels([str(x + 1) for x in range(nwells)])
+        axes[0].set_xlim([-0.5, nwells - 0.5])
+        axes[0].set_ylim([0, (ymax or 1) * 1.2])
+        for ax in axes[0:len(panels)]:
+            ax.set_xlabel("Well number" if ax.get_xlabel() else "")
+        fig.tight_layout()
+
+    if filename is not None:
+        canvas.print_figure(filename, dpi=dpi)
+    return fig
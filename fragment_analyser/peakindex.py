@@ -0,0 +1,268 @@
+#!/usr/bin/python
+"""Persistent index of peaks across runs
+
+The peaks of all analysed files are appended to an index stored in a
+directory so that size ranges can be queried without reading the results
+again::
+
+    from fragment_analyser import Plate
+    from fragment_analyser.peakindex import PeakIndex
+    index = PeakIndex("peaks_index")
+    plate = Plate(filenames, index=index)
+    plate.analyse()
+    index.query(540, 620)
+
+or from the command line::
+
+    fragment_analyser --pattern "*.csv" --index peaks_index
+    fragment_analyser query --index peaks_index --range 540 620
+
+Each addition creates a segment made of NumPy arrays sorted by size. Queries
+memory-map the arrays and use a binary search in each segment. Segments
+are merged when there are more than :attr:`PeakIndex.max_segments`.
+Additions take a lock on the directory so that several runs (e.g. array jobs
+with --shard) can share an index.
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .cache import file_lock, get_file_hash
+
+
+class PeakIndex(object):
+    """Sorted-array index of the peaks of many runs
+
+    :param directory: where the index is stored (created if needed)
+    :param max_segments: segments are merged beyond this number
+    """
+    #: numeric arrays stored in each segment
+    numeric = ["size", "rfu", "conc", "molarity", "run"]
+    #: text arrays stored in each segment
+    text = ["well", "sample"]
+
+    def __init__(self, directory, max_segments=16):
+        self.directory = directory
+        self.max_segments = max_segments
+        if os.path.isdir(directory) is False:
+            os.makedirs(directory)
+        self._manifest = os.path.join(directory, "index.json")
+        self._read()
+
+    def _read(self):
+        if os.path.exists(self._manifest):
+            with open(self._manifest) as fin:
+                self._state = json.load(fin)
+        else:
+            self._state = {"segments": [], "runs": [], "next_segment": 0}
+        self._hashes = set(run["hash"] for run in self._state["runs"])
+
+    @contextlib.contextmanager
+    def _lock(self, timeout=60):
+        # exclusive access to the manifest and segments; the manifest is read
+        # again once the lock is acquired
+        with file_lock(os.path.join(self.directory, "index.lock"), timeout):
+            self._read()
+            yield
+
+    def __len__(self):
+        return sum(x["size"] for x in self._state["segments"])
+
+    @property
+    def runs(self):
+        """The runs (files) in the index"""
+        return pd.DataFrame(self._state["runs"], columns=["id", "name", "hash"])
+
+    def _save(self):
+        with open(self._manifest + ".tmp", "w") as fout:
+            json.dump(self._state, fout, indent=1)
+        os.replace(self._manifest + ".tmp", self._manifest)
+
+    def __contains__(self, filename):
+        return get_file_hash(filename) in self._hashes
+
+    def _get_arrays(self, lines):
+        # the new runs and their peaks; the run of each peak is the position
+        # in the list of new runs
+        runs = []
+        data = dict((key, []) for key in self.numeric + self.text)
+        for line in lines:
+            # lines read from file-like objects cannot be identified
+            if not isinstance(getattr(line, "filename", None), str):
+                continue
+            digest = get_file_hash(line.filename)
+            if digest in self._hashes or digest in [x["hash"] for x in runs]:
+                continue
+            run = len(runs)
+            runs.append({"hash": digest, "name": os.path.basename(line.filename)})
+            for well in line.wells:
+                df = well.df
+                size = df["Size (bp)"].astype(float).values
+                valid = ~np.isnan(size)
+                N = valid.sum()
+                data["size"].append(size[valid])
+                data["rfu"].append(df["RFU"].astype(float).values[valid])
+                data["conc"].append(df["ng/ul"].astype(float).values[valid])
+                data["molarity"].append(df["nmole/L"].astype(float).values[valid])
+                data["run"].append(np.repeat(run, N))
+                data["well"].append(np.repeat(str(well.name), N))
+                data["sample"].append(np.repeat(str(well.well_ID), N))
+        if len(data["size"]) == 0:
+            data = dict((key, [np.array([])]) for key in data)
+        return runs, dict((key, np.concatenate(values))
+                          for key, values in data.items())
+
+    def _write_segment(self, arrays):
+        order = np.argsort(arrays["size"], kind="mergesort")
+        name = "segment-%06d" % self._state["next_segment"]
+        self._state["next_segment"] += 1
+        path = os.path.join(self.directory, name)
+        os.makedirs(path)
+        for key in self.numeric:
+            dtype = np.int32 if key == "run" else np.float64
+            np.save(os.path.join(path, key + ".npy"),
+                    arrays[key][order].astype(dtype))
+        for key in self.text:
+            np.save(os.path.join(path, key + ".npy"),
+                    arrays[key][order].astype(str))
+        return {"name": name, "size": len(order)}
+
+    def add(self, lines):
+        """Add the peaks of a list of lines
+
+        Files (identified by their content) already in the index are
+        ignored. Lines must have a **filename** attribute pointing to a
+        file on disk (as lines created by :class:`~fragment_analyser.plate.Plate`).
+
+        :return: the number of peaks added
+        """
+        runs, arrays = self._get_arrays(lines)
+        if len(runs) == 0:
+            return 0
+        with self._lock():
+            # runs added by another process in the meantime are ignored
+            new = [i for i, run in enumerate(runs)
+                   if run["hash"] not in self._hashes]
+            if len(new) == 0:
+                return 0
+            ids = np.full(len(runs), -1)
+            ids[new] = len(self._state["runs"]) + np.arange(len(new))
+            run = ids[arrays["run"].astype(int)]
+            arrays = dict((key, values[run >= 0])
+                          for key, values in arrays.items())
+            arrays["run"] = run[run >= 0]
+
+            # runs are recorded once their peaks are written
+            if len(arrays["size"]):
+                self._state["segments"].append(self._write_segment(arrays))
+            for i in new:
+                self._state["runs"].append(dict(runs[i], id=int(ids[i])))
+                self._hashes.add(runs[i]["hash"])
+            if len(self._state["segments"]) > self.max_segments:
+                self._compact()
+            else:
+                self._save()
+        return len(arrays["size"])
+
+    def add_plate(self, plate):
+        """Add the peaks of the input files of a :class:`~fragment_analyser.plate.Plate`
+
+        Files whose results were read from a cache or a journal are read
+        again unless they are already in the index.
+        """
+        lines = []
+        for source, line in plate.sources:
+            if line is None:
+                if isinstance(source, str) and source in self:
+                    continue
+                line = plate.get_line(source)
+            lines.append(line)
+        return self.add(lines)
+
+    def _load(self, name, key):
+        return np.load(os.path.join(self.directory, name, key + ".npy"),
+                       mmap_mode="r")
+
+    def compact(self):
+        """Merge all segments into a single one"""
+        with self._lock():
+            self._compact()
+
+    def _compact(self):
+        segments = self._state["segments"]
+        if len(segments) <= 1:
+            return
+        arrays = {}
+        for key in self.numeric + self.text:
+            arrays[key] = np.concatenate([self._load(x["name"], key)
+                                          for x in segments])
+        self._state["segments"] = [self._write_segment(arrays)]
+        self._save()
+        for segment in segments:
+            shutil.rmtree(os.path.join(self.directory, segment["name"]))
+
+    def query(self, lower, upper):
+        """Return the peaks with a size in [lower, upper]
+
+        :return: a dataframe sorted by size with the run name, well,
+            sample ID, size, RFU, concentration and molarity of each peak.
+        """
+        frames = []
+        for segment in self._state["segments"]:
+            sizes = self._load(segment["name"], "size")
+            start = np.searchsorted(sizes, lower, side="left")
+            end = np.searchsorted(sizes, upper, side="right")
+            if end <= start:
+                continue
+            data = dict((key, np.array(self._load(segment["name"], key)[start:end]))
+                        for key in self.numeric + self.text)
+            frames.append(pd.DataFrame(data))
+
+        columns = ["Run", "Well", "Sample ID", "Size (bp)", "RFU", "ng/ul",
+                   "nmole/L"]
+        if len(frames) == 0:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True)
+        names = np.array([x["name"] for x in self._state["runs"]], dtype=object)
+        df = pd.DataFrame({"Run": names[df["run"].values], "Well": df["well"],
+                           "Sample ID": df["sample"], "Size (bp)": df["size"],
+                           "RFU": df["rfu"], "ng/ul": df["conc"],
+                           "nmole/L": df["molarity"]}, columns=columns)
+        df = df.iloc[np.argsort(df["Size (bp)"].values, kind="mergesort")]
+        df.reset_index(drop=True, inplace=True)
+        return df
+
+
+class Options(argparse.ArgumentParser):
+    def __init__(self, prog="fragment_analyser query"):
+        usage = """
+
+    fragment_analyser query --index peaks_index --range 540 620
+        """
+        super(Options, self).__init__(usage=usage, prog=prog,
+            description="Query the peaks of an index built with --index",
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument("-i", "--index", required=True, type=str,
+                          help="Directory of the index")
+        self.add_argument("-r", "--range", nargs=2, type=float, required=True,
+                          metavar=("LOWER", "UPPER"),
+                          help="Size range in bp (inclusive)")
+        self.add_argument("-o", "--output", default=None, type=str,
+                          help="Save the peaks in a CSV file instead of printing them")
+
+
+def main(args):
+    """Entry point of ``fragment_analyser query``"""
+    options = Options().parse_args(args[1:])
+    if os.path.isdir(options.index) is False:
+        raise IOError("Index %s not found" % options.index)
+    df = PeakIndex(options.index).query(*options.range)
+    if options.output:
+        df.to_csv(options.output, index=False)
+    else:
+        print(df.to_string(index=False))
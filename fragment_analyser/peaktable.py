@@ -2,10 +2,17 @@
 """
 
 """
+import logging
+
 import numpy as np
 import pandas as pd
 
 from .well import Well
+from .geometry import get_geometry
+from .trace import TraceReader, is_trace
+
+
+logger = logging.getLogger(__name__)
 
 
 class PeakTableReader(object):
@@ -20,7 +27,7 @@ class PeakTableReader(object):
 
     This class does not need to be used. It is used by :class:`~fragment_analyser.line.Line`.
 
-    There are 2 possible input formats. One is a pure CSV format, which we will call **standard**.
+    There are 2 possible input formats of peak tables. One is a pure CSV format, which we will call **standard**.
     The other format is called **alternate**: it mixed CSV tables and sub-tables as shown later.
     Although the alternate files have the extension .csv, there qre not strictly speaking CSV files.
     However, they can be read as CSV and then interpreted.
@@ -62,7 +69,9 @@ class PeakTableReader(object):
 
     Here, the wells are named B1, B2, B3 ... Other lines may be named A1, A2, ...
     Each file contains the data for a single line and uses a single letter from A to H corresponding
-    to one of the 8 possible line on a given plate.
+    to one of the 8 possible line on a given plate. Higher density plates (e.g.
+    384-well plates with lines A to P and 24 wells per line) are handled using
+    the **geometry** parameter (see :func:`~fragment_analyser.geometry.get_geometry`).
 
     You can get examples from ::
 
@@ -74,19 +83,33 @@ class PeakTableReader(object):
 
     .. note:: the data below bp=1 and above bp=6000 are removed.
 
+    Finally, raw traces (mode **trace**) exported by the instrument (size and
+    RFU of each well) are also accepted. Peaks are then called by
+    :class:`~fragment_analyser.trace.TraceReader` (whose parameters can be set
+    with **trace_options**) instead of the vendor software.
+
 
     """
-    def __init__(self, filename, sigma=50, lower_bound=120, upper_bound=6000):
+    def __init__(self, filename, sigma=50, lower_bound=120, upper_bound=6000,
+                 geometry=None, trace_options=None):
         """.. rubric:: Constructor
 
-        :param filename: a valid fragment analyser input file
+        :param filename: a valid fragment analyser input file (or a file-like
+            object with the content of such a file)
         :param sigma:
+        :param geometry: the plate geometry (default to 96-well plates). See
+            :func:`~fragment_analyser.geometry.get_geometry`.
+        :param trace_options: a dictionary with the parameters of
+            :meth:`~fragment_analyser.trace.TraceReader.get_peak_table` used
+            to call peaks of raw traces.
 
         """
         self.filename = filename
         self.sigma = sigma
         self.lower_bound = lower_bound
         self.upper_bound = upper_bound
+        self.geometry = get_geometry(geometry)
+        self.trace_options = trace_options or {}
 
         # guess the mode (CSV input files are in mode alternate or mode standard)
         self._guess_mode()
@@ -96,100 +119,107 @@ class PeakTableReader(object):
         self.interpret()
         self._nwells = len(self.wells)
 
+    def _read_csv(self, **kwargs):
+        # the input may be a file-like object (e.g. uploaded data), which
+        # is read several times
+        if hasattr(self.filename, "seek"):
+            self.filename.seek(0)
+        return pd.read_csv(self.filename, **kwargs)
+
     def _guess_mode(self):
-        df = pd.read_csv(self.filename, sep=",")
+        df = self._read_csv(sep=",", nrows=5)
         if 'Well' in df.columns:
             self.mode = "standard"
+        elif is_trace(df, self.geometry):
+            self.mode = "trace"
         else:
             self.mode = "alternate"
 
     def _identify_names(self):
-        # Each of the 8 plates is labelled by a letter from A to H
-        names = [x for x in self.df[0].dropna().unique() if x.strip()
-                 and x[0] in 'ABCDEFGH']
+        # Each line is labelled by a letter (A to H on a 96-well plate). The
+        # well names (e.g., A1) are the only cells of the first column that
+        # are valid for the plate geometry.
+        first = self.df[0].where(self.df[0].notnull(), "").astype(str).str.strip()
+        valid = self.geometry.is_well_name(first.values)
 
         # make sure there is no spaces
-        self.names = [name.strip() for name in names]
+        self._first_column = first
+        self.names = list(pd.unique(first[valid]))
 
     def _identify_start(self):
         # For the alternate case, let us keep track of the starting position of each name
-        positions = [self.df.index[(self.df[0] == name)][0]
+        first = self._first_column
+        positions = [first.index[(first == name).values][0]
                      for name in self.names]
         self.start_positions = positions
 
     def _identify_end(self):
-        # READ one file corresponding to one Line that is 12 wells
-        ends = []
-        for name, position in zip(self.names, self.start_positions):
-            # not optimal but let us make it simple and scan the dataframe
-            # for each name to retrieve only the data corresponding to the
-            # name. Using the position, we can jump to the start 
-    
-            # find index where the current name ends
-            found = -1
-            # +1 to skip the row with the name itself
-            for index, line in self.df.ix[position+1:].iterrows():
-                line = line.fillna("")
-                if line[0].strip() in self.names:
-                    found = index
-                    break
-            if found == -1:
-                found = index
-            ends.append(found)
-        self.end_positions = ends
+        # A block ends where the next one starts. The last block ends at
+        # the end of the file.
+        self.end_positions = self.start_positions[1:] + [self.df.index[-1]]
 
     def interpret(self):
         if self.mode == "alternate":
             self.interpret_alternate()
         elif self.mode == "standard":
             self.interpret_standard()
+        elif self.mode == "trace":
+            self.interpret_trace()
 
     def interpret_standard(self):
-        print('Standard input data')
-        self.df = pd.read_csv(self.filename, sep=",")
+        logger.info('Standard input data')
+        self.df = self._read_csv(sep=",")
         #self.df.fillna('', inplace=True)
         # replaces spaces by empty strings
         #self.df = self.df.applymap(lambda x: x.strip())
         #identify names
         self.names = list(self.df.Well.unique())
-        wells = []
 
-        for i, well_name in enumerate(self.names):
-            data = self.df.ix[self.df.groupby("Well").groups[well_name]]
-            # column TIM contains the unit, redundant with header. Besides,
-            # cannot be used as float. This was a bug in the integrated software
-            # included in the fragment analyser machine. Was fixed at biomics in
-            # sept2016 but it means other machine and older files may use the
-            # other format. so, we handle the two cases:
-            try: 
-                data['TIM (nmole/L)'] = data['TIM (nmole/L)'].apply(lambda x:
-                                                                x.split(" ")[0])
-            except:
-                pass
-
-            # convert all data to the correct type:
-            for colname in data.columns:
-                if colname in ['Well', 'Sample ID']:
-                    pass
-                else:
-                    data[colname] = data[colname].astype(float)
+        # column TIM contains the unit, redundant with header. Besides,
+        # cannot be used as float. This was a bug in the integrated software
+        # included in the fragment analyser machine. Was fixed at biomics in
+        # sept2016 but it means other machine and older files may use the
+        # other format. so, we handle the two cases. Conversions are done
+        # once for all wells rather than well by well.
+        df = self.df.copy()
+        if df['TIM (nmole/L)'].dtype == object:
+            df['TIM (nmole/L)'] = df['TIM (nmole/L)'].astype(str).str.split(" ").str[0]
+
+        # convert all data to the correct type:
+        for colname in df.columns:
+            if colname not in ['Well', 'Sample ID']:
+                df[colname] = df[colname].astype(float)
+
+        self.wells = self._get_wells(df)
 
+    def _get_wells(self, df):
+        wells = []
+        for well_name, data in df.groupby("Well", sort=False):
             well = Well(data, sigma=self.sigma, lower_bound=self.lower_bound,
                         upper_bound=self.upper_bound)
             wells.append(well)
+        return wells
 
-        self.wells = wells
+    def interpret_trace(self):
+        logger.info('Trace input data')
+        trace = TraceReader(self._read_csv(sep=","), geometry=self.geometry)
+        self.df = trace.get_peak_table(**self.trace_options)
+        self.names = list(self.df.Well.unique())
+        self.wells = self._get_wells(self.df)
 
     def interpret_alternate(self):
         # Read a CSV file
-        print('Alternate input data')
-        self.df = pd.read_csv(self.filename, sep=",", header=None)
+        logger.info('Alternate input data')
+        self.df = self._read_csv(sep=",", header=None)
         # replaces spaces or empty spaces by empty na
-        self.df = self.df.applymap(lambda x: np.nan if isinstance(x, str)
-                                                       and x.isspace() else x)
+        self.df = self.df.replace(r"^\s+$", np.nan, regex=True)
 
         # identify the submatrices in the CSV file
         self._identify_names()
+        if len(self.names) == 0:
+            raise ValueError("No well name of a plate of %s lines x %s wells "
+                             "found in the first column" % (
+                             self.geometry.nlines, self.geometry.nwells))
         self._identify_start()
         self._identify_end()
 
@@ -3,18 +3,19 @@ import time
 import os
 import sys
 import argparse
+import logging
+import shutil
 import easydev
 from easydev.console import red, purple, darkgreen
 from fragment_analyser import version
 from .plate import Plate
+from .strategies import strategies, get_strategy
 
 
-
-# Used to avoid issue with missing DISPLAY on the cluster.
-import pylab
-
 t3 = time.time()
 
+logger = logging.getLogger(__name__)
+
 
 def print_color(txt, func_color=darkgreen, underline=False):
     try:
@@ -26,6 +27,18 @@ def print_color(txt, func_color=darkgreen, underline=False):
         print(txt)
 
 
+class _StdoutHandler(logging.StreamHandler):
+    # always writes to the current sys.stdout, which may be redirected (e.g.
+    # by the daemon workers)
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
 class Options(argparse.ArgumentParser):
     """
 
@@ -57,6 +70,21 @@ class Options(argparse.ArgumentParser):
                            dest="create_images",
                            help="""For each input file, an image is created.
                                 If not required, use this option""")
+        group.add_argument("-q", "--quiet", action="store_true",
+                           help="""Only show warnings and errors""")
+        group.add_argument("--events", default=None, type=str,
+                           help="""Append progress events (start and end of
+each file, throughput, estimated time left, output files) to this file as JSON
+documents, one per line. Use - for the standard output""")
+        group.add_argument("--image-format", default="png", type=str,
+                           choices=["png", "svg"],
+                           help="""Format of the images. With svg, images are
+created without matplotlib (much faster) and an HTML report of the plate is
+also created (e.g. summary.html)""")
+        group.add_argument("--montage", default=None, type=str,
+                           help="""Create a single image with the diagnostic
+of all input files (e.g. montage.png). Per-file images are still created unless
+--no-images is used""")
         group.add_argument('-r', '--precision', type=int, default=8,
                            help="set number of digits in the output CSV")
         group.add_argument('-l', "--lower-bound", default=120, type=int,
@@ -71,60 +99,246 @@ sigma of 50 by default, which can be changed with this parameter.""")
                            help="""Position of the peak to be identified. If not
 provided, guessed from the median of the maximum across the line.""")
         group.add_argument("-m", "--method", default="homogeneous", type=str,
-                            choices=["homogeneous", "heterogeous", "max", "conc"],
+                            choices=["homogeneous", "heterogeous", "max", "conc"] +
+                                    sorted(set(strategies) - set(["max"])),
                            help="""By default plates are homogeneous that is all
 main peaks are suppose to be found around the same position; In such case, the
 peak position is guessed from the consensus across the different lines; peaks 
-are then identified according to that consensus. If the plate is heterogeous, then the concentration is used to identify the peak position, independently in each line.""")
-
-
+are then identified according to that consensus. If the plate is heterogeous, then the concentration is used to identify the peak position, independently in each line.
+Other strategies: closest (peak closest to the guess), area (highest ng/ul
+within the guess +/- 3 sigma), molarity (highest nmole/L). Outliers are filtered
+for the strategies that use the guess (max, closest and area)""")
+        group.add_argument("-k", "--top-k", default=None, type=int,
+                           help="""Number of peaks to report for each well
+(e.g. for multiplexed libraries). The output files then have one row per peak
+with its rank. Outliers are filtered for each rank separately""")
+        group.add_argument("--guesses", default=None, type=float, nargs="+",
+                           help="""Expected positions of the products in each
+well. The best peak around each position is reported (see --sigma). Replaces
+--top-k""")
+        group.add_argument("--filter-by", default=None, type=str, nargs="+",
+                           help="""Filter the outliers in groups of wells: line
+(each input file), row (well letter), column (well number), prefix:N (first N
+characters of the Sample ID) or a column name. Several groups may be combined.
+By default, the median and MAD of all wells are used""")
+        group.add_argument("--filter-method", default="mad", type=str,
+                           choices=["mad", "hampel"],
+                           help="""mad: outliers are beyond 3 MAD of the median
+of their group. hampel: beyond 3 MAD of the median of the neighbouring wells of
+their group (see --filter-window)""")
+        group.add_argument("--filter-window", default=2, type=int,
+                           help="""Number of neighbours on each side of a well
+used by the hampel filter""")
+        group.add_argument("--sample-sheet", default=None, type=str,
+                           help="""CSV file with a Well and/or Sample ID column.
+Its columns are added to the output files and the expected size of each well
+(column 'Expected size (bp)') replaces --guess""")
+        group.add_argument("--confidence", action="store_true",
+                           help="""Add the confidence of each selected peak to
+the output files: margin over the runner-up peak, stability of the selection
+for other sigma values and distance to the line and plate medians in MAD
+units""")
+        group.add_argument("--recalibrate", action="store_true",
+                           help="""Correct the sizes of each well with a linear
+fit of the measured sizes of its lower and upper markers onto their nominal
+sizes""")
+        group.add_argument("--sizing-qc", action="store_true",
+                           help="""Save the sizing metrics of each well (errors
+of the lower and upper markers and of the ladder, correction used by
+--recalibrate) in the file summary_sizing.csv""")
+        group.add_argument("--validate", action="store_true",
+                           help="""Check the structure of all input files (in
+parallel) before the analysis; invalid files are reported and skipped. See
+also the 'fragment_analyser validate' command""")
+        group.add_argument("--cache-dir", default=None, type=str,
+                           help="""Directory where results of each input file
+are cached. On later runs, files that did not change (and analysed with the same
+parameters) are read from the cache. Disabled by default""")
+        group.add_argument("--index", default=None, type=str,
+                           help="""Directory of a peak index. All peaks of the
+input files are added to the index, which can then be queried with the
+'fragment_analyser query' command""")
+        group.add_argument("--history", default=None, type=str,
+                           help="""Directory of a historical log. The aggregates
+of the run (median and MAD of the peaks, empty wells, ladder and marker errors)
+are appended to the log, which is followed with the 'fragment_analyser trend'
+command. Not available with --shard""")
+        group.add_argument("--history-by", default=None, type=str,
+                           help="""Aggregate the run per assay in the log:
+prefix:N (first N characters of the Sample ID) or a column name. By default,
+the whole run""")
+        group.add_argument("--resume", action="store_true",
+                           help="""Record each analysed file in a journal
+(see --journal) and skip the files already recorded by a previous run that was
+interrupted. Use it from the first run""")
+        group.add_argument("--journal", default=None, type=str,
+                           help="""Directory of the journal. Without --resume,
+a new journal is started. Defaults to .fa_journal when --resume is used""")
+        group.add_argument("--shard", default=None, type=str,
+                           help="""Analyse only a slice of the (sorted) input
+files, given as i/N (e.g. 2/10 for the second of 10 slices), for instance in
+cluster array jobs. Results are saved in a shard file instead of the summary
+files; use 'fragment_analyser merge' once all shards are done""")
+        group.add_argument("--geometry", default="96", type=str,
+                           help="""Plate geometry: 96 (8 lines of 12 wells),
+384 (16 lines A-P of 24 wells) or NLINESxNWELLS (e.g. 16x24). Defaults to 96""")
+
+
+
+
+#: sub-commands of the standalone application. Modules are imported only
+#: when the sub-command is used
+subcommands = {
+    "serve": "fragment_analyser.server",
+    "query": "fragment_analyser.peakindex",
+    "daemon": "fragment_analyser.daemon",
+    "merge": "fragment_analyser.shards",
+    "trend": "fragment_analyser.history",
+    "validate": "fragment_analyser.validate",
+    "diff": "fragment_analyser.diff",
+}
+
+
+def get_output_filenames(output, tag):
+    """Return the names of the summary files with all and filtered results"""
+    if tag:
+        all_filename = output.replace(".csv", "_all_%s.csv" % tag)
+    else:
+        all_filename = output.replace(".csv", "_all.csv")
+    if tag is not None:
+        filtered_filename = output.replace(".csv", "_filtered_%s.csv" % tag)
+    else:
+        filtered_filename = output.replace(".csv", "_filtered.csv")
+    return all_filename, filtered_filename
 
 
 def main(args=None):
 
-    msg = "Welcome to FragmentAnalyser standalone application"
-    print_color(msg, purple, underline=True)
-
-    msg = "Version: %s\n" % version
-    msg += "Author: Thomas Cokelaer thomas.cokelaer@pasteur.fr\n"
-    msg += "Information and documentation on " + \
-           "https://github.com/C3BI-pasteur-fr/FragmentAnalyser\n"
-    print_color(msg, purple)
-
     if args is None:
         args = sys.argv[:]
+    if len(args) > 1 and args[1] in subcommands:
+        import importlib
+        module = importlib.import_module(subcommands[args[1]])
+        return module.main(args[1:])
+
     if len(args) == 1:
         args += ['--help']
 
     options = Options()
     options = options.parse_args(args[1:])
 
+    if options.quiet is False:
+        msg = "Welcome to FragmentAnalyser standalone application"
+        print_color(msg, purple, underline=True)
+
+        msg = "Version: %s\n" % version
+        msg += "Author: Thomas Cokelaer thomas.cokelaer@pasteur.fr\n"
+        msg += "Information and documentation on " + \
+               "https://github.com/C3BI-pasteur-fr/FragmentAnalyser\n"
+        print_color(msg, purple)
+
+    # messages of the library are shown on the standard output
+    root = logging.getLogger("fragment_analyser")
+    if not any(isinstance(x, _StdoutHandler) for x in root.handlers):
+        handler = _StdoutHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        root.addHandler(handler)
+    # only warnings and errors in quiet mode
+    root.setLevel(logging.WARNING if options.quiet else logging.INFO)
+
+    if options.events:
+        from .events import EventStream, JSONLinesWriter
+        writer = JSONLinesWriter(options.events)
+        events = EventStream(writer)
+    else:
+        events = None
+
+    def written(*names):
+        # report the files created by the application
+        for name in names:
+            if events is not None and name is not None:
+                events.emit("output", filename=name)
+
     # a user may use 2015*csv on the command line, which is expanded into a list
     # of filse unless user place quotes around it "2015*csv". It is highly
     # likely that most users won't understand and forget the quotes
 
-    if "*" in options.pattern or "?" in options.pattern:
+    # the files matched by a pattern are sorted (as in
+    # :func:`~fragment_analyser.shards.get_shard`) so that the order of the
+    # results does not depend on the file system
+    filenames = options.pattern
+    if len(filenames) == 1 and ("*" in filenames[0] or "?" in filenames[0]):
         import glob
-        filenames = glob.glob(options.pattern)
-    else:
-        filenames = options.pattern
-
-    print("Info: found %s file(s) to analyse" % len(filenames))
+        filenames = sorted(glob.glob(filenames[0]))
+
+    if options.shard:
+        from . import shards
+        if options.filter_by or options.filter_method != "mad":
+            # the merge computes the plate-wide median and MAD only
+            raise ValueError("--filter-by and --filter-method cannot be used "
+                             "with --shard")
+        if options.history:
+            # a run of the log is a whole plate, not a slice of it
+            raise ValueError("--history cannot be used with --shard")
+        shard = shards.parse_shard(options.shard)
+        filenames = shards.get_shard(filenames, *shard)
+        logger.info("Info: shard %s out of %s" % shard)
+
+    logger.info("Info: found %s file(s) to analyse" % len(filenames))
     for filename in filenames:
-        print('- %s' % filename)
+        logger.info('- %s' % filename)
     output_filename = options.output
 
     if options.method in ["homogeneous", "max"]:
         peak_mode = "max"
     elif options.method in ["heterogeous", "conc", "concentration"]:
         peak_mode = "concentration"
+    else:
+        peak_mode = options.method
+    # plates analysed with a consensus guess are homogeneous: outliers are
+    # filtered
+    homogeneous = get_strategy(peak_mode).uses_guess
+
+    if options.cache_dir:
+        from .cache import ResultCache
+        cache = ResultCache(options.cache_dir, images=options.create_images
+                            and options.image_format)
+    else:
+        cache = None
+
+    if options.index:
+        from .peakindex import PeakIndex
+        index = PeakIndex(options.index)
+    else:
+        index = None
+
+    if options.history:
+        from .history import History
+        history = History(options.history, by=options.history_by)
+    else:
+        history = None
+
+    if options.resume or options.journal:
+        from .journal import Journal
+        directory = options.journal or ".fa_journal"
+        if options.shard and options.journal is None:
+            directory += ".shard-%s-of-%s" % shard
+        journal = Journal(directory, resume=options.resume)
+    else:
+        journal = None
 
     # Save the CSV summary files setting the precision
     plate = Plate(filenames, guess=options.guess,
                   sigma=options.sigma,
                   lower_bound=options.lower_bound,
                   upper_bound=options.upper_bound, 
-                    peak_mode=peak_mode)
+                    peak_mode=peak_mode, geometry=options.geometry,
+                  cache=cache, index=index, top_k=options.top_k,
+                  guesses=options.guesses, journal=journal,
+                  sample_sheet=options.sample_sheet,
+                  confidence=options.confidence,
+                  recalibrate=options.recalibrate, history=history,
+                  events=events, validate=options.validate)
     plate.analyse() # by default keep all data
 
     # apply precision on numeric data
@@ -132,61 +346,125 @@ def main(args=None):
         data = plate.data[col].apply(lambda x: round(x, options.precision))
         plate.data[col] = data
 
-    if options.tag:
-
-        plate.to_csv(output_filename.replace(".csv",
-                                             "_all_%s.csv" % options.tag))
+    all_filename, filtered_filename = get_output_filenames(output_filename,
+                                                           options.tag)
+    if options.shard:
+        # outliers are computed once all shards are merged
+        shard_filename = shards.get_shard_filename(output_filename,
+                                                   options.tag, *shard)
+        shards.save_shard(shard_filename, plate.data, shard[0], shard[1],
+                          filenames, minmad=plate.minmad,
+                          filter=homogeneous, precision=options.precision)
+        logger.info("Info: results saved in %s" % shard_filename)
+        written(shard_filename)
     else:
-        plate.to_csv(output_filename.replace(".csv", "_all.csv"))
-
-    # we may also consider that lines are uniform so outliers must be crossed
-    if options.method in ["homogeneous", "max"]:
-        plate.filterout()
-
-    if options.tag is not None:
-        plate.to_csv(output_filename.replace(".csv",
-                                             "_filtered_%s.csv" % options.tag))
-    else:
-        plate.to_csv(output_filename.replace(".csv", "_filtered.csv"))
+        # we may also consider that lines are uniform so outliers must be crossed
+        if homogeneous:
+            plate.filterout(by=options.filter_by, method=options.filter_method,
+                            window=options.filter_window)
+            outliers_filename = filtered_filename.replace("_filtered", "_outliers")
+        else:
+            outliers_filename = None
+
+        plate.write_views(all=all_filename, filtered=filtered_filename,
+                          outliers=outliers_filename)
+        written(all_filename, filtered_filename, outliers_filename)
+
+    if options.sizing_qc:
+        sizing_filename = all_filename.replace("_all", "_sizing")
+        if options.shard:
+            sizing_filename = sizing_filename.replace(".csv",
+                                ".shard-%s-of-%s.csv" % shard)
+        plate.get_sizing_qc().round(options.precision).to_csv(sizing_filename,
+                                                              index=False)
+        logger.info("Info: sizing metrics saved in %s" % sizing_filename)
+        written(sizing_filename)
 
     if options.create_images is False:
         pass
     else:
-        print("\nCreating images")
+        logger.info("\nCreating images")
         count = 1
+        ext = "." + options.image_format
+        if options.image_format == "png":
+            # Used to avoid issue with missing DISPLAY on the cluster.
+            import pylab
+        else:
+            from .report import save_svg, write_report
 
         image_filenames = []
-        for filename, line in zip(filenames, plate.lines):
+        for source, line in plate.sources:
             # get the filename
-            filename = os.path.split(filename)[1]
+            filename = os.path.split(source)[1]
 
             # replace extension csv to png
             lhs, _ext = os.path.splitext(filename)
 
             if options.tag is None:
-                image_filename = lhs + ".png"
+                image_filename = lhs + ext
             else:
-                image_filename = lhs + "_%s.png" % options.tag
+                image_filename = lhs + "_%s%s" % (options.tag, ext)
 
             if image_filename not in image_filenames:
                 image_filenames.append(image_filename)
             else: # if it exists already, let us append a unique id:
-                image_filename = lhs + "_%s.png" % count
+                image_filename = lhs + "_%s%s" % (count, ext)
                 count += 1
                 image_filenames.append(image_filename)
 
-            print("Creating image %s out of %s (%s)" %
-                  (count, len(plate.lines), image_filename))
-            line.diagnostic()
-            pylab.savefig(image_filename)
+            logger.info("Creating image %s out of %s (%s)" %
+                  (count, len(plate.sources), image_filename))
+            if line is None:
+                # results and image were found in the cache or the journal
+                key = plate.keys[source]
+                image = plate.cache.get_image(key) if plate.cache else None
+                if image is None and plate.journal is not None:
+                    image = plate.journal.get_image(key)
+                if image is not None:
+                    if os.path.abspath(image) != os.path.abspath(image_filename):
+                        shutil.copyfile(image, image_filename)
+                    written(image_filename)
+                    continue
+                # the run was interrupted before this image was created
+                line = plate.get_line(source)
+            if options.image_format == "png":
+                line.diagnostic()
+                pylab.savefig(image_filename)
+            else:
+                save_svg(line, image_filename, title=filename)
+            written(image_filename)
+            if plate.cache is not None:
+                plate.cache.set_image(plate.keys[source], image_filename)
+            if plate.journal is not None:
+                plate.journal.add_image(plate.keys[source], image_filename)
+
+        if options.image_format == "svg":
+            if options.tag:
+                report_filename = output_filename.replace(".csv", "_%s.html" % options.tag)
+            else:
+                report_filename = output_filename.replace(".csv", ".html")
+            if options.shard:
+                report_filename = report_filename.replace(".html",
+                                    ".shard-%s-of-%s.html" % shard)
+            sources = [source for source, line in plate.sources]
+            write_report(plate, report_filename,
+                         images=list(zip(sources, image_filenames)))
+            written(report_filename)
+
 
 
+    if options.montage:
+        logger.info("Creating montage %s" % options.montage)
+        plate.montage(options.montage)
+        written(options.montage)
 
     # Create a log file
     if options.tag is None:
         log_filename = "fa.log"
     else:
         log_filename = "fa_%s.log" % options.tag
+    if options.shard:
+        log_filename = log_filename.replace(".log", ".shard-%s-of-%s.log" % shard)
 
     with open(log_filename, "w") as fout:
         fout.write("Command run:\n")
@@ -196,6 +474,9 @@ def main(args=None):
             fout.write(" - %s\n" % filename)
         fout.write("\n%s" % plate.__str__())
         fout.write("\nFragment Analyser version: %s" % version)
+    written(log_filename)
+    if events is not None:
+        writer.close()
 
 
 
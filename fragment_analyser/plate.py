@@ -1,20 +1,75 @@
 #!/usr/bin/python
+import logging
+
 from .tools import nonemedian
 from .line import Line
+from .geometry import get_geometry
+from .cache import get_key
+from .events import get_stream
 
 import numpy as np
 import pandas as pd
 
 
+logger = logging.getLogger(__name__)
+
+
 class Plate(object):
     """Reads several files (lines) and save a summary file
 
     A plate contains (at most) 8 :class:`lines` with 12 :class:`well` each.
+    Other geometries such as 384-well plates (16 lines of 24 wells) are
+    set with the **geometry** parameter (see
+    :func:`~fragment_analyser.geometry.get_geometry`).
+
+    Results of each file may be stored in a
+    :class:`~fragment_analyser.cache.ResultCache` (**cache** parameter), in
+    which case files that were already analysed with the same parameters
+    are not read again.
+
+    The peaks of the files may also be added to a persistent
+    :class:`~fragment_analyser.peakindex.PeakIndex` (**index** parameter)
+    when calling :meth:`analyse`.
+
+    With a :class:`~fragment_analyser.journal.Journal` (**journal**
+    parameter), the results of each file are recorded as soon as the file is
+    read so that an interrupted run can be resumed.
+
+    A :class:`~fragment_analyser.samplesheet.SampleSheet` (**sample_sheet**
+    parameter) is joined to the results; its expected sizes replace the
+    guess of the wells it describes (strategies that use a guess such as
+    max, see :mod:`~fragment_analyser.strategies`).
+
+    With **confidence** set to True, the confidence of each selected peak
+    is added to the results (see :mod:`~fragment_analyser.confidence`).
+
+    The aggregates of the plate may be appended to a
+    :class:`~fragment_analyser.history.History` (**history** parameter) when
+    calling :meth:`analyse` to follow the drift of the instrument.
+
+    Progress events (start and end of each file, throughput...) are sent to
+    the callables given in **events** (see :mod:`~fragment_analyser.events`).
+
+    With **validate** set to True, the structure of all files is checked in
+    parallel before any file is analysed (see
+    :mod:`~fragment_analyser.validate`); invalid files are reported and
+    skipped.
 
+    With **recalibrate** set to True, the sizes of each well are corrected
+    using its lower and upper markers (see
+    :mod:`~fragment_analyser.sizing`).
+
+    When several products are expected in each well, set **top_k** to report
+    the k best peaks of each well, or **guesses** to report the best peak
+    around each expected position (see :meth:`Line.get_selected_peaks`).
 
     """
     def __init__(self, filenames, guess=None, lower_bound=120,
-                 upper_bound=6000,  sigma=50, peak_mode="max"):
+                 upper_bound=6000,  sigma=50, peak_mode="max", geometry=None,
+                 cache=None, index=None, top_k=None, guesses=None,
+                 journal=None, sample_sheet=None, confidence=False,
+                 recalibrate=False, history=None, events=None,
+                 validate=False):
         self.filenames = filenames
         self.guess = guess
         self.sigma = sigma
@@ -23,6 +78,21 @@ class Plate(object):
         self.minmad = 25
         self.mw_dna = 650
         self.peak_mode = peak_mode
+        self.geometry = get_geometry(geometry)
+        self.cache = cache
+        self.index = index
+        self.top_k = top_k
+        self.guesses = guesses
+        self.journal = journal
+        if isinstance(sample_sheet, str):
+            from .samplesheet import SampleSheet
+            sample_sheet = SampleSheet(sample_sheet)
+        self.sample_sheet = sample_sheet
+        self.confidence = confidence
+        self.recalibrate = recalibrate
+        self.history = history
+        self.events = get_stream(events)
+        self.validate = validate
         self._get_lines()
 
     def __str__(self):
@@ -32,91 +102,311 @@ class Plate(object):
         msg += " - upper_bound: %s\n" % self.upper_bound
         msg += " - minmad : %s\n" % self.minmad
         msg += " - guess: %s\n" % self.guess
+        if self.top_k is not None or self.guesses is not None:
+            msg += " - top_k: %s\n" % self.top_k
+            msg += " - guesses: %s\n" % self.guesses
+        msg += " - geometry: %s lines x %s wells\n" % (self.geometry.nlines,
+                                                       self.geometry.nwells)
+        if self.sample_sheet is not None:
+            msg += " - sample sheet: %s (%s rows)\n" % (
+                self.sample_sheet.filename, len(self.sample_sheet))
         return msg
 
+    def get_parameters(self):
+        """Return the parameters that affect the results of a file"""
+        params = {"sigma": self.sigma, "lower_bound": self.lower_bound,
+                  "upper_bound": self.upper_bound, "guess": self.guess,
+                  # the representation of strategies includes their parameters
+                  "peak_mode": str(self.peak_mode),
+                  "geometry": [self.geometry.nlines, self.geometry.nwells]}
+        if self.top_k is not None or self.guesses is not None:
+            params["top_k"] = self.top_k
+            params["guesses"] = self.guesses
+        if self.sample_sheet is not None:
+            params["sample_sheet"] = self.sample_sheet.get_digest()
+        if self.confidence:
+            params["confidence"] = True
+        if self.recalibrate:
+            params["recalibrate"] = True
+        return params
+
     def _get_lines(self):
-        print("\nReading and Analysing %s file(s):" % len(self.filenames))
+        logger.info("Reading and Analysing %s file(s):" % len(self.filenames))
         self.lines = []
-        for filename in self.filenames:
-            print(" - " + filename),
-            try:
-                line = Line(filename, sigma=self.sigma,
-                            lower_bound=self.lower_bound,
-                            upper_bound=self.upper_bound,
-                            peak_mode=self.peak_mode)
-
-                # THIS LINE IS IMPORTANT TO WEIGHT DOWN OUTLIERS
-                if self.peak_mode == "max":
-                    line.set_guess(self.guess)
-                self.lines.append(line)
-            except Exception as err:
-                print(err)
-                print('WARNING. This file could not be interpreted')
-
-    def analyse(self):
+        # (filename, line) for each file that could be interpreted. line is
+        # None if results are read from the cache or the journal (see
+        # cached attribute)
+        self.sources = []
+        self.cached = {}
+        self.keys = {}
+        self._rows = {}
+        #: the validation of each invalid file (see validate parameter)
+        self.invalid = {}
+        if self.validate:
+            from .validate import validate_files
+            filenames = [x for x in self.filenames if isinstance(x, str)]
+            for result in validate_files(filenames, geometry=self.geometry):
+                if not result.ok:
+                    self.invalid[result.filename] = result
+            logger.info("%s invalid file(s)" % len(self.invalid))
+        if self.events is not None:
+            self.events.start(len(self.filenames))
+        for i, filename in enumerate(self.filenames):
+            logger.info(" - " + filename)
+            if self.events is not None:
+                self.events.file_start(filename, i)
+            status = self._get_line(filename)
+            if self.events is not None:
+                if status in ("cached", "journal"):
+                    wells = self.cached[filename]["Well"].nunique()
+                elif status == "analysed":
+                    wells = len(self.lines[-1].wells)
+                else:
+                    wells = 0
+                self.events.file_end(filename, i, status, wells)
+        if self.events is not None:
+            self.events.end()
+
+    def _get_line(self, filename):
+        # read or fetch the results of a file; returns the status of the file
+        if isinstance(filename, str) and filename in self.invalid:
+            logger.warning("%s is invalid and skipped:\n%s" % (filename,
+                           "\n".join(self.invalid[filename].errors)))
+            return "invalid"
+        if self.cache is not None or self.journal is not None:
+            key = get_key(filename, self.get_parameters())
+            self.keys[filename] = key
+        if self.journal is not None:
+            rows = self.journal.get_rows(key)
+            if rows is not None:
+                logger.info("   (already analysed, found in the journal)")
+                self.cached[filename] = rows
+                self.sources.append((filename, None))
+                return "journal"
+        if self.cache is not None:
+            rows = self.cache.get_rows(key)
+            if rows is not None:
+                logger.info("   (results found in the cache)")
+                self.cached[filename] = rows
+                self.sources.append((filename, None))
+                return "cached"
+        try:
+            line = self._read_line(filename)
+            self.lines.append(line)
+            self.sources.append((filename, line))
+        except Exception as err:
+            logger.warning("%s could not be interpreted (%s)" % (filename, err))
+            return "failed"
+        if self.journal is not None:
+            rows = self._get_rows(line)
+            self.journal.add(filename, key, rows, self.get_parameters())
+            self._rows[filename] = rows
+        return "analysed"
+
+    def _read_line(self, filename):
+        line = Line(filename, sigma=self.sigma,
+                    lower_bound=self.lower_bound,
+                    upper_bound=self.upper_bound,
+                    peak_mode=self.peak_mode,
+                    geometry=self.geometry)
+        if self.recalibrate:
+            line.recalibrate()
+
+        # THIS LINE IS IMPORTANT TO WEIGHT DOWN OUTLIERS
+        if line.strategy.uses_guess:
+            line.set_guess(self.guess)
+            if self.sample_sheet is not None:
+                # expected sizes of the sample sheet replace the guess
+                guesses = self.sample_sheet.get_guesses(line.wells)
+                for well, guess in zip(line.wells, guesses):
+                    if not np.isnan(guess):
+                        well.guess = float(guess)
+        return line
+
+    def _get_rows(self, line):
+        # the results of a line
+        rows = line.get_selected_peaks(top_k=self.top_k, guesses=self.guesses)
+        if self.confidence:
+            from .confidence import add_confidence
+            # the product of rank 1 when several products are expected
+            guess = self.guesses[0] if self.guesses else None
+            rows = add_confidence(rows, line.get_confidence(guess=guess))
+        return rows
+
+    def get_line(self, filename):
+        """Return the line of an input file
+
+        Files whose results were found in the cache or the journal are read
+        again (e.g. to create their diagnostic).
+        """
+        for source, line in self.sources:
+            if source == filename and line is not None:
+                return line
+        return self._read_line(filename)
+
+    def analyse(self, top_k=None, guesses=None):
         """Reads the N files and create a summary data set
 
         Must be called before :meth:`to_csv`.
+
+        :param top_k: number of peaks to report per well (default to the
+            **top_k** given to the constructor)
+        :param guesses: expected positions of the products (default to the
+            **guesses** given to the constructor)
         """
+        if top_k is not None or guesses is not None:
+            stored = self.cache is not None or self.journal is not None
+            if stored and (top_k, guesses) != (self.top_k, self.guesses):
+                raise ValueError("top_k and guesses must be given to the "
+                                 "constructor when a cache or journal is used")
+            self.top_k, self.guesses = top_k, guesses
         data = []
-        for line in self.lines:
-            for well in line.wells:
-                if self.peak_mode == "max":
-                    res = well.get_peak_and_index()
-                else:
-                    res = well.get_most_concentrated_peak()
-                if res:
-                    peak, index = res
-                    data.append(well.df.ix[index])
-                else:
-                    # If no peak detected, create a line with well name and ID
-                    # but no data
-                    df = well.df.copy()
-                    N = len(df.columns)
-                    df.ix[0] = [well.name, well.well_ID] + [None] * (N-2)
-                    data.append(df.ix[0])
-
-        df = pd.DataFrame(data)
+        for filename, line in self.sources:
+            if line is None:
+                data.append(self.cached[filename])
+                continue
+            if filename in self._rows:
+                rows = self._rows[filename]
+            else:
+                rows = self._get_rows(line)
+            if self.cache is not None:
+                self.cache.set_rows(self.keys[filename], rows)
+            data.append(rows)
+        if data:
+            df = pd.concat(data)
+        else:
+            df = pd.DataFrame()
         df.reset_index(inplace=True, drop=True)
 
         # new format has no Peak ID
         if "Peak ID" in df.columns:
             df.drop('Peak ID', axis=1, inplace=True)
+        if self.confidence and len(df):
+            from .confidence import get_plate_distance
+            df["Plate MAD distance"] = get_plate_distance(df, self.minmad)
+        # columns kept when the outliers are emptied
+        self._keep = ["Well", "Sample ID", "Rank"]
+        if self.sample_sheet is not None and len(df):
+            columns = list(df.columns)
+            df = self.sample_sheet.join(df)
+            self._keep += [x for x in df.columns if x not in columns]
         self.data = df
+        #: boolean masks over the rows of :attr:`data` (e.g. **outliers**
+        #: set by :meth:`filterout`)
+        self.masks = {}
+        #: the index of the input file (in :attr:`sources`) of each row
+        self.origins = np.repeat(np.arange(len(data)), [len(x) for x in data])
 
-    def to_csv(self, filename="results.csv"):
-        self.data.to_csv(filename, index=False)
+        if self.index is not None:
+            self.index.add_plate(self)
+        if self.history is not None:
+            self.history.add_plate(self)
 
-    def filterout(self):
-        """Remove entries that are outside the expected range.
+    def integrate(self, windows):
+        """Sum the concentrations and molarities within windows for all wells
 
-        To be used if the data is homogeneous to remove outliers;
+        ::
 
+            plate.integrate({"library": (300, 800), "dimers": (120, 160)})
 
+        :param windows: a window (lower, upper) in bp, a list of windows or a
+            dictionary of named windows. Bounds are inclusive.
+        :return: a dataframe with one row per well and window. Files whose
+            results were read from the cache are not included.
         """
-        # inplace
-        df = self.data
-        # Compute the MAD
-        from . import tools
-        peaks = df['Size (bp)'].dropna()
+        from .regions import RegionIndex
+        if getattr(self, "_regions", None) is None:
+            wells = [well for line in self.lines for well in line.wells]
+            self._regions = RegionIndex(wells)
+        return self._regions.integrate(windows)
 
-        mad = tools.get_mad(peaks)
-        if mad < self.minmad:
-            mad = self.minmad
+    def get_sizing_qc(self, cached=True):
+        """Return the sizing metrics of the wells of all input files
 
-        data = df['Size (bp)']
-        from .tools import nonemedian
-        med = nonemedian(data.dropna().values)
+        See :func:`~fragment_analyser.sizing.get_sizing_qc`.
 
-        mask1 = data < med -3*mad
-        mask2 = data > med + 3*mad
-        mask = np.logical_or(mask1, mask2) == True
+        :param cached: files whose results were read from the cache or the
+            journal are read again. If False, they are skipped.
+        :return: a dataframe with one row per well
+        """
+        frames = []
+        for filename, line in self.sources:
+            if line is None and cached is False:
+                continue
+            if line is None:
+                line = self.get_line(filename)
+            frames.append(line.get_sizing_qc().reset_index())
+        if len(frames) == 0:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
 
-        columns = df.columns
-        columns = [x for x in columns if x not in ['Sample ID', 'Well']]
-        df.loc[mask,columns] = None
+    def montage(self, filename=None, ncols=2):
+        """Draw the diagnostic of all lines in a single figure
 
-        self.data = df
+        See :func:`~fragment_analyser.montage.plot_montage`.
+
+        :return: the :class:`matplotlib.figure.Figure`
+        """
+        from .montage import plot_montage
+        return plot_montage(self, filename, ncols=ncols)
 
+    @property
+    def filtered(self):
+        """The results where the outliers found by :meth:`filterout` are
+        emptied (a copy of :attr:`data`). The well, sample ID, rank and the
+        columns of the sample sheet are kept."""
+        from .filters import apply_mask
+        if "outliers" not in self.masks:
+            return self.data.copy()
+        return apply_mask(self.data, self.masks["outliers"], keep=self._keep)
 
+    def to_csv(self, filename="results.csv", view=None):
+        """Save the results
+
+        :param view: all (:attr:`data`), filtered (outliers are emptied, see
+            :attr:`filtered`) or outliers (only the rows of the outliers).
+            By default, the filtered results once :meth:`filterout` was
+            called and all results otherwise.
+        """
+        if view is None:
+            view = "filtered" if "outliers" in self.masks else "all"
+        self.write_views(**{view: filename})
 
+    def write_views(self, all=None, filtered=None, outliers=None):
+        """Save several views of the results in a single pass
+
+        ::
+
+            plate.filterout()
+            plate.write_views(all="summary_all.csv",
+                              filtered="summary_filtered.csv")
+
+        See :func:`~fragment_analyser.filters.write_views`.
+        """
+        from .filters import write_views
+        write_views(self.data, self.masks.get("outliers"), all=all,
+                    filtered=filtered, outliers=outliers, keep=self._keep)
+
+    def filterout(self, by=None, method="mad", window=2):
+        """Find the entries that are outside the expected range.
+
+        To be used if the data is homogeneous to remove outliers;
+
+        The outliers are stored as a mask (**outliers** in :attr:`masks`);
+        :attr:`data` is not modified. Use :attr:`filtered` to get the
+        results without the outliers; :meth:`to_csv` then saves the
+        filtered results.
+
+        :param by: compute the median and MAD in groups of rows, e.g. "line"
+            for each input file, "row", "column", "prefix:3" or a column
+            name (see :mod:`~fragment_analyser.filters`). By default, all
+            rows are used. Rows of different **Rank** are always separated.
+        :param method: mad or hampel (see
+            :func:`~fragment_analyser.filters.get_outlier_mask`)
+        :param window: number of neighbours on each side (hampel method)
+        :return: the mask of the outliers
+        """
+        from .filters import filterout_plates
+        return filterout_plates([self], by=by, method=method, window=window,
+                                minmad=self.minmad,
+                                geometry=self.geometry)[0]
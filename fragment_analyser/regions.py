@@ -0,0 +1,127 @@
+#!/usr/bin/python
+"""Integration of concentrations and molarities over size windows
+
+Used by :meth:`Well.integrate`, :meth:`Line.integrate` and
+:meth:`Plate.integrate`::
+
+    from fragment_analyser import Line, fa_data
+    line = Line(fa_data("alternate/peaktable.csv"))
+    # library smear and adapter dimers
+    line.integrate({"library": (300, 800), "dimers": (120, 160)})
+
+"""
+import collections
+
+import numpy as np
+import pandas as pd
+
+
+#: quantities that are integrated (summed) over the windows
+quantities = ['ng/ul', 'nmole/L', 'amount (nM)']
+
+
+def get_windows(windows):
+    """Return the names, lower and upper bounds of a set of windows
+
+    :param windows: a single window (lower, upper), a list of windows or a
+        dictionary of named windows.
+    """
+    if isinstance(windows, dict):
+        names = list(windows.keys())
+        windows = list(windows.values())
+    else:
+        windows = list(windows)
+        if len(windows) == 2 and np.isscalar(windows[0]):
+            windows = [windows]
+        names = ["%s-%s" % (lower, upper) for lower, upper in windows]
+    bounds = np.array(windows, dtype=float).reshape(-1, 2)
+    if (bounds[:, 0] > bounds[:, 1]).any():
+        raise ValueError("lower bounds must be lower than upper bounds")
+    return names, bounds[:, 0], bounds[:, 1]
+
+
+class RegionIndex(object):
+    """Answer window queries over the peaks of many wells
+
+    The peaks of all wells are stored in flat arrays sorted by well and size
+    with the cumulative sums of the :data:`quantities`. The sum over any
+    window [lower, upper] (inclusive) of any well is then the difference of
+    two cumulative sums located by binary search (O(log n)), and all windows
+    of all wells are queried at once.
+
+    Peaks without size (e.g., ladder wells) are ignored.
+    """
+    def __init__(self, wells):
+        """.. rubric:: Constructor
+
+        :param wells: a list of :class:`~fragment_analyser.well.Well`
+        """
+        self.names = [well.name for well in wells]
+        self.sample_ids = [well.well_ID for well in wells]
+
+        columns = ['Size (bp)'] + quantities
+        frames = [well.df.reindex(columns=columns) for well in wells]
+        counts = [len(df) for df in frames]
+        if sum(counts):
+            df = pd.concat(frames).astype(float)
+        else:
+            df = pd.DataFrame(columns=columns, dtype=float)
+        well = np.repeat(np.arange(len(wells)), counts)
+        size = df['Size (bp)'].values
+        valid = ~np.isnan(size)
+        well, size = well[valid], size[valid]
+
+        # sizes are offset by well so that a single sorted array is used
+        self._span = (np.abs(size).max() if len(size) else 0) * 2 + 1
+        keys = well * self._span + size
+        order = np.argsort(keys, kind="mergesort")
+        self._keys = keys[order]
+
+        self._cumsums = {}
+        for name in quantities:
+            values = np.nan_to_num(df[name].values[valid][order])
+            self._cumsums[name] = np.concatenate([[0], np.cumsum(values)])
+
+    def __len__(self):
+        return len(self.names)
+
+    def query(self, lower, upper, wells=None):
+        """Return the integrated quantities for each well and window
+
+        :param lower: array of lower bounds (one per window)
+        :param upper: array of upper bounds (one per window)
+        :param wells: indices of the wells (default to all)
+        :return: a dictionary with the number of peaks (key **peaks**) and
+            the sum of each quantity as arrays of shape (wells, windows)
+        """
+        lower = np.clip(np.atleast_1d(lower).astype(float), -self._span/2, self._span/2)
+        upper = np.clip(np.atleast_1d(upper).astype(float), -self._span/2, self._span/2)
+        if wells is None:
+            wells = np.arange(len(self))
+        offsets = np.asarray(wells)[:, None] * self._span
+        start = np.searchsorted(self._keys, offsets + lower[None, :], side="left")
+        end = np.searchsorted(self._keys, offsets + upper[None, :], side="right")
+
+        results = collections.OrderedDict()
+        results["peaks"] = end - start
+        for name in quantities:
+            results[name] = self._cumsums[name][end] - self._cumsums[name][start]
+        return results
+
+    def integrate(self, windows):
+        """Return a dataframe with the quantities of each well and window
+
+        :param windows: see :func:`get_windows`
+        """
+        names, lower, upper = get_windows(windows)
+        results = self.query(lower, upper)
+        nwells, nwindows = len(self), len(names)
+        df = pd.DataFrame(collections.OrderedDict([
+            ("Well", np.repeat(self.names, nwindows)),
+            ("Sample ID", np.repeat(np.array(self.sample_ids, dtype=object), nwindows)),
+            ("Region", np.tile(names, nwells)),
+            ("lower", np.tile(lower, nwells)),
+            ("upper", np.tile(upper, nwells))]))
+        for key, values in results.items():
+            df[key] = values.ravel()
+        return df
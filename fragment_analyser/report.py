@@ -0,0 +1,224 @@
+#!/usr/bin/python
+"""SVG diagnostics and HTML report without plotting library
+
+The functions of this module render the same information as
+:meth:`Line.diagnostic` (selected peak of each well, median and 1, 2 and 3
+MAD bands) as SVG text, which is much faster than creating images with
+matplotlib::
+
+    from fragment_analyser import Plate, fa_data
+    from fragment_analyser.report import line_to_svg, write_report
+    plate = Plate([fa_data("alternate/peaktable.csv")])
+    plate.analyse()
+    svg = line_to_svg(plate.lines[0])
+    write_report(plate, "report.html")
+
+"""
+import math
+import os
+
+import numpy as np
+
+try:
+    from html import escape
+except ImportError: # python 2
+    from cgi import escape
+
+
+#: colors and widths (in MAD units) of the bands
+bands = [(3, "red"), (2, "orange"), (1, "green")]
+
+_svg = """<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" \
+viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="12">
+<rect x="{left}" y="{top}" width="{w}" height="{h}" fill="white" stroke="black"/>
+{grid}
+{bands}
+<line x1="{left}" x2="{right}" y1="{median:.2f}" y2="{median:.2f}" stroke="black" \
+stroke-width="2" stroke-dasharray="8,4"/>
+{peaks}
+{markers}
+{labels}
+<text x="{xlabel_x}" y="{xlabel_y}" text-anchor="middle">Wells' names</text>
+<text x="15" y="{ylabel_y}" text-anchor="middle" transform="rotate(-90 15 {ylabel_y})">Size bp</text>
+<g transform="translate({legend_x},{legend_y})">
+<rect width="130" height="40" fill="white" stroke="#999"/>
+<circle cx="15" cy="13" r="4" fill="red" stroke="blue"/>
+<text x="30" y="17">selected peak</text>
+<line x1="5" x2="25" y1="30" y2="30" stroke="black" stroke-width="2" stroke-dasharray="8,4"/>
+<text x="30" y="34">median</text>
+</g>
+{title}
+</svg>
+"""
+
+
+def get_diagnostic_data(line):
+    """Return the data shown by the diagnostic of a line
+
+    :return: a dictionary with the selected **peaks** (NaN when missing), the
+        well **names**, the **median** and the **mad** of the peaks and the
+        contiguous **chunks** of wells with a peak (list of start/end indices)
+    """
+    peaks = np.array([np.nan if x is None else x for x in line.get_peaks()],
+                     dtype=float)
+    valid = ~np.isnan(peaks)
+    median = line.guess_peak() if valid.any() else np.nan
+    mad = line.get_mad() if valid.any() else np.nan
+
+    edges = np.diff(np.concatenate([[0], valid.astype(int), [0]]))
+    starts = np.nonzero(edges == 1)[0]
+    ends = np.nonzero(edges == -1)[0] - 1
+    return {"peaks": peaks, "names": [well.name for well in line.wells],
+            "median": median, "mad": mad,
+            "chunks": list(zip(starts, ends))}
+
+
+def _get_ticks(ymax, n=5):
+    # nice ticks (1, 2 or 5 times a power of 10) between 0 and ymax
+    raw = ymax / float(n)
+    power = 10 ** math.floor(math.log10(raw))
+    step = min([x * power for x in (1, 2, 5, 10) if x * power >= raw])
+    return np.arange(0, ymax + step / 2., step)
+
+
+def line_to_svg(line, width=800, height=600, title=None, data=None):
+    """Return the diagnostic of a line as SVG text
+
+    :param line: a :class:`~fragment_analyser.line.Line`
+    :param title: optional title (e.g. the input filename)
+    :param data: the output of :func:`get_diagnostic_data` if already computed
+    """
+    if data is None:
+        data = get_diagnostic_data(line)
+    peaks, names = data["peaks"], data["names"]
+    median, mad = data["median"], data["mad"]
+    nwells = max(len(names), 1)
+
+    left, right, top, bottom = 70, width - 20, 40 if title else 20, height - 50
+    values = np.concatenate([peaks[~np.isnan(peaks)], [median]])
+    values = values[~np.isnan(values)]
+    ymax = 1.4 * values.max() if len(values) and values.max() > 0 else 1
+
+    def X(i):
+        return left + (np.asarray(i, dtype=float) + 0.5) / nwells * (right - left)
+
+    def Y(y):
+        return bottom - np.asarray(y, dtype=float) / ymax * (bottom - top)
+
+    def points(x, y):
+        return " ".join("%.2f,%.2f" % (a, b) for a, b in zip(X(x), Y(y)))
+
+    # grid and tick labels
+    grid, labels = [], []
+    for tick in _get_ticks(ymax):
+        y = Y(tick)
+        grid.append('<line x1="%s" x2="%s" y1="%.2f" y2="%.2f" stroke="#ccc" '
+                    'stroke-dasharray="2,2"/>' % (left, right, y, y))
+        labels.append('<text x="%s" y="%.2f" text-anchor="end">%g</text>'
+                      % (left - 5, y + 4, tick))
+    for i, name in enumerate(names):
+        x = X(i)
+        grid.append('<line x1="%.2f" x2="%.2f" y1="%s" y2="%s" stroke="#ccc" '
+                    'stroke-dasharray="2,2"/>' % (x, x, top, bottom))
+        labels.append('<text x="%.2f" y="%s" text-anchor="middle">%s</text>'
+                      % (x, bottom + 16, escape(str(name))))
+
+    # one path per band with a sub-path per chunk of contiguous wells
+    paths = dict((n, []) for n, color in bands)
+    if not np.isnan(mad):
+        for start, end in data["chunks"]:
+            x = np.arange(start, end + 1, dtype=float)
+            y = peaks[start:end + 1]
+            if len(x) == 1:
+                x, y = np.array([x[0] - 0.5, x[0] + 0.5]), np.array([y[0], y[0]])
+            else:
+                x = np.concatenate([[x[0] - 0.5], x, [x[-1] + 0.5]])
+                y = np.concatenate([[y[0]], y, [y[-1]]])
+            for n, color in bands:
+                upper = points(x, np.clip(y + n * mad, 0, ymax))
+                lower = points(x[::-1], np.clip(y[::-1] - n * mad, 0, ymax))
+                paths[n].append("M%s L%s Z" % (upper, lower))
+    svg_bands = "\n".join('<path d="%s" fill="%s" fill-opacity="0.5"/>'
+                          % (" ".join(paths[n]), color)
+                          for n, color in bands if paths[n])
+
+    valid = ~np.isnan(peaks)
+    index = np.arange(len(peaks))
+    markers = "\n".join('<circle cx="%.2f" cy="%.2f" r="4" fill="red" stroke="blue"/>'
+                        % (x, y) for x, y in zip(X(index[valid]), Y(peaks[valid])))
+    # the line is interrupted by missing peaks as with matplotlib
+    polylines = "\n".join(
+        '<polyline points="%s" fill="none" stroke="blue" stroke-width="1.5"/>'
+        % points(index[a:b + 1], peaks[a:b + 1]) for a, b in data["chunks"])
+
+    return _svg.format(width=width, height=height, left=left, top=top,
+        right=right, w=right - left, h=bottom - top, grid="\n".join(grid),
+        bands=svg_bands,
+        median=float(Y(median)) if not np.isnan(median) else -10.,
+        peaks=polylines, markers=markers,
+        labels="\n".join(labels),
+        xlabel_x=(left + right) / 2, xlabel_y=height - 12,
+        ylabel_y=(top + bottom) / 2, legend_x=right - 140, legend_y=top + 10,
+        title='<text x="%s" y="20" text-anchor="middle" font-size="14">%s</text>'
+              % ((left + right) / 2, escape(title)) if title else "")
+
+
+def save_svg(line, filename, title=None):
+    """Save the SVG diagnostic of a line in a file"""
+    with open(filename, "w") as fout:
+        fout.write(line_to_svg(line, title=title))
+
+
+_html = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{font-family: sans-serif; margin: 20px;}}
+table {{border-collapse: collapse; font-size: 12px;}}
+td, th {{border: 1px solid #ccc; padding: 2px 6px; text-align: right;}}
+.line {{display: inline-block; margin: 10px; text-align: center;}}
+.line img {{width: 600px;}}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<pre>{parameters}</pre>
+<h2>Diagnostics</h2>
+{images}
+<h2>Selected peaks</h2>
+{table}
+</body>
+</html>
+"""
+
+
+def write_report(plate, filename, images=None, title="Fragment Analyser report"):
+    """Write an HTML index of a plate
+
+    :param plate: a :class:`~fragment_analyser.plate.Plate`
+    :param filename: the HTML file
+    :param images: list of (input filename, image filename) to include. If
+        not provided, the SVG diagnostic of each line is included in the
+        HTML document directly.
+    """
+    if images is None:
+        items = ['<div class="line">%s</div>' % line_to_svg(line,
+                 title=os.path.basename(str(line.filename)))
+                 for line in plate.lines]
+    else:
+        directory = os.path.dirname(os.path.abspath(filename))
+        items = ['<div class="line"><img src="%s" alt="%s"/><br/>%s</div>' % (
+                 escape(os.path.relpath(os.path.abspath(image), directory)),
+                 escape(os.path.basename(source)), escape(os.path.basename(source)))
+                 for source, image in images]
+    if getattr(plate, "data", None) is not None:
+        # outliers are emptied if the plate was filtered
+        table = plate.filtered.to_html(index=False, na_rep="", border=0)
+    else:
+        table = "<p>Not analysed</p>"
+    with open(filename, "w") as fout:
+        fout.write(_html.format(title=escape(title),
+                   parameters=escape(str(plate)), images="\n".join(items),
+                   table=table))
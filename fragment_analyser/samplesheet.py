@@ -0,0 +1,183 @@
+#!/usr/bin/python
+"""Sample sheets joined to the results
+
+A sample sheet is a CSV (or tab-separated) file with a **Well** and/or a
+**Sample ID** column and any other information (project, library type...)::
+
+    Well,Sample ID,Project,Expected size (bp)
+    A1,BJ,P1,600
+    A2,BK,P1,580
+
+The rows of the sheet are added to the results and the expected size of each
+well replaces the guess of the peak position::
+
+    from fragment_analyser import Plate
+    from fragment_analyser.samplesheet import SampleSheet
+    plate = Plate(filenames, sample_sheet=SampleSheet("samples.csv"))
+    plate.analyse()
+
+or from the command line::
+
+    fragment_analyser --pattern "*.csv" --sample-sheet samples.csv
+
+Rows are matched on both the well and the sample ID if the sheet has both
+columns, then on the well alone (a sample ID is never matched on another
+well). Results without a row in the sheet, or matched on the well but with
+another sample ID, are reported in the log. The keys of the sheet are stored
+in hash indices built once so that large sheets are joined quickly.
+"""
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+class SampleSheet(object):
+    """Sample information keyed by well and/or sample ID
+
+    :param filename: a CSV file (tab-separated if the extension is .tsv or
+        .txt) or a dataframe
+    :param size_column: the column with the expected size of the products.
+        By default, the first of :attr:`size_columns` found in the sheet.
+    """
+    #: accepted names of the expected size column
+    size_columns = ["Expected size (bp)", "Expected size", "expected_size",
+                    "Expected Size (bp)"]
+
+    def __init__(self, filename, size_column=None):
+        if isinstance(filename, pd.DataFrame):
+            df = filename.copy()
+        else:
+            sep = "\t" if str(filename).endswith((".tsv", ".txt")) else ","
+            df = pd.read_csv(filename, sep=sep,
+                             dtype={"Well": str, "Sample ID": str})
+        df.columns = [x.strip() for x in df.columns]
+        self.filename = filename if isinstance(filename, str) else None
+
+        self.keys = [x for x in ["Well", "Sample ID"] if x in df.columns]
+        if len(self.keys) == 0:
+            raise ValueError("A sample sheet requires a Well or Sample ID column")
+        if "Well" in df.columns:
+            df["Well"] = df["Well"].astype(str).str.strip().str.upper()
+        if "Sample ID" in df.columns:
+            df["Sample ID"] = df["Sample ID"].astype(str).str.strip()
+        self.df = df.reset_index(drop=True)
+
+        if size_column is None:
+            size_column = [x for x in self.size_columns if x in df.columns]
+            size_column = size_column[0] if size_column else None
+        elif size_column not in df.columns:
+            raise ValueError("%s not found in the sample sheet" % size_column)
+        self.size_column = size_column
+
+        self._build_indices()
+
+    def _build_indices(self):
+        # hash indices (keys to row positions), the first row of duplicated
+        # keys is used
+        self._indices = {}
+        if len(self.keys) == 2:
+            candidates = [("Well", "Sample ID"), ("Well",)]
+        else:
+            candidates = [tuple(self.keys)]
+        for keys in candidates:
+            if len(keys) == 2:
+                index = pd.MultiIndex.from_arrays([self.df[key] for key in keys])
+            else:
+                index = pd.Index(self.df[keys[0]])
+            duplicated = index.duplicated()
+            if duplicated.any() and len(keys) == len(self.keys):
+                logger.warning("%s duplicated key(s) in the sample sheet "
+                               "(first rows used)" % duplicated.sum())
+            positions = np.nonzero(~duplicated)[0]
+            self._indices[keys] = (index[positions], positions)
+
+    def __len__(self):
+        return len(self.df)
+
+    def get_digest(self):
+        """Return a hash of the content of the sheet"""
+        sha = hashlib.sha1(self.df.to_csv(index=False).encode("utf-8"))
+        sha.update(str(self.size_column).encode("utf-8"))
+        return sha.hexdigest()
+
+    def lookup(self, wells, samples=None):
+        """Return the rows of the sheet matching wells and sample IDs
+
+        :param wells: list or array of well names
+        :param samples: list or array of sample IDs
+        :return: array of row positions in :attr:`df` (-1 if not found)
+        """
+        wells = pd.Series(wells, dtype=object).astype(str).str.strip().str.upper()
+        if samples is None:
+            samples = pd.Series([None] * len(wells), dtype=object)
+        else:
+            samples = pd.Series(samples, dtype=object).astype(str).str.strip()
+        found = np.full(len(wells), -1, dtype=int)
+        if len(self.df) == 0:
+            return found
+        values = {"Well": wells.values, "Sample ID": samples.values}
+        for keys, (index, positions) in self._indices.items():
+            missing = found < 0
+            if not missing.any():
+                break
+            if len(keys) == 2:
+                query = pd.MultiIndex.from_arrays([values[key][missing]
+                                                   for key in keys])
+            else:
+                query = pd.Index(values[keys[0]][missing])
+            indexer = index.get_indexer(query)
+            found[missing] = np.where(indexer >= 0, positions[indexer], -1)
+        return found
+
+    def get_guesses(self, wells):
+        """Return the expected size of a list of wells (NaN if unknown)
+
+        :param wells: list of :class:`~fragment_analyser.well.Well`
+        """
+        if self.size_column is None or len(self.df) == 0:
+            return np.full(len(wells), np.nan)
+        rows = self.lookup([well.name for well in wells],
+                           [well.well_ID for well in wells])
+        sizes = pd.to_numeric(self.df[self.size_column], errors="coerce").values
+        return np.where(rows >= 0, sizes[rows], np.nan)
+
+    def join(self, data):
+        """Return the results with the columns of the sample sheet appended
+
+        Columns already in the results are not added again. Rows without
+        match in the sheet get empty values.
+        """
+        rows = self.lookup(data["Well"].values, data["Sample ID"].values)
+        self._report(data, rows)
+        columns = [x for x in self.df.columns if x not in data.columns]
+        # -1 is not in the index of the sheet: missing rows are empty
+        extra = self.df[columns].reindex(rows)
+        extra.index = data.index
+        return pd.concat([data, extra], axis=1)
+
+    def _report(self, data, rows, max_items=10):
+        # wells of the results without a row in the sheet or matched on the
+        # well but with another sample ID
+        def _format(mask):
+            keys = data.loc[mask, ["Well", "Sample ID"]].drop_duplicates()
+            items = ["%s/%s" % (x, y) for x, y in keys.values[0:max_items]]
+            if len(keys) > max_items:
+                items.append("...")
+            return len(keys), ", ".join(items)
+
+        missing = rows < 0
+        if missing.any():
+            logger.warning("%s well(s) not found in the sample sheet: %s" %
+                           _format(missing))
+        if "Sample ID" in self.df.columns:
+            samples = data["Sample ID"].astype(str).str.strip().values
+            other = (rows >= 0) & \
+                (self.df["Sample ID"].values[np.maximum(rows, 0)] != samples)
+            if other.any():
+                logger.warning("%s well(s) matched on the well only (the sample "
+                               "ID of the sheet differs): %s" % _format(other))
@@ -0,0 +1,336 @@
+#!/usr/bin/python
+"""Local HTTP analysis service
+
+Start the service from the command line::
+
+    fragment_analyser serve --port 8080
+
+and query it with any HTTP client. Parsed lines are kept in memory (see
+:class:`LineCache`) so that the same file is parsed only once and can be
+re-analysed with other guess or sigma parameters at no cost.
+
+Endpoints:
+
+=================================== ========================================
+``POST /analyse``                   body is either the content of a peak
+                                    table or a JSON document with a
+                                    **filename** key (file on the server)
+``GET /lines/<id>/peaks``           selected peaks of a line
+``GET /lines/<id>/diagnostic``      PNG image of :meth:`Line.diagnostic`
+``POST /lines/<id>/rerun``          selected peaks with new parameters given
+                                    as a JSON document (guess, sigma)
+``GET /status``                     cache statistics
+=================================== ========================================
+
+Parameters (guess, sigma, method, lower_bound, upper_bound, geometry) may be
+provided in the query string (e.g., ``/lines/<id>/peaks?guess=500``). The
+identifier returned by ``/analyse`` depends on the file content and on the
+parameters used to read it (bounds and geometry).
+"""
+import argparse
+import collections
+import hashlib
+import io
+import json
+import threading
+
+import numpy as np
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError: # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+from .line import Line
+from .geometry import get_geometry
+from .strategies import strategies
+
+
+class LineCache(object):
+    """A size-bounded LRU cache of :class:`~fragment_analyser.line.Line`
+
+    ::
+
+        cache = LineCache(maxsize=2)
+        cache["a"] = line1
+        cache["b"] = line2
+        cache["a"]           # a is now the most recently used
+        cache["c"] = line3   # b is discarded
+
+    """
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                raise
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class AnalysisService(object):
+    """Analyse peak tables and keep the parsed lines in memory
+
+    This is the logic behind the HTTP server, which can also be used
+    directly::
+
+        from fragment_analyser import fa_data
+        from fragment_analyser.server import AnalysisService
+        service = AnalysisService()
+        key = service.load(filename=fa_data("alternate/peaktable.csv"))
+        service.get_peaks(key, guess=500)
+
+    """
+    def __init__(self, cache_size=32, sigma=50, lower_bound=120,
+                 upper_bound=6000, peak_mode="max", geometry=None):
+        self.cache = LineCache(cache_size)
+        self.sigma = sigma
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self.peak_mode = peak_mode
+        self.geometry = get_geometry(geometry)
+        # wells are updated with guess and sigma before selecting peaks, so
+        # analyses of the cached lines are serialised
+        self._lock = threading.Lock()
+
+    def _get_reader_parameters(self, lower_bound=None, upper_bound=None,
+                               geometry=None):
+        geometry = self.geometry if geometry is None else get_geometry(geometry)
+        return {
+            "lower_bound": self.lower_bound if lower_bound is None else float(lower_bound),
+            "upper_bound": self.upper_bound if upper_bound is None else float(upper_bound),
+            "geometry": "%sx%s" % (geometry.nlines, geometry.nwells)}
+
+    def get_key(self, data, **kwargs):
+        """Return the identifier of a file content read with some parameters"""
+        params = self._get_reader_parameters(**kwargs)
+        key = hashlib.sha1(data)
+        key.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return key.hexdigest()
+
+    def load(self, data=None, filename=None, **kwargs):
+        """Parse a peak table (unless already in the cache)
+
+        :param data: the content of a peak table (bytes)
+        :param filename: a peak table to read if data is not provided
+        :param kwargs: lower_bound, upper_bound and geometry
+        :return: the identifier of the line in the cache
+        """
+        if data is None:
+            with open(filename, "rb") as fin:
+                data = fin.read()
+        key = self.get_key(data, **kwargs)
+        if key not in self.cache:
+            params = self._get_reader_parameters(**kwargs)
+            line = Line(io.StringIO(data.decode("utf-8")), sigma=self.sigma,
+                        peak_mode=self.peak_mode, **params)
+            self.cache[key] = line
+        return key
+
+    def _get_line(self, key):
+        try:
+            return self.cache[key]
+        except KeyError:
+            raise KeyError("Unknown line %s. Analyse the file first" % key)
+
+    def _prepare(self, line, guess=None, sigma=None, method=None):
+        line.peak_mode = self.peak_mode if method is None else method
+        sigma = self.sigma if sigma is None else float(sigma)
+        for well in line.wells:
+            well.sigma = sigma
+            # the guess is computed from unweighted peaks
+            well.guess = None
+        if line.strategy.uses_guess:
+            line.set_guess(None if guess is None else float(guess))
+
+    def get_peaks(self, key, guess=None, sigma=None, method=None):
+        """Return the selected peak of each well of a line
+
+        :return: a list of dictionaries (one per well)
+        """
+        line = self._get_line(key)
+        with self._lock:
+            self._prepare(line, guess=guess, sigma=sigma, method=method)
+            df = line.get_selected_peaks()
+        if "Peak ID" in df.columns:
+            df = df.drop("Peak ID", axis=1)
+        # NaN are not valid JSON
+        df = df.astype(object).where(df.notnull(), None)
+        return df.to_dict(orient="records")
+
+    def get_diagnostic(self, key, guess=None, sigma=None, method=None):
+        """Return the diagnostic image of a line (PNG content)"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        line = self._get_line(key)
+        fig = Figure()
+        with self._lock:
+            self._prepare(line, guess=guess, sigma=sigma, method=method)
+            line.diagnostic(ax=fig.add_subplot(111))
+        buf = io.BytesIO()
+        FigureCanvasAgg(fig).print_png(buf)
+        return buf.getvalue()
+
+    def get_status(self):
+        return {"cached": len(self.cache), "maxsize": self.cache.maxsize,
+                "hits": self.cache.hits, "misses": self.cache.misses}
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    """HTTP front-end of :class:`AnalysisService`"""
+    service = None
+
+    def _send(self, content, status=200, content_type="application/json"):
+        if content_type == "application/json":
+            content = json.dumps(content, default=_to_json).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _get_request(self):
+        url = urlparse(self.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        parts = [x for x in url.path.split("/") if x]
+        return parts, params
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _handle(self, method):
+        parts, params = self._get_request()
+        try:
+            if method == "POST":
+                body = self._read_body()
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params.update(json.loads(body.decode("utf-8")))
+                    body = None
+            analysis = dict((k, params.get(k)) for k in ("guess", "sigma", "method"))
+            reader = dict((k, params.get(k)) for k in
+                          ("lower_bound", "upper_bound", "geometry"))
+
+            if method == "GET" and parts == ["status"]:
+                self._send(self.service.get_status())
+            elif method == "POST" and parts == ["analyse"]:
+                key = self.service.load(data=body or None,
+                    filename=params.get("filename"), **reader)
+                self._send({"id": key,
+                            "wells": self.service.get_peaks(key, **analysis)})
+            elif len(parts) == 3 and parts[0] == "lines":
+                key, action = parts[1], parts[2]
+                if action == "peaks" and method == "GET" or \
+                        action == "rerun" and method == "POST":
+                    self._send({"id": key,
+                                "wells": self.service.get_peaks(key, **analysis)})
+                elif action == "diagnostic" and method == "GET":
+                    self._send(self.service.get_diagnostic(key, **analysis),
+                               content_type="image/png")
+                else:
+                    self._send({"error": "unknown endpoint"}, status=404)
+            else:
+                self._send({"error": "unknown endpoint"}, status=404)
+        except KeyError as err:
+            self._send({"error": str(err)}, status=404)
+        except Exception as err:
+            self._send({"error": str(err)}, status=400)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def _to_json(x):
+    # numpy scalars are not serialisable by the json module
+    if isinstance(x, np.generic):
+        return x.item()
+    raise TypeError(repr(x))
+
+
+def get_server(host="127.0.0.1", port=8080, **kwargs):
+    """Return a HTTP server (not started) for a new :class:`AnalysisService`
+
+    :param kwargs: parameters of :class:`AnalysisService`
+    """
+    handler = type("Handler", (AnalysisHandler,),
+                   {"service": AnalysisService(**kwargs)})
+    return _ThreadingHTTPServer((host, port), handler)
+
+
+class Options(argparse.ArgumentParser):
+    def __init__(self, prog="fragment_analyser serve"):
+        usage = """
+
+    fragment_analyser serve --port 8080
+    curl --data-binary @peaktable.csv http://127.0.0.1:8080/analyse
+        """
+        super(Options, self).__init__(usage=usage, prog=prog,
+            description="Local HTTP service to analyse Fragment Analyser files",
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument("--host", default="127.0.0.1", type=str,
+                          help="Defaults to 127.0.0.1 (local connections only)")
+        self.add_argument("--port", default=8080, type=int)
+        self.add_argument("--cache-size", default=32, type=int,
+                          help="Number of parsed files kept in memory")
+        self.add_argument('-l', "--lower-bound", default=120, type=int)
+        self.add_argument('-u', "--upper-bound", default=6000, type=int)
+        self.add_argument("-s", "--sigma", default=50, type=float)
+        self.add_argument("-m", "--method", default="max", type=str,
+                          choices=sorted(strategies))
+        self.add_argument("--geometry", default="96", type=str)
+
+
+def main(args):
+    """Entry point of ``fragment_analyser serve``"""
+    options = Options().parse_args(args[1:])
+    server = get_server(options.host, options.port,
+                        cache_size=options.cache_size, sigma=options.sigma,
+                        lower_bound=options.lower_bound,
+                        upper_bound=options.upper_bound,
+                        peak_mode=options.method, geometry=options.geometry)
+    print("Serving on http://%s:%s" % server.server_address[0:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+"""Split an analysis across nodes and merge the results
+
+With **--shard i/N**, the standalone application analyses the i-th slice
+(starting at 1) of the sorted input files and saves its results in a shard
+file instead of the summary files, e.g. with a SLURM array job::
+
+    fragment_analyser --pattern "*.csv" --shard ${SLURM_ARRAY_TASK_ID}/10
+
+The outliers of the filtered summary (and the Plate MAD distance of
+--confidence) depend on the median and MAD of all wells, so the shards are
+merged once all of them are available::
+
+    fragment_analyser merge summary.shard-*-of-10.pkl
+
+which creates the same summary files as a run on a single node: files
+matched by a pattern are processed in sorted order in both cases (a list of
+files is processed in the given order on a single node, so give it sorted).
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from .tools import get_outlier_bounds
+from .filters import write_views
+
+
+def parse_shard(shard):
+    """Return (index, count) from a string such as **2/10**"""
+    try:
+        index, count = [int(x) for x in shard.split("/")]
+    except ValueError:
+        raise ValueError("Invalid shard %s (expected i/N e.g. 1/10)" % shard)
+    if count < 1 or index < 1 or index > count:
+        raise ValueError("Invalid shard %s (expected 1 <= i <= N)" % shard)
+    return index, count
+
+
+def get_shard(filenames, index, count):
+    """Return the input files of a shard
+
+    Files are sorted and split into **count** contiguous slices of (almost)
+    equal size so that all nodes agree on the split and the order of the
+    merged results.
+
+    :param index: the shard (starting at 1)
+    :param count: the number of shards
+    """
+    filenames = sorted(filenames)
+    bounds = np.linspace(0, len(filenames), count + 1).round().astype(int)
+    return filenames[bounds[index - 1]:bounds[index]]
+
+
+def get_shard_filename(output, tag, index, count):
+    """Return the name of the file where a shard is saved"""
+    lhs = output.replace(".csv", "_%s" % tag if tag else "")
+    return "%s.shard-%s-of-%s.pkl" % (lhs, index, count)
+
+
+def get_statistics(data, column="Size (bp)", by=None):
+    """Return the values needed to compute the outliers of merged shards
+
+    :return: a dictionary with the valid values of **column** for each
+        group (a single group None if **by** is not set)
+    """
+    if by is None:
+        return {None: data[column].dropna().values}
+    return dict((value, data[column][(data[by] == value).values].dropna().values)
+                for value in data[by].dropna().unique())
+
+
+def save_shard(filename, data, index, count, filenames, filter=True,
+               minmad=25, precision=None):
+    """Save the results of a shard
+
+    :param data: the results (e.g. :attr:`Plate.data`)
+    :param filenames: the input files of the shard
+    :param filter: whether the outliers are filtered once merged
+    :param precision: number of decimals of the values computed by the merge
+    """
+    by = "Rank" if "Rank" in data.columns else None
+    shard = {"index": index, "count": count, "filenames": list(filenames),
+             "data": data, "filter": filter, "minmad": minmad, "by": by,
+             "precision": precision,
+             "statistics": get_statistics(data, by=by)}
+    pd.to_pickle(shard, filename + ".tmp")
+    os.replace(filename + ".tmp", filename)
+
+
+def merge_shards(filenames):
+    """Merge the shards saved by :func:`save_shard`
+
+    The Plate MAD distance (if any) is computed again over all shards.
+
+    :return: the results of all shards and the mask of the outliers (None
+        if the shards were analysed without filtering)
+    """
+    shards = [pd.read_pickle(filename) for filename in filenames]
+    if len(shards) == 0:
+        raise ValueError("No shard to merge")
+    count = shards[0]["count"]
+    indices = sorted(shard["index"] for shard in shards)
+    if indices != list(range(1, count + 1)):
+        missing = sorted(set(range(1, count + 1)) - set(indices))
+        raise ValueError("Expected shards 1 to %s once (missing: %s)" %
+                         (count, missing))
+    for key in ["count", "filter", "minmad", "by", "precision"]:
+        if len(set(shard[key] for shard in shards)) != 1:
+            raise ValueError("Shards were analysed with different %s" % key)
+
+    shards.sort(key=lambda shard: shard["index"])
+    frames = [shard["data"] for shard in shards if len(shard["data"].columns)]
+    if frames:
+        data = pd.concat(frames)
+    else:
+        data = pd.DataFrame()
+    data.reset_index(inplace=True, drop=True)
+
+    by, minmad = shards[0]["by"], shards[0]["minmad"]
+    if "Plate MAD distance" in data.columns:
+        from .confidence import get_plate_distance
+        distance = get_plate_distance(data, minmad)
+        if shards[0]["precision"] is not None:
+            distance = distance.round(shards[0]["precision"])
+        data["Plate MAD distance"] = distance
+
+    if shards[0]["filter"] is False:
+        return data, None
+    if len(data) == 0:
+        return data, np.zeros(0, dtype=bool)
+
+    # global thresholds from the statistics of all shards
+    groups = set(key for shard in shards for key in shard["statistics"])
+    bounds = {}
+    for group in groups:
+        values = np.concatenate([shard["statistics"][group] for shard in shards
+                                 if group in shard["statistics"]])
+        bounds[group] = get_outlier_bounds(pd.Series(values), minmad=minmad)
+    if by is None:
+        lower, upper = bounds[None]
+    else:
+        lower = data[by].map(dict((k, v[0]) for k, v in bounds.items()))
+        upper = data[by].map(dict((k, v[1]) for k, v in bounds.items()))
+    values = data["Size (bp)"].astype(float)
+    mask = ((values < lower) | (values > upper)).values
+    return data, mask
+
+
+class Options(argparse.ArgumentParser):
+    def __init__(self, prog="fragment_analyser merge"):
+        usage = """
+
+    fragment_analyser merge summary.shard-*-of-10.pkl
+    fragment_analyser merge --tag test summary_test.shard-*-of-10.pkl
+        """
+        super(Options, self).__init__(usage=usage, prog=prog,
+            description="Merge the shards created with --shard",
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument("shards", nargs="+", type=str,
+                          help="The shard files")
+        self.add_argument("-o", "--output", type=str, default="summary.csv",
+                          help="The name of the output CSV file. Defaults to summary.csv")
+        self.add_argument("-t", "--tag", type=str, default="",
+                          help="A tag as given to the analysis")
+
+
+def main(args):
+    """Entry point of ``fragment_analyser merge``"""
+    from .pipelines import get_output_filenames
+    options = Options().parse_args(args[1:])
+    data, mask = merge_shards(options.shards)
+    all_filename, filtered_filename = get_output_filenames(options.output,
+                                                           options.tag)
+    if mask is None:
+        outliers_filename = None
+    else:
+        outliers_filename = filtered_filename.replace("_filtered", "_outliers")
+    write_views(data, mask, all=all_filename, filtered=filtered_filename,
+                outliers=outliers_filename)
+    print("Merged %s shard(s) (%s rows) into %s and %s" % (
+          len(options.shards), len(data), all_filename, filtered_filename))
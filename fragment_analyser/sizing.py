@@ -0,0 +1,173 @@
+#!/usr/bin/python
+"""Sizing quality of the capillaries and recalibration of the sizes
+
+Each capillary runs a lower and an upper marker of known sizes (1 and 6000 bp,
+the **(LM)** and **(UM)** rows of the peak tables). They are not quantified
+(see :class:`~fragment_analyser.well.Well`) but their measured size (**Avg.
+Size** column) tells how well the capillary was sized. The markers of all
+wells are gathered into 2D arrays (one row per well) so that the metrics and
+corrections of a whole run are computed at once::
+
+    from fragment_analyser import Line, fa_data
+    from fragment_analyser.sizing import get_sizing_qc, recalibrate
+    line = Line(fa_data("alternate/peaktable.csv"))
+    get_sizing_qc(line.wells)
+    recalibrate(line.wells)
+
+The recalibration is a linear correction per capillary that maps the
+measured sizes of the markers onto their nominal sizes. It is applied to the
+sizes of the peaks of each well. Wells without two valid markers are not
+corrected.
+
+From the command line::
+
+    fragment_analyser --pattern "*.csv" --recalibrate --sizing-qc
+
+"""
+import numpy as np
+import pandas as pd
+
+from .batch import pad_wells
+
+
+#: the columns with sizes corrected by :func:`recalibrate`
+size_columns = ["Size (bp)", "Avg. Size"]
+
+
+def get_markers(wells):
+    """Return the nominal and measured sizes of the markers of the wells
+
+    A marker is a lower marker if its nominal size is below the lower bound
+    of the well, an upper marker otherwise.
+
+    :param wells: list of :class:`~fragment_analyser.well.Well`
+    :return: nominal and measured sizes, two arrays of shape (number of
+        wells, 2) with the lower marker in the first column and the upper
+        marker in the second one. Missing markers are NaN.
+    """
+    nominal = np.full((len(wells), 2), np.nan)
+    measured = np.full((len(wells), 2), np.nan)
+    frames = [well.markers for well in wells]
+    counts = [len(x) for x in frames]
+    if sum(counts) == 0:
+        return nominal, measured
+
+    df = pd.concat(frames)
+    number = np.repeat(np.arange(len(wells)), counts)
+    sizes = pd.to_numeric(df["Size (bp)"], errors="coerce").values
+    if "Avg. Size" in df.columns:
+        averages = pd.to_numeric(df["Avg. Size"], errors="coerce").values
+    else:
+        # Oct 2016 format
+        averages = np.full(len(df), np.nan)
+    bounds = np.array([well.lower_bp_filter for well in wells], dtype=float)
+    upper = (sizes > bounds[number]).astype(int)
+
+    # with several markers of a kind, the one closest to the sizing range
+    # is kept (the last one assigned)
+    order = np.lexsort((np.where(upper, -sizes, sizes), number))
+    number, upper = number[order], upper[order]
+    nominal[number, upper] = sizes[order]
+    measured[number, upper] = averages[order]
+    return nominal, measured
+
+
+def get_correction(nominal, measured):
+    """Return the linear correction of each well
+
+    The corrected size is slope * size + offset, where slope and offset map
+    the measured sizes of the markers onto their nominal sizes.
+
+    :param nominal: nominal sizes (see :func:`get_markers`)
+    :param measured: measured sizes (see :func:`get_markers`)
+    :return: slope and offset arrays. Wells without two valid markers get a
+        slope of 1 and an offset of 0.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (nominal[:, 1] - nominal[:, 0]) / (measured[:, 1] - measured[:, 0])
+        offset = nominal[:, 0] - slope * measured[:, 0]
+    valid = np.isfinite(slope) & np.isfinite(offset) & (slope > 0)
+    return np.where(valid, slope, 1.), np.where(valid, offset, 0.)
+
+
+def get_ladder_errors(wells):
+    """Return the mean and maximum relative errors of the ladders
+
+    The error of a fragment of the ladder is the difference between its
+    measured (**Avg. Size**) and nominal (**Size (bp)**) sizes divided by
+    the nominal size.
+
+    :return: mean absolute and maximum absolute errors in percent (NaN for
+        wells that are not ladders)
+    """
+    mean = np.full(len(wells), np.nan)
+    maximum = np.full(len(wells), np.nan)
+    frames = [well.ladder for well in wells if well.ladder is not None]
+    if len(frames) == 0 or "Avg. Size" not in frames[0].columns:
+        return mean, maximum
+    ladders = [i for i, well in enumerate(wells) if well.ladder is not None]
+    df = pd.concat(frames)
+    number = np.repeat(ladders, [len(x) for x in frames])
+    sizes = pd.to_numeric(df["Size (bp)"], errors="coerce").values
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors = np.abs(pd.to_numeric(df["Avg. Size"], errors="coerce").values
+                        - sizes) / sizes * 100
+    errors = pd.Series(np.where(sizes > 0, errors, np.nan)).groupby(number)
+    mean[ladders] = errors.mean().reindex(ladders).values
+    maximum[ladders] = errors.max().reindex(ladders).values
+    return mean, maximum
+
+
+def get_sizing_qc(wells):
+    """Return the sizing metrics of each well
+
+    :param wells: list of :class:`~fragment_analyser.well.Well`
+    :return: a dataframe indexed by the well names with the **Sample ID**,
+        nominal and measured sizes of the lower (**LM**) and upper (**UM**)
+        markers, their errors (measured - nominal, in bp and in percent of
+        the nominal size), the **Slope** and **Offset** of the correction
+        (see :func:`get_correction`) and, for ladders, the mean and maximum
+        errors of the fragments (see :func:`get_ladder_errors`)
+    """
+    nominal, measured = get_markers(wells)
+    errors = measured - nominal
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = errors / nominal * 100
+    slope, offset = get_correction(nominal, measured)
+    ladder_mean, ladder_max = get_ladder_errors(wells)
+    return pd.DataFrame({
+        "Sample ID": [well.well_ID for well in wells],
+        "LM size": nominal[:, 0], "LM measured": measured[:, 0],
+        "LM error (bp)": errors[:, 0],
+        "UM size": nominal[:, 1], "UM measured": measured[:, 1],
+        "UM error (bp)": errors[:, 1], "UM error (%)": relative[:, 1],
+        "Slope": slope, "Offset": offset,
+        "Ladder error (%)": ladder_mean, "Ladder max error (%)": ladder_max},
+        index=pd.Index([well.name for well in wells], name="Well"))
+
+
+def recalibrate(wells):
+    """Correct the sizes of the peaks of the wells
+
+    The correction of each well (see :func:`get_correction`) is applied to
+    the :attr:`size_columns` of :attr:`Well.df` and the molarities
+    (**amount (nM)**) are computed again. The markers and ladders are not
+    modified.
+
+    :param wells: list of :class:`~fragment_analyser.well.Well`
+    :return: slope and offset of each well
+    """
+    slope, offset = get_correction(*get_markers(wells))
+    lengths = [len(well.df) for well in wells]
+    for column in size_columns:
+        if not all(column in well.df.columns for well in wells if len(well.df)):
+            continue
+        sizes = pad_wells(wells, column)[1] * slope[:, None] + offset[:, None]
+        for i, well in enumerate(wells):
+            if lengths[i] and well.ladder is None:
+                well.df[column] = sizes[i, :lengths[i]]
+    for well in wells:
+        if len(well.df) and well.ladder is None:
+            well.df["amount (nM)"] = well.df["ng/ul"].values * 1000. / (
+                well.df["Size (bp)"].values * well.mw_dna / 1000.)
+    return slope, offset
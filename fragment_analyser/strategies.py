@@ -0,0 +1,285 @@
+#!/usr/bin/python
+"""Peak selection strategies
+
+A strategy selects one peak in each well. It works on the peaks of all the
+wells of a line at once (flat arrays, see :class:`WellBatch`) so that any
+rule runs at the speed of the built-in ones. The strategies are registered
+by name in :attr:`strategies`:
+
+=============== ==============================================================
+max             highest RFU weighted by a gaussian centered on the guess of
+                the well (the default)
+concentration   highest % (Conc.), not weighted
+closest         closest to the guess of the well (highest RFU if not set)
+area            highest concentration (ng/ul, proportional to the area)
+                within a window: guess +/- 3 sigma by default
+molarity        highest molarity (nmole/L)
+=============== ==============================================================
+
+Strategies are given by name or as instances to
+:class:`~fragment_analyser.plate.Plate` (**peak_mode** parameter) and on the
+command line (--method)::
+
+    from fragment_analyser import Plate
+    from fragment_analyser.strategies import AreaStrategy
+    plate = Plate(filenames, peak_mode="closest")
+    plate = Plate(filenames, peak_mode=AreaStrategy(window=(300, 800)))
+
+A new rule is a subclass of :class:`Strategy` that implements
+:meth:`Strategy.get_scores` and is registered with
+:func:`register_strategy`::
+
+    from fragment_analyser.strategies import Strategy, register_strategy
+
+    @register_strategy
+    class Smallest(Strategy):
+        name = "smallest"
+        def get_scores(self, batch):
+            return -batch.sizes
+"""
+import copy
+
+import numpy as np
+
+from .kernels import flatten_wells, segmented_argmax
+
+
+class WellBatch(object):
+    """The peaks of a list of wells as flat arrays
+
+    The peaks of well i are the items :attr:`offsets` [i] to :attr:`offsets`
+    [i + 1] of the arrays (see :func:`~fragment_analyser.kernels.flatten_wells`).
+
+    :param wells: list of :class:`~fragment_analyser.well.Well`
+    """
+    def __init__(self, wells):
+        self.wells = wells
+        self.sizes, rfu, self.offsets = flatten_wells(wells)
+        self._columns = {"RFU": rfu}
+        #: the guess of each well (NaN if not set)
+        self.guesses = np.array([np.nan if well.guess is None else well.guess
+                                 for well in wells], dtype=float)
+        #: the sigma of each well
+        self.sigmas = np.array([well.sigma for well in wells], dtype=float)
+        #: the well of each peak
+        self.segments = np.repeat(np.arange(len(wells)), np.diff(self.offsets))
+
+    def __len__(self):
+        return len(self.wells)
+
+    def with_guesses(self, guesses):
+        """Return a copy of the batch where the guess of the wells is
+        replaced (a value for all wells or one value per well)"""
+        batch = copy.copy(self)
+        batch.guesses = np.zeros(len(self)) + np.asarray(guesses, dtype=float)
+        return batch
+
+    def with_sigmas(self, sigmas):
+        """Return a copy of the batch where the sigma of the wells is
+        replaced (a value for all wells or one value per well)"""
+        batch = copy.copy(self)
+        batch.sigmas = np.zeros(len(self)) + np.asarray(sigmas, dtype=float)
+        return batch
+
+    def get_weights(self):
+        """Return the weight of each peak: a gaussian centered on the guess
+        of its well (NaN if the well has no guess)"""
+        guesses = self.guesses[self.segments]
+        return np.exp(-0.5 * ((guesses - self.sizes) /
+                              self.sigmas[self.segments]) ** 2)
+
+    def get_column(self, column):
+        """Return the values of a column of the peaks (flat array)"""
+        if column not in self._columns:
+            self._columns[column] = flatten_wells(self.wells, column)[1]
+        return self._columns[column]
+
+
+class Strategy(object):
+    """Base class of the peak selection strategies
+
+    Subclasses implement :meth:`get_scores`: the best score of each well is
+    selected and, when several peaks per well are reported, the peaks are
+    ranked by their score (see
+    :func:`~fragment_analyser.batch.get_top_peaks`). :meth:`select` may be
+    overridden with a faster implementation that gives the same results.
+    """
+    #: name of the strategy in :attr:`strategies`
+    name = None
+    #: the guess of the wells is set from the median of the selected peaks
+    #: of the line (and outliers are filtered) as with the max strategy
+    uses_guess = False
+    #: the main column of the scores
+    column = "RFU"
+    #: peaks without size may be selected
+    requires_size = True
+
+    def __repr__(self):
+        # the parameters of the instance are part of the representation,
+        # which is used in the key of the cached results
+        params = sorted(vars(self).items())
+        if len(params) == 0:
+            return str(self.name)
+        return "%s(%s)" % (self.name, ", ".join("%s=%r" % x for x in params))
+
+    def get_scores(self, batch):
+        """Return the score of each peak (NaN to ignore a peak)
+
+        :param batch: a :class:`WellBatch`
+        """
+        raise NotImplementedError
+
+    def get_valid_scores(self, batch):
+        """Return the scores with -inf for the peaks that cannot be selected
+        (missing score, or missing size if :attr:`requires_size`)"""
+        scores = np.array(self.get_scores(batch), dtype=float)
+        invalid = np.isnan(scores)
+        if self.requires_size:
+            invalid |= np.isnan(batch.sizes)
+        scores[invalid] = -np.inf
+        return scores
+
+    def get_product_scores(self, batch, guess):
+        """Return the scores of the peaks for a product expected at **guess**
+
+        Strategies that use a guess score the peaks as if **guess** was the
+        guess of all wells; the scores of the others are weighted by a
+        gaussian centered on **guess**. -inf for peaks that cannot be
+        selected.
+        """
+        if self.uses_guess:
+            return self.get_valid_scores(batch.with_guesses(guess))
+        scores = self.get_valid_scores(batch)
+        scores = scores * batch.with_guesses(guess).get_weights()
+        scores[np.isnan(scores)] = -np.inf
+        return scores
+
+    def select(self, batch):
+        """Return the position of the selected peak within each well
+
+        :param batch: a :class:`WellBatch`
+        :return: array of positions (-1 if no peak is selected)
+        """
+        scores = np.asarray(self.get_scores(batch), dtype=float)
+        sizes = batch.sizes if self.requires_size else np.zeros(len(scores))
+        # unweighted: the highest score of each well (the first one if tied)
+        return segmented_argmax(sizes, scores, batch.offsets,
+                                np.full(len(batch), np.nan), np.ones(len(batch)))
+
+    def get_indices(self, wells):
+        """Return the index (label in :attr:`Well.df`) of the selected peak
+        of each well (None if no peak is selected)"""
+        positions = self.select(WellBatch(wells))
+        return [None if i < 0 else well.df.index[i]
+                for well, i in zip(wells, positions)]
+
+
+#: the registered strategies keyed by name
+strategies = {}
+
+
+def register_strategy(strategy):
+    """Register a :class:`Strategy` subclass under its name (decorator)"""
+    strategies[strategy.name] = strategy
+    return strategy
+
+
+def get_strategy(strategy=None):
+    """Return a strategy given its name
+
+    :param strategy: None (max), the name of a registered strategy or a
+        :class:`Strategy` instance (returned as is)
+    """
+    if strategy is None:
+        strategy = "max"
+    if isinstance(strategy, Strategy):
+        return strategy
+    try:
+        return strategies[strategy]()
+    except KeyError:
+        raise ValueError("Unknown strategy %s (%s)" % (strategy,
+                         ", ".join(sorted(strategies))))
+
+
+@register_strategy
+class MaxStrategy(Strategy):
+    """Highest RFU weighted by a gaussian centered on the guess of the well
+
+    See :meth:`Well.get_peak_and_index`.
+    """
+    name = "max"
+    uses_guess = True
+
+    def get_scores(self, batch):
+        rfu = batch.get_column("RFU")
+        return np.where(np.isnan(batch.guesses[batch.segments]), rfu,
+                        rfu * batch.get_weights())
+
+    def select(self, batch):
+        # same results as get_scores, compiled if numba is installed
+        return segmented_argmax(batch.sizes, batch.get_column("RFU"),
+                                batch.offsets, batch.guesses, batch.sigmas)
+
+
+@register_strategy
+class ConcentrationStrategy(Strategy):
+    """Highest % (Conc.) of each well (whatever its size)"""
+    name = "concentration"
+    column = "% (Conc.)"
+    requires_size = False
+
+    def get_scores(self, batch):
+        return batch.get_column("% (Conc.)")
+
+
+@register_strategy
+class ClosestStrategy(Strategy):
+    """Peak closest to the guess of the well
+
+    Wells without guess get their highest peak (RFU).
+    """
+    name = "closest"
+    uses_guess = True
+
+    def get_scores(self, batch):
+        guesses = batch.guesses[batch.segments]
+        distance = -np.abs(batch.sizes - guesses)
+        return np.where(np.isnan(guesses), batch.get_column("RFU"), distance)
+
+
+@register_strategy
+class AreaStrategy(Strategy):
+    """Highest concentration (ng/ul) within a window
+
+    :param window: (lower, upper) bounds in bp (inclusive). By default,
+        the guess of each well +/- **nsigma** times its sigma (the whole
+        well if there is no guess).
+    """
+    name = "area"
+    uses_guess = True
+    column = "ng/ul"
+
+    def __init__(self, window=None, nsigma=3):
+        self.window = window
+        self.nsigma = nsigma
+
+    def get_scores(self, batch):
+        if self.window is None:
+            guesses = batch.guesses[batch.segments]
+            width = self.nsigma * batch.sigmas[batch.segments]
+            lower = np.where(np.isnan(guesses), -np.inf, guesses - width)
+            upper = np.where(np.isnan(guesses), np.inf, guesses + width)
+        else:
+            lower, upper = self.window
+        inside = (batch.sizes >= lower) & (batch.sizes <= upper)
+        return np.where(inside, batch.get_column("ng/ul"), np.nan)
+
+
+@register_strategy
+class MolarityStrategy(Strategy):
+    """Highest molarity (nmole/L)"""
+    name = "molarity"
+    column = "nmole/L"
+
+    def get_scores(self, batch):
+        return batch.get_column("nmole/L")
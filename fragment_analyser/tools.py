@@ -15,6 +15,18 @@ def get_mad(data):
     return mad
 
 
+def get_outlier_bounds(values, minmad=25, nmad=3):
+    """Return the range of values that are not outliers
 
+    :param values: a series of values (None/NaN are ignored)
+    :return: median - nmad * MAD and median + nmad * MAD, with a MAD of at
+        least **minmad**
+    """
+    peaks = values.dropna()
 
+    mad = get_mad(peaks)
+    if mad < minmad:
+        mad = minmad
 
+    med = nonemedian(peaks.values)
+    return med - nmad*mad, med + nmad*mad
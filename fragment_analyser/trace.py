@@ -0,0 +1,301 @@
+#!/usr/bin/python
+"""Raw electropherogram traces and peak calling
+
+The Fragment Analyser software exports the raw traces (RFU as a function of
+the size) of a run as a CSV file with one column per well::
+
+    Size (bp),A1: sample1,A2: sample2,A3: Ladder
+    0.12,512,498,530
+    0.31,515,501,528
+    ...
+
+:class:`TraceReader` reads those files and calls the peaks of all wells
+at once (see :func:`call_peaks`) to build a peak table with the same columns
+as the tables exported by the instrument, so that traces can be used
+wherever peak tables are expected::
+
+    from fragment_analyser import Line
+    line = Line("electropherogram.csv")
+
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError: # numpy < 1.20
+    sliding_window_view = None
+
+from .geometry import get_geometry
+
+
+#: columns of a peak table (see :class:`~fragment_analyser.peaktable.PeakTableReader`)
+columns = ['Well', 'Sample ID', 'Peak ID', 'Size (bp)', '% (Conc.)',
+           'nmole/L', 'ng/ul', 'RFU', 'Avg. Size', 'TIC (ng/ul)',
+           'TIM (nmole/L)', 'Total Conc. (ng/ul)']
+
+
+def _windows(y, before, after):
+    # view of shape (ntraces, npoints, before+after+1) with the neighbours of
+    # each point. Edges are padded with the first/last values
+    padded = np.pad(y, [(0, 0), (before, after)], mode="edge")
+    if sliding_window_view is not None:
+        return sliding_window_view(padded, before + after + 1, axis=1)
+    shape = y.shape + (before + after + 1,)
+    strides = padded.strides + (padded.strides[1],)
+    return np.lib.stride_tricks.as_strided(padded, shape, strides,
+                                           writeable=False)
+
+
+def smooth(y, window):
+    """Moving average of each trace (rows of y) over an odd window"""
+    half = window // 2
+    if half < 1:
+        return y.astype(float)
+    padded = np.pad(y.astype(float), [(0, 0), (half, half)], mode="edge")
+    cumsum = np.cumsum(padded, axis=1)
+    cumsum = np.concatenate([np.zeros((len(y), 1)), cumsum], axis=1)
+    width = 2 * half + 1
+    return (cumsum[:, width:] - cumsum[:, :-width]) / width
+
+
+def get_baseline(y, window=201):
+    """Estimate the baseline of each trace (rows of y)
+
+    The baseline is the rolling minimum over **window** points, smoothed with
+    a moving average over the same window.
+    """
+    half = window // 2
+    minimum = _windows(y, half, half).min(axis=2)
+    return smooth(minimum, window)
+
+
+def call_peaks(sizes, rfu, smooth_window=5, baseline_window=201,
+               peak_window=25, min_prominence=20, min_height=0):
+    """Call the peaks of several traces sharing the same size axis
+
+    All traces are processed at once: baseline subtraction, smoothing,
+    detection of the local maxima, prominence and boundaries within
+    **peak_window** points on each side of the maxima and area integration
+    (trapezoidal rule) between the boundaries.
+
+    :param sizes: the size (bp) of the N points of the traces
+    :param rfu: a M x N array with the RFU of M traces
+    :param smooth_window: window (points) of the moving average
+    :param baseline_window: window (points) used to estimate the baseline.
+        Set to 0 to keep the traces as they are.
+    :param peak_window: number of points on each side of a maximum used to
+        compute its prominence and boundaries
+    :param min_prominence: peaks with a lower prominence (RFU above the
+        highest of the two surrounding minima) are ignored
+    :param min_height: peaks with a lower baseline-corrected RFU are ignored
+    :return: a dictionary of arrays (one item per peak, sorted by trace and
+        size): **trace**, **position** (index of the maximum), **size**,
+        **rfu** (raw RFU), **height** (corrected RFU), **prominence**,
+        **area**, **avg_size** (centroid) and **total** the total area of
+        each trace (one item per trace).
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    rfu = np.atleast_2d(np.asarray(rfu, dtype=float))
+    ntraces, npoints = rfu.shape
+
+    if baseline_window:
+        corrected = np.clip(rfu - get_baseline(rfu, baseline_window), 0, None)
+    else:
+        corrected = rfu
+    ys = smooth(corrected, smooth_window)
+
+    # local maxima (first point of a plateau)
+    is_peak = np.zeros(rfu.shape, dtype=bool)
+    is_peak[:, 1:-1] = (ys[:, 1:-1] > ys[:, :-2]) & (ys[:, 1:-1] >= ys[:, 2:])
+
+    # windowed prominence and boundaries
+    left = _windows(ys, peak_window, 0)
+    right = _windows(ys, 0, peak_window)
+    trace, position = np.nonzero(is_peak)
+    left_min = left[trace, position].min(axis=1)
+    right_min = right[trace, position].min(axis=1)
+    prominence = ys[trace, position] - np.maximum(left_min, right_min)
+
+    keep = (prominence >= min_prominence) & \
+           (ys[trace, position] >= min_height) & (prominence > 0)
+    trace, position, prominence = trace[keep], position[keep], prominence[keep]
+
+    start = position - peak_window + left[trace, position].argmin(axis=1)
+    end = position + right[trace, position].argmin(axis=1)
+    start = np.clip(start, 0, npoints - 1)
+    end = np.clip(end, 0, npoints - 1)
+
+    # overlapping boundaries of consecutive peaks are set to the minimum
+    # located between the two peaks (or the middle point)
+    same = trace[1:] == trace[:-1]
+    overlap = same & (end[:-1] > start[1:])
+    if overlap.any():
+        between = np.where((start[1:] > position[:-1]) & (start[1:] < position[1:]),
+                    start[1:], np.where(end[:-1] < position[1:], end[:-1],
+                    (position[:-1] + position[1:]) // 2))
+        end[:-1][overlap] = between[overlap]
+        start[1:][overlap] = between[overlap]
+
+    # cumulative integrals of the corrected signal and of size x signal
+    dx = np.diff(sizes)
+    def _cumulative(y):
+        steps = 0.5 * (y[:, 1:] + y[:, :-1]) * dx
+        return np.concatenate([np.zeros((ntraces, 1)), np.cumsum(steps, axis=1)],
+                              axis=1)
+    cumulative = _cumulative(corrected)
+    moments = _cumulative(corrected * sizes)
+
+    area = cumulative[trace, end] - cumulative[trace, start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_size = (moments[trace, end] - moments[trace, start]) / area
+    avg_size = np.where(np.isfinite(avg_size), avg_size, sizes[position])
+
+    return {"trace": trace, "position": position, "size": sizes[position],
+            "rfu": rfu[trace, position], "height": corrected[trace, position],
+            "prominence": prominence, "area": area, "avg_size": avg_size,
+            "total": cumulative[:, -1]}
+
+
+class TraceReader(object):
+    """Read raw traces and build the corresponding peak table
+
+    ::
+
+        from fragment_analyser.trace import TraceReader
+        trace = TraceReader("electropherogram.csv")
+        trace.get_peak_table()
+
+    The first column contains the sizes (bp). Other columns are named after
+    the wells (e.g., "A1" or "A1: sample"). The text after the colon is used
+    as the sample ID (defaults to the well name).
+
+    Concentrations (ng/ul) are the peak areas. If the concentration of the
+    lower marker is provided, areas are scaled in each well so that the
+    lower marker has that concentration. Molarity (nmole/L) is computed using
+    a molecular weight of 607.4 daltons per base pair plus 157.9 daltons.
+    """
+    def __init__(self, filename, geometry=None):
+        """.. rubric:: Constructor
+
+        :param filename: a CSV file (or a dataframe) with the raw traces
+        :param geometry: plate geometry used to identify the well columns
+        """
+        if isinstance(filename, pd.DataFrame):
+            df = filename
+        else:
+            df = pd.read_csv(filename, sep=",")
+        self.geometry = get_geometry(geometry)
+
+        headers = [str(x).split(":", 1) for x in df.columns[1:]]
+        names = [x[0].strip() for x in headers]
+        valid = self.geometry.is_well_name(names)
+        if valid.sum() == 0:
+            raise ValueError("No valid well names found in the header")
+
+        self.names = [x for x, ok in zip(names, valid) if ok]
+        self.sample_ids = [x[1].strip() if len(x) == 2 else x[0].strip()
+                           for x, ok in zip(headers, valid) if ok]
+        data = df.iloc[:, 1:].loc[:, valid]
+        data = data.apply(pd.to_numeric, errors="coerce")
+        sizes = pd.to_numeric(df.iloc[:, 0], errors="coerce")
+
+        # ignore incomplete rows and sort by size
+        keep = (sizes.notnull() & data.notnull().all(axis=1)).values
+        order = np.argsort(sizes.values[keep], kind="mergesort")
+        self.sizes = sizes.values[keep][order]
+        self.rfu = data.values[keep][order].T
+
+    def get_peak_table(self, markers=(1, 6000), marker_tolerance=0.1,
+                       marker_concentration=None, **kwargs):
+        """Return the peak table of all wells
+
+        :param markers: sizes of the lower and upper markers. Peaks close to
+            these sizes (see **marker_tolerance**) are reported with these
+            nominal sizes and are excluded from the relative concentrations
+            and totals, as in the tables exported by the instrument.
+        :param marker_tolerance: relative tolerance (at least 5 bp) to
+            identify the markers
+        :param marker_concentration: concentration (ng/ul) of the lower marker
+            used to scale the areas
+        :param kwargs: parameters of :func:`call_peaks`
+        """
+        peaks = call_peaks(self.sizes, self.rfu, **kwargs)
+        trace = peaks["trace"]
+        size = peaks["size"].round()
+        ntraces = len(self.names)
+
+        is_marker = np.zeros(len(size), dtype=bool)
+        for marker in markers:
+            close = np.abs(size - marker) <= max(5, marker * marker_tolerance)
+            is_marker |= close
+            size = np.where(close, marker, size)
+
+        # scaling factor of each trace using the lower marker
+        scale = np.ones(ntraces)
+        if marker_concentration is not None:
+            lower = size == markers[0]
+            lower_area = np.zeros(ntraces)
+            np.maximum.at(lower_area, trace[lower], peaks["area"][lower])
+            valid = lower_area > 0
+            scale[valid] = marker_concentration / lower_area[valid]
+
+        conc = peaks["area"] * scale[trace]
+        molarity = conc * 1e6 / (607.4 * size + 157.9)
+
+        sample = ~is_marker
+        weights = np.where(sample, conc, 0)
+        tic = np.bincount(trace, weights=weights, minlength=ntraces)
+        tim = np.bincount(trace, weights=np.where(sample, molarity, 0),
+                          minlength=ntraces)
+        marker_conc = np.bincount(trace, weights=np.where(sample, 0, conc),
+                                  minlength=ntraces)
+        total = peaks["total"] * scale - marker_conc
+        with np.errstate(invalid="ignore", divide="ignore"):
+            percent = np.where(sample, 100. * conc / tic[trace], np.nan)
+
+        # Peak ID starts at 1 in each well
+        first = np.searchsorted(trace, np.arange(ntraces))
+        peak_id = np.arange(len(trace)) - first[trace] + 1
+
+        names = np.array(self.names, dtype=object)
+        sample_ids = np.array(self.sample_ids, dtype=object)
+        df = pd.DataFrame({
+            'Well': names[trace],
+            'Sample ID': sample_ids[trace],
+            'Peak ID': peak_id.astype(float),
+            'Size (bp)': size,
+            '% (Conc.)': percent.round(1),
+            'nmole/L': molarity.round(3),
+            'ng/ul': conc.round(4),
+            'RFU': peaks["rfu"].round(),
+            'Avg. Size': peaks["avg_size"].round(),
+            'TIC (ng/ul)': tic[trace].round(4),
+            'TIM (nmole/L)': tim[trace].round(3),
+            'Total Conc. (ng/ul)': total[trace].round(4),
+            }, columns=columns)
+
+        # wells without peaks are kept (with no data)
+        missing = np.setdiff1d(np.arange(ntraces), trace)
+        if len(missing):
+            empty = pd.DataFrame({"Well": names[missing],
+                                  "Sample ID": sample_ids[missing]},
+                                  columns=columns)
+            empty.iloc[:, 2:] = np.nan
+            df = pd.concat([df, empty])
+            order = np.argsort(np.concatenate([trace, missing]), kind="mergesort")
+            df = df.iloc[order]
+        df.reset_index(drop=True, inplace=True)
+        return df
+
+
+def is_trace(df, geometry=None):
+    """Return True if the dataframe looks like raw traces
+
+    That is, a first column with the sizes and at least one column named
+    after a well.
+    """
+    if "size" not in str(df.columns[0]).lower() or len(df.columns) < 2:
+        return False
+    names = [str(x).split(":", 1)[0].strip() for x in df.columns[1:]]
+    return bool(get_geometry(geometry).is_well_name(names).any())
@@ -0,0 +1,379 @@
+#!/usr/bin/python
+"""Fast validation of the input files
+
+The structure of the input files is checked without interpreting them (no
+peak selection, no dataframes) so that malformed files are reported with a
+precise diagnostic before a long analysis starts::
+
+    from fragment_analyser.validate import validate_files
+    for result in validate_files(filenames):
+        if not result.ok:
+            print(result)
+
+or from the command line (the exit code is 1 if a file is invalid)::
+
+    fragment_analyser validate --pattern "*.csv"
+
+Files can also be validated by :class:`~fragment_analyser.plate.Plate`
+(**validate** parameter, --validate on the command line); invalid files are
+then skipped.
+
+The checks depend on the format detected as in
+:class:`~fragment_analyser.peaktable.PeakTableReader`:
+
+- **standard**: required columns, number of fields of each row, well names
+  and numeric values
+- **alternate**: one block per well made of the well name, a header with the
+  required columns, the peaks (numeric values) and the TIC, TIM and Total
+  Conc. rows
+- **trace**: a size column, well columns and numeric values
+"""
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+
+import numpy as np
+
+from .geometry import get_geometry
+
+
+#: columns required by the standard format
+standard_columns = ["Well", "Sample ID", "Size (bp)", "% (Conc.)", "ng/ul",
+                    "RFU", "TIM (nmole/L)"]
+#: columns required in the header of the wells of the alternate format
+alternate_columns = ["Peak ID", "Size (bp)", "% (Conc.)", "ng/ul", "RFU"]
+#: metadata rows of each well of the alternate format (in this order)
+metadata_rows = ["TIC", "TIM", "Total Conc."]
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+class Validation(object):
+    """The result of the validation of a file
+
+    :param filename: the validated file
+    """
+    def __init__(self, filename, max_errors=20):
+        self.filename = filename
+        #: standard, alternate, trace or None if not recognised
+        self.format = None
+        #: number of wells found
+        self.wells = 0
+        self.errors = []
+        self.warnings = []
+        self.max_errors = max_errors
+
+    @property
+    def ok(self):
+        """True if no error was found"""
+        return len(self.errors) == 0
+
+    @property
+    def full(self):
+        # enough errors were found
+        return len(self.errors) >= self.max_errors
+
+    def error(self, message, line=None):
+        if line is not None:
+            message = "line %s: %s" % (line, message)
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
+
+    def warning(self, message, line=None):
+        if line is not None:
+            message = "line %s: %s" % (line, message)
+        self.warnings.append(message)
+
+    def __str__(self):
+        status = "OK" if self.ok else "INVALID"
+        msg = "%s: %s (%s format, %s wells)" % (self.filename, status,
+                                                self.format, self.wells)
+        for error in self.errors:
+            msg += "\n  error: %s" % error
+        if self.full:
+            msg += "\n  (stopped after %s errors)" % self.max_errors
+        for warning in self.warnings:
+            msg += "\n  warning: %s" % warning
+        return msg
+
+    def to_dict(self):
+        return {"filename": self.filename, "ok": self.ok,
+                "format": self.format, "wells": self.wells,
+                "errors": self.errors, "warnings": self.warnings}
+
+
+def _read_rows(filename, result):
+    # rows (with their line numbers) as read by pandas: blank lines are
+    # skipped
+    try:
+        with open(filename, "rb") as fin:
+            data = fin.read()
+    except (IOError, OSError) as err:
+        result.error("cannot be read (%s)" % err)
+        return None
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError as err:
+        result.error("not a UTF-8 text file (%s)" % err)
+        return None
+    rows = []
+    for number, row in enumerate(csv.reader(io.StringIO(text)), 1):
+        if row:
+            rows.append((number, row))
+    if len(rows) == 0:
+        result.error("empty file")
+        return None
+    return rows
+
+
+def _get_format(header, geometry):
+    # same rules as PeakTableReader._guess_mode
+    if "Well" in header:
+        return "standard"
+    names = [x.split(":", 1)[0].strip() for x in header[1:]]
+    if "size" in header[0].lower() and geometry.is_well_name(names).any():
+        return "trace"
+    return "alternate"
+
+
+def _check_numbers(result, number, columns, row, skip=()):
+    for column, value in zip(columns, row):
+        value = value.strip()
+        if column in skip or value == "":
+            continue
+        if column == "TIM (nmole/L)":
+            # may contain the unit (e.g. 65.343 nmole/L)
+            value = value.split(" ")[0]
+        elif column == "Size (bp)":
+            value = re.sub(r"\((LM|UM)\)", "", value).strip()
+        if not _is_number(value):
+            result.error("%s is not a number (%r)" % (column, value), number)
+
+
+def _validate_standard(result, rows, geometry):
+    header = rows[0][1]
+    missing = [x for x in standard_columns if x not in header]
+    if missing:
+        result.error("missing column(s): %s" % ", ".join(missing), rows[0][0])
+        return
+    if len(rows) == 1:
+        result.error("no peaks (header only)")
+        return
+    iwell = header.index("Well")
+    names = [row[iwell].strip() if len(row) > iwell else "" for _, row in rows]
+    valid = geometry.is_well_name(names)
+    wells = set()
+    for i, (number, row) in enumerate(rows[1:], 1):
+        if result.full:
+            return
+        if len(row) != len(header):
+            result.error("%s fields instead of %s" % (len(row), len(header)),
+                         number)
+            continue
+        well = names[i]
+        if not valid[i]:
+            result.error("invalid well name %r" % well, number)
+        wells.add(well)
+        _check_numbers(result, number, header, row, skip=("Well", "Sample ID"))
+    result.wells = len(wells)
+
+
+def _validate_alternate(result, rows, geometry):
+    # pandas expects at most the number of fields of the first row
+    width = len(rows[0][1])
+    for number, row in rows:
+        if len(row) > width:
+            result.error("%s fields, more than the %s fields of the first row"
+                         % (len(row), width), number)
+    if result.full:
+        return
+
+    # blocks start with a well name in the first column. The last row of the
+    # file is ignored by the reader.
+    starts = np.flatnonzero(geometry.is_well_name([row[0].strip()
+                                                   for _, row in rows]))
+    starts = [int(x) for x in starts]
+    if len(starts) == 0:
+        result.error("format not recognised: no Well column, no size column "
+                     "and no well name in the first column")
+        return
+    if starts[0] > 0:
+        result.warning("%s row(s) before the first well are ignored" % starts[0],
+                       rows[0][0])
+    ends = starts[1:] + [len(rows) - 1]
+
+    names = set()
+    for start, end in zip(starts, ends):
+        if result.full:
+            return
+        number, row = rows[start]
+        well = row[0].strip()
+        if well in names:
+            result.error("well %s is found twice" % well, number)
+            continue
+        names.add(well)
+        block = rows[start + 1:end]
+        if len(block) == 0:
+            result.error("well %s has no header" % well, number)
+            continue
+        header = [x.strip() for x in block[0][1]]
+        missing = [x for x in alternate_columns if x not in header]
+        if missing:
+            result.error("header of well %s without column(s): %s" % (
+                         well, ", ".join(missing)), block[0][0])
+            continue
+
+        labels = []
+        for number, row in block[1:]:
+            if row[0].strip():
+                _check_numbers(result, number, header, row)
+            elif len(row) > 2 and row[1].strip():
+                # metadata row, e.g. " ,TIC: ,0.3314, ng/uL"
+                label = row[1].strip().rstrip(":").strip()
+                labels.append(label)
+                if label in metadata_rows and not _is_number(row[2].strip()):
+                    result.error("%s of well %s is not a number (%r)" % (
+                                 label, well, row[2].strip()), number)
+        if labels[0:3] != metadata_rows:
+            missing = [x for x in metadata_rows if x not in labels]
+            if missing:
+                hint = ""
+                if end == len(rows) - 1 and rows[-1][1][1:2] and \
+                        rows[-1][1][1].strip().rstrip(":").strip() in missing:
+                    hint = " (the last row of the file is ignored: add an empty row)"
+                result.error("well %s without %s row(s)%s" % (
+                             well, ", ".join(missing), hint), rows[start][0])
+            else:
+                result.error("well %s: %s rows expected in this order" % (
+                             well, ", ".join(metadata_rows)), rows[start][0])
+    result.wells = len(names)
+
+
+def _validate_trace(result, rows, geometry):
+    header = rows[0][1]
+    names = [x.split(":", 1)[0].strip() for x in header[1:]]
+    wells = geometry.is_well_name(names)
+    for name, valid in zip(header[1:], wells):
+        if not valid:
+            result.warning("column %r is not a well" % name, rows[0][0])
+    previous = None
+    for number, row in rows[1:]:
+        if result.full:
+            return
+        if len(row) != len(header):
+            result.error("%s fields instead of %s" % (len(row), len(header)),
+                         number)
+            continue
+        for column, value in zip(header, row):
+            if not _is_number(value.strip()):
+                result.error("%s is not a number (%r)" % (column, value), number)
+        size = row[0].strip()
+        if _is_number(size):
+            if previous is not None and float(size) < previous:
+                result.warning("sizes are not increasing", number)
+                previous = None
+            else:
+                previous = float(size)
+    result.wells = int(wells.sum())
+
+
+def validate_file(filename, geometry=None, max_errors=20):
+    """Check the structure of an input file
+
+    :param filename: the input file
+    :param geometry: the plate geometry used to check the well names (see
+        :func:`~fragment_analyser.geometry.get_geometry`)
+    :param max_errors: the validation stops after this number of errors
+    :return: a :class:`Validation`
+    """
+    geometry = get_geometry(geometry)
+    result = Validation(filename, max_errors=max_errors)
+    rows = _read_rows(filename, result)
+    if rows is None:
+        return result
+    result.format = _get_format(rows[0][1], geometry)
+    if result.format == "standard":
+        _validate_standard(result, rows, geometry)
+    elif result.format == "trace":
+        _validate_trace(result, rows, geometry)
+    else:
+        _validate_alternate(result, rows, geometry)
+        if result.wells == 0:
+            result.format = None
+    if result.wells > geometry.nwells:
+        result.warning("%s wells, more than the %s wells of a line" % (
+                       result.wells, geometry.nwells))
+    return result
+
+
+def validate_files(filenames, geometry=None, jobs=None, max_errors=20):
+    """Check the structure of several files in parallel
+
+    :param jobs: number of files checked at once (default to the number of
+        files, at most 32)
+    :return: list of :class:`Validation` (in the order of the filenames)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    filenames = list(filenames)
+    geometry = get_geometry(geometry)
+    if len(filenames) <= 1:
+        return [validate_file(x, geometry, max_errors) for x in filenames]
+    jobs = jobs or min(32, len(filenames))
+    with ThreadPoolExecutor(jobs) as executor:
+        return list(executor.map(lambda x: validate_file(x, geometry, max_errors),
+                                 filenames))
+
+
+class Options(argparse.ArgumentParser):
+    def __init__(self, prog="fragment_analyser validate"):
+        usage = """
+
+    fragment_analyser validate --pattern "*.csv"
+    fragment_analyser validate --pattern "*.csv" --json
+        """
+        super(Options, self).__init__(usage=usage, prog=prog,
+            description="""Check the structure of input files without analysing
+them. The exit code is 1 if a file is invalid""",
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        self.add_argument("-p", "--pattern", type=str, nargs="+", required=True,
+                          help="A pattern to fetch filenames (e.g. 2016*csv)")
+        self.add_argument("--geometry", default=None, type=str,
+                          help="Plate geometry used to check the well names "
+                               "(e.g. 96, 384 or 16x24)")
+        self.add_argument("-j", "--jobs", default=None, type=int,
+                          help="Number of files checked at once")
+        self.add_argument("--json", action="store_true",
+                          help="One JSON document per file")
+        self.add_argument("--errors-only", action="store_true",
+                          help="Only report the invalid files")
+
+
+def main(args):
+    """Entry point of ``fragment_analyser validate``"""
+    options = Options().parse_args(args[1:])
+    filenames = options.pattern
+    if len(filenames) == 1 and ("*" in filenames[0] or "?" in filenames[0]):
+        import glob
+        filenames = sorted(glob.glob(filenames[0]))
+    results = validate_files(filenames, geometry=options.geometry,
+                             jobs=options.jobs)
+    for result in results:
+        if options.errors_only and result.ok:
+            continue
+        if options.json:
+            sys.stdout.write(json.dumps(result.to_dict()) + "\n")
+        else:
+            print(result)
+    invalid = sum(1 for x in results if not x.ok)
+    if options.json is False:
+        print("%s file(s) checked, %s invalid" % (len(results), invalid))
+    return 1 if invalid else 0
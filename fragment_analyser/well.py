@@ -1,7 +1,12 @@
 #!/usr/bin/python
+import logging
+
 import numpy as np
 
 
+logger = logging.getLogger(__name__)
+
+
 # a data structure to handle the Well with a given sample 
 class Well(object):
     """Hold data related to a single well
@@ -41,9 +46,19 @@ class Well(object):
         # !! data may be empty once the 0 and 6000 controls are removed
         #print("Filtering out values <= %s or >= %s" % (lower_bound, upper_bound))
 
-        mask = data['Size (bp)'].apply(lambda x: x>lower_bound and x<upper_bound)
+        sizes = data['Size (bp)']
+        mask = (sizes > lower_bound) & (sizes < upper_bound)
         self.df = self.df[mask]
 
+        # the lower and upper markers are not quantified. They are kept in a
+        # side table to assess the sizing of the capillary (see sizing module)
+        if '% (Conc.)' in data.columns:
+            is_marker = data['% (Conc.)'].isnull() & sizes.notnull()
+        else:
+            is_marker = sizes != sizes
+        self.markers = data[is_marker].copy()
+        self.ladder = None
+
         self.total_concentration = None
         self.guess = None
         self.lower_bp_filter = lower_bound
@@ -69,6 +84,8 @@ class Well(object):
 
         # is it a control ?
         if self.well_ID.lower() in ['ladder']:
+            # the fragments of the ladder with their expected sizes
+            self.ladder = data[~is_marker].copy()
             data = [None] * len(self.df)
             self.df["Size (bp)"] = data
 
@@ -110,8 +127,7 @@ class Well(object):
         if self.guess is None:
             pass
         else:
-            import pylab
-            weighted_data = pylab.exp(-0.5*( (self.guess - positions.values) /
+            weighted_data = np.exp(-0.5*( (self.guess - positions.values) /
                 self.sigma)**2)
             data = data * weighted_data
             index = data.idxmax()
@@ -128,6 +144,22 @@ class Well(object):
         except:
             return None
 
+    def get_top_peaks(self, top_k=1, guesses=None):
+        """Return the **top_k** best peaks of the well
+
+        Peaks are weighted as in :meth:`get_peak_and_index`. If a list of
+        **guesses** is provided (one position per expected product), the
+        best peak around each guess is returned instead (see
+        :func:`~fragment_analyser.batch.get_top_peaks`).
+
+        :return: list of (peak position, index) sorted by decreasing weighted
+            height (or in the order of the guesses). Missing peaks are None.
+        """
+        from .batch import get_top_peaks
+        positions, indices = get_top_peaks([self], k=top_k, guesses=guesses)
+        return [None if index is None else (float(position), index)
+                for position, index in zip(positions[0], indices[0])]
+
     def get_most_concentrated_peak(self):
         concs = self.df['% (Conc.)']
         if len(concs):
@@ -138,7 +170,25 @@ class Well(object):
         else:
             return None
 
-    def plot(self, marker='o', color='red', m=0, M=6000):
+    def integrate(self, windows):
+        """Sum the concentrations and molarities of the peaks within windows
+
+        :param windows: a window (lower, upper) in bp, a list of windows or a
+            dictionary of named windows. Bounds are inclusive.
+        :return: a dataframe with one row per window (see
+            :class:`~fragment_analyser.regions.RegionIndex`)
+
+        ::
+
+            well.integrate({"library": (300, 800), "dimers": (120, 160)})
+
+        """
+        from .regions import RegionIndex
+        if getattr(self, "_regions", None) is None:
+            self._regions = RegionIndex([self])
+        return self._regions.integrate(windows)
+
+    def plot(self, marker='o', color='red', m=0, M=6000, ax=None):
         """Plots the position / height of the peaks in the well
 
         .. plot::
@@ -149,19 +199,26 @@ class Well(object):
             well = l.wells[0]
             well.plot()
 
+        :param ax: the matplotlib axes to draw on (default to the current
+            pylab axes)
         """
-        import pylab
         if len(self.df) == 0:
-            print("Nothing to plot (no peaks)")
+            logger.info("Nothing to plot (no peaks)")
             return
+        if ax is None:
+            import pylab
+            ax = pylab.gca()
+        from matplotlib.artist import setp
         x = self.df['Size (bp)'].astype(float).values
         y = self.df['RFU'].astype(float).values
 
-        pylab.stem(x, y, marker=marker, color=color)
-        pylab.semilogx()
-        pylab.xlim([1, M])
-        pylab.ylim([0, max(y)*1.2])
-        pylab.grid(True)
-        pylab.xlabel("size (bp)")
-        pylab.ylabel("RFU")
+        markerline, stemlines, baseline = ax.stem(x, y)
+        setp(markerline, marker=marker, color=color)
+        setp(stemlines, color=color)
+        ax.set_xscale("log")
+        ax.set_xlim([1, M])
+        ax.set_ylim([0, max(y)*1.2])
+        ax.grid(True)
+        ax.set_xlabel("size (bp)")
+        ax.set_ylabel("RFU")
         return x, y
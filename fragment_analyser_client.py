@@ -0,0 +1,88 @@
+#!/usr/bin/python
+"""Thin client of the fragment_analyser daemon
+
+This module only uses the standard library so that it starts immediately:
+the options are forwarded to a worker started with ``fragment_analyser
+daemon``, which already imported pandas and matplotlib, and the outputs and
+logs are streamed back::
+
+    fragment_analyser daemon --workers 4 &
+    fragment_analyser_client --pattern "2015*csv" --tag test
+
+The socket is given with --socket (first option) or the
+FRAGMENT_ANALYSER_SOCKET environment variable.
+
+Messages are JSON documents, one per line. The client sends the
+arguments and working directory; the worker replies with messages such as
+``{"stream": "stdout", "data": "..."}`` and finally ``{"exit": 0}``.
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+
+
+def get_default_socket():
+    """Return the default path of the daemon socket"""
+    path = os.environ.get("FRAGMENT_ANALYSER_SOCKET")
+    if path:
+        return path
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), "fragment_analyser-%s.sock" % uid)
+
+
+def send_message(sock, message):
+    sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def read_messages(fin):
+    for line in fin:
+        if line.strip():
+            yield json.loads(line.decode("utf-8"))
+
+
+def run(args, path=None, stdout=None, stderr=None):
+    """Run the options **args** on the daemon and return the exit code
+
+    :param args: the options as for the fragment_analyser application
+        (without the program name)
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or get_default_socket())
+        send_message(sock, {"args": list(args), "cwd": os.getcwd()})
+        for message in read_messages(sock.makefile("rb")):
+            if "exit" in message:
+                return message["exit"]
+            stream = stderr if message.get("stream") == "stderr" else stdout
+            stream.write(message.get("data", ""))
+            stream.flush()
+    finally:
+        sock.close()
+    stderr.write("Connection to the daemon lost\n")
+    return 1
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[:]
+    args = list(args[1:])
+    path = None
+    if args and args[0] == "--socket":
+        path, args = args[1], args[2:]
+    elif args and args[0].startswith("--socket="):
+        path, args = args[0].split("=", 1)[1], args[1:]
+    try:
+        code = run(args, path)
+    except socket.error as err:
+        sys.stderr.write("Could not connect to the fragment_analyser daemon "
+                         "(%s). Start it with: fragment_analyser daemon\n" % err)
+        code = 1
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
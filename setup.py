@@ -74,6 +74,8 @@ setup(
 
     # package installation
     packages = packages,
+    # thin client of the daemon, which must not import the package
+    py_modules = ['fragment_analyser_client'],
 
     zip_safe=False,
 
@@ -92,8 +94,11 @@ setup(
     # comment the requirements otherwise RTD fails
     # but we then need a requirements.txt file !
     install_requires = install_requires,
+    # compiled kernels (see fragment_analyser.kernels)
+    extras_require = {'jit': ['numba']},
     entry_points = {
         'console_scripts': [
-        'fragment_analyser=fragment_analyser.pipelines:main',]
+        'fragment_analyser=fragment_analyser.pipelines:main',
+        'fragment_analyser_client=fragment_analyser_client:main',]
         },
     )
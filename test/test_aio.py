@@ -0,0 +1,35 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from fragment_analyser import Line, fa_data
+from fragment_analyser.aio import analyse_files
+
+
+def collect(filenames, **kwargs):
+    async def run():
+        return [line async for line in analyse_files(filenames, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_analyse_files():
+    filenames = [fa_data("alternate/peaktable.csv"),
+                 fa_data("examples/lineB.csv"),
+                 fa_data("examples/test_input_well_B.csv")]
+    lines = collect(filenames, concurrency=2)
+    assert [line.filename for line in lines] == filenames
+    for line, filename in zip(lines, filenames):
+        expected = Line(filename)
+        expected.set_guess()
+        assert line.get_peaks() == expected.get_peaks()
+
+    # unordered, with a dedicated executor and an invalid file skipped
+    with ThreadPoolExecutor(2) as executor:
+        lines = collect(filenames + ["missing.csv"], ordered=False,
+                        executor=executor, guess=500)
+    assert sorted(line.filename for line in lines) == sorted(filenames)
+
+    try:
+        collect(["missing.csv"], errors="raise")
+        assert False
+    except IOError:
+        pass
@@ -0,0 +1,32 @@
+import shutil
+import tempfile
+
+from fragment_analyser import fa_data
+from fragment_analyser.plate import Plate
+from fragment_analyser.cache import ResultCache
+
+
+def test_cache():
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = [fa_data("examples/test_input_well_A.csv"),
+                     fa_data("standard_mix_cases/peak_table.csv")]
+        plate = Plate(filenames, cache=ResultCache(directory))
+        plate.analyse()
+        assert len(plate.cached) == 0
+
+        cached = Plate(filenames, cache=ResultCache(directory))
+        cached.analyse()
+        assert len(cached.cached) == 2
+        assert len(cached.lines) == 0
+        assert cached.data.equals(plate.data)
+
+        # other parameters, other results
+        plate = Plate(filenames, guess=700, cache=ResultCache(directory))
+        assert len(plate.cached) == 0
+
+        # images are required but were never stored
+        plate = Plate(filenames, cache=ResultCache(directory, images=True))
+        assert len(plate.cached) == 0
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from fragment_analyser import Line, Plate, fa_data
+
+
+def test_confidence():
+    line = Line(fa_data("alternate/peaktable.csv"), sigma=100)
+    line.set_guess(500)
+    confidence = line.get_confidence()
+    # the same peaks as the selection
+    peaks = [np.nan if x is None else x for x in line.get_peaks()]
+    assert np.allclose(confidence["Size (bp)"], peaks, equal_nan=True)
+    assert ((confidence["Margin"] >= 0) & (confidence["Margin"] <= 1)).sum() == 11
+    # A3 has peaks at 445 and 584: the selection depends on sigma
+    assert confidence["Sigma stability"]["A3"] < 1
+    assert confidence["Sigma stability"].max() == 1
+    assert np.isnan(confidence["Margin"]["A12"])
+
+    plate = Plate([fa_data("alternate/peaktable.csv")], confidence=True)
+    plate.analyse()
+    for column in ["Margin", "Sigma stability", "Line MAD distance",
+                   "Plate MAD distance"]:
+        assert column in plate.data.columns
+    # a single line: same median
+    assert np.allclose(plate.data["Line MAD distance"],
+                       plate.data["Plate MAD distance"], equal_nan=True)
+
+
+def test_confidence_products():
+    filenames = [fa_data("alternate/peaktable.csv")]
+    # the margin is not defined with the closest strategy (negative scores)
+    # but the distances are
+    plate = Plate(filenames, confidence=True, peak_mode="closest")
+    plate.analyse()
+    selected = plate.data["Size (bp)"].notnull()
+    assert plate.data["Margin"].isnull().all()
+    assert plate.data["Plate MAD distance"][selected].notnull().all()
+
+    # with several products, the confidence is the one of the rank 1 product
+    plate = Plate(filenames, confidence=True, guesses=[170, 600])
+    plate.analyse()
+    rank1 = plate.data[plate.data["Rank"] == 1].set_index("Well")
+    confidence = plate.lines[0].get_confidence(guess=170).loc[rank1.index]
+    assert np.allclose(rank1["Size (bp)"].astype(float),
+                       confidence["Size (bp)"], equal_nan=True)
+    assert plate.data["Plate MAD distance"][plate.data["Rank"] == 2].isnull().all()
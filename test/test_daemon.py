@@ -0,0 +1,44 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from fragment_analyser import fa_data
+import fragment_analyser_client
+
+
+def test_daemon():
+    if hasattr(os, "fork") is False:
+        return
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "fa.sock")
+    daemon = subprocess.Popen([sys.executable, "-c",
+        "from fragment_analyser.pipelines import main; "
+        "main(['fragment_analyser', 'daemon', '--socket', %r, '--workers', '2',"
+        " '--max-requests', '1'])" % path])
+    cwd = os.getcwd()
+    try:
+        for i in range(300):
+            if os.path.exists(path):
+                break
+            time.sleep(0.1)
+        os.chdir(directory)
+        for i in range(3):
+            stdout = io.StringIO()
+            code = fragment_analyser_client.run(["--pattern",
+                fa_data("alternate/peaktable.csv"), "--no-images"],
+                path, stdout=stdout, stderr=io.StringIO())
+            assert code == 0
+            assert "Alternate input data" in stdout.getvalue()
+            assert os.path.exists(os.path.join(directory, "summary_all.csv"))
+        code = fragment_analyser_client.run(["--method", "unknown"], path,
+            stdout=io.StringIO(), stderr=io.StringIO())
+        assert code == 2
+    finally:
+        os.chdir(cwd)
+        daemon.terminate()
+        daemon.wait()
+        shutil.rmtree(directory)
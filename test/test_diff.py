@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+import numpy as np
+
+from fragment_analyser import fa_data
+from fragment_analyser.diff import SummaryDiff, read_summary, main
+
+
+def test_identical():
+    diff = SummaryDiff(fa_data("test_all.csv"), fa_data("test_filtered.csv"))
+    assert diff.identical
+    assert diff.matched == 24
+    assert len(diff.changes) == 0
+
+
+def test_diff():
+    old = read_summary(fa_data("test_all.csv"))
+    new = old.copy()
+    new.loc[0, "Size (bp)"] += 1
+    new.loc[1, "Size (bp)"] = np.nan
+    new.loc[2, "RFU"] += 100
+    new = new.drop(index=3)
+    new = new.iloc[::-1]    # the order of the rows does not matter
+
+    diff = SummaryDiff(old, new)
+    assert not diff.identical
+    assert diff.matched == 23
+    assert list(diff.removed["Well"]) == [old["Well"][3]]
+    assert len(diff.added) == 0
+    calls = diff.get_changed_calls()
+    assert list(calls["Well"]) == list(old["Well"][:2])
+    changes = diff.changes
+    assert list(changes["Column"]) == ["Size (bp)", "Size (bp)", "RFU"]
+    assert changes["Delta"].iloc[0] == 1 and changes["Delta"].iloc[2] == 100
+
+    # within the tolerances
+    diff = SummaryDiff(old, new, tolerances={"Size (bp)": 1}, rtol=0.5)
+    assert list(diff.changes["Well"]) == [old["Well"][1]]
+
+
+def test_main():
+    old = read_summary(fa_data("test_all.csv"))
+    old["RFU"] += 1
+    fd, filename = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        old.to_csv(filename, index=False)
+        args = ["diff", fa_data("test_all.csv"), filename]
+        assert main(args) == 1
+        assert main(args + ["--calls-only"]) == 0
+        assert main(args + ["--tolerance", "RFU=1"]) == 0
+    finally:
+        os.remove(filename)
@@ -0,0 +1,29 @@
+import json
+import os
+import tempfile
+
+from fragment_analyser import Plate, fa_data
+from fragment_analyser.events import JSONLinesWriter
+
+
+def test_events():
+    events = []
+    filenames = [fa_data("alternate/peaktable.csv"), "missing.csv"]
+    Plate(filenames, events=events.append)
+    assert [x["event"] for x in events] == ["run_start", "file_start",
+        "file_end", "file_start", "file_end", "run_end"]
+    assert events[2]["status"] == "analysed" and events[2]["wells"] == 12
+    assert events[4]["status"] == "failed"
+    assert events[-1]["wells"] == 12
+
+    fh = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+    fh.close()
+    try:
+        writer = JSONLinesWriter(fh.name)
+        Plate([fa_data("alternate/peaktable.csv")], events=[writer])
+        writer.close()
+        with open(fh.name) as fin:
+            lines = [json.loads(x) for x in fin]
+        assert lines[-1]["event"] == "run_end"
+    finally:
+        os.remove(fh.name)
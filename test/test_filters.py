@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from fragment_analyser import Plate, fa_data
+from fragment_analyser.tools import get_outlier_bounds
+from fragment_analyser.filters import get_outlier_mask, apply_mask, \
+    get_group_codes
+
+
+def _get_expected_mask(data):
+    # the median +/- 3 MAD of all rows
+    lower, upper = get_outlier_bounds(data["Size (bp)"])
+    return ((data["Size (bp)"] < lower) | (data["Size (bp)"] > upper)).values
+
+
+def test_filters():
+    filenames = [fa_data("examples/test_input_well_A.csv"),
+                 fa_data("standard_mix_cases/peak_table.csv"),
+                 fa_data("alternate/peaktable.csv")]
+    plate = Plate(filenames)
+    plate.analyse()
+    data = plate.data
+
+    # same results as the plate-wide filter
+    mask = get_outlier_mask(data)
+    assert mask.any()
+    assert (mask.values == _get_expected_mask(data)).all()
+    filtered = apply_mask(data, mask)
+    assert filtered["Size (bp)"][mask].isnull().all()
+    assert filtered["Well"].equals(data["Well"])
+
+    # each group is filtered separately
+    codes = get_group_codes(data, "row")
+    assert len(set(codes)) == 2
+    mask = get_outlier_mask(data, by="row")
+    for code in set(codes):
+        group = data[codes == code]
+        assert (mask[codes == code].values == _get_expected_mask(group)).all()
+
+    # user defined groups
+    mask = get_outlier_mask(data, by=lambda df: df["Sample ID"].str[0:1])
+    assert mask.dtype == bool
+
+    # hampel filter on a simple example
+    df = pd.DataFrame({"Well": ["A%s" % i for i in range(1, 9)],
+                       "Size (bp)": [500, 510, 505, 900, 495, np.nan, 505, 100]})
+    mask = get_outlier_mask(df, method="hampel", window=2)
+    # windows are shorter at the end of the groups
+    assert list(mask) == [False, False, False, True, False, False, False, False]
+    mask = get_outlier_mask(df, method="hampel", window=3)
+    assert list(mask) == [False, False, False, True, False, False, False, True]
+
+    # filterout uses the same engine and returns the mask
+    mask = plate.filterout(by="line")
+    assert mask.sum() == plate.filtered["Size (bp)"].isnull().sum() - \
+        data["Size (bp)"].isnull().sum()
@@ -0,0 +1,18 @@
+from fragment_analyser.geometry import get_geometry, PlateGeometry
+
+
+def test_geometry():
+    g = get_geometry()
+    assert len(g) == 96
+    assert g.lines == list("ABCDEFGH")
+
+    g = get_geometry(384)
+    assert g == PlateGeometry(16, 24)
+    assert g == get_geometry("16x24")
+    assert g.is_well_name("P24")
+    assert not g.is_well_name("Q1")
+    assert not g.is_well_name("A25")
+    assert list(g.is_well_name(["A1", "Peak ID", " B2 "])) == [True, False, True]
+    assert list(g.index(["A1", "B1", "P24", "Z1"])) == [0, 24, 383, -1]
+
+    assert get_geometry(1536).lines[-1] == "AF"
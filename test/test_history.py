@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+
+from fragment_analyser import Plate, fa_data
+from fragment_analyser.history import History
+
+
+def test_history():
+    directory = tempfile.mkdtemp()
+    try:
+        history = History(directory)
+        for filename in ["alternate/peaktable.csv", "examples/lineB.csv",
+                         "standard_mix_cases/peak_table.csv",
+                         "examples/test_input_well_B.csv"]:
+            Plate([fa_data(filename)], history=history).analyse()
+        assert len(history) == 4
+
+        # same files are not logged twice
+        Plate([fa_data("examples/lineB.csv")], history=history).analyse()
+        assert len(history) == 4
+
+        trend = history.trend(warmup=1)
+        assert set(trend["Run"]) == set(range(4))
+        assert trend["Alarm"].dtype == bool
+        # only the new runs are reported
+        assert len(history.trend(warmup=1)) == 0
+        Plate([fa_data("standard_with_flat_cases/peak_table.csv")],
+              history=history).analyse()
+        assert set(History(directory).trend(warmup=1)["Run"]) == set([4])
+        assert set(History(directory).trend(warmup=1, recompute=True)["Run"]) == set(range(5))
+
+        # aggregates per assay
+        history = History(tempfile.mkdtemp(dir=directory), by="prefix:1")
+        Plate([fa_data("alternate/peaktable.csv")], history=history).analyse()
+        assert len(history.get_data()) > 1
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_history_shared():
+    from fragment_analyser.cache import ResultCache
+    directory = tempfile.mkdtemp()
+    try:
+        # two runs logged at the same time in the same log
+        first = History(directory)
+        second = History(directory)
+        Plate([fa_data("alternate/peaktable.csv")], history=first).analyse()
+        Plate([fa_data("examples/lineB.csv")], history=second).analyse()
+        assert list(History(directory).runs["id"]) == [0, 1]
+        assert len(History(directory).get_data()) == 2
+
+        # files read from the cache are not read again
+        class Plate2(Plate):
+            def get_line(self, filename):
+                raise AssertionError("%s read again" % filename)
+        cache = ResultCache(os.path.join(directory, "cache"))
+        filenames = [fa_data("examples/test_input_well_B.csv")]
+        Plate2(filenames, cache=cache).analyse()
+        Plate2(filenames, cache=cache, history=History(directory)).analyse()
+        assert len(History(directory)) == 3
+    finally:
+        shutil.rmtree(directory)
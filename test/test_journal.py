@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from fragment_analyser import fa_data
+from fragment_analyser.plate import Plate
+from fragment_analyser.journal import Journal
+
+
+def test_journal():
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = [fa_data("examples/test_input_well_A.csv"),
+                     fa_data("standard_mix_cases/peak_table.csv")]
+        expected = Plate(filenames)
+        expected.analyse()
+
+        # a run interrupted after the first file
+        plate = Plate(filenames[0:1], journal=Journal(directory, resume=False))
+        # ... while writing the next entry
+        with open(os.path.join(directory, "journal.jsonl"), "a") as fout:
+            fout.write('{"key": "trunc')
+
+        journal = Journal(directory)
+        assert len(journal) == 1
+        plate = Plate(filenames, journal=journal)
+        assert list(plate.cached) == filenames[0:1]
+        assert len(plate.lines) == 1
+        plate.analyse()
+        assert plate.data.equals(expected.data)
+        assert len(Journal(directory)) == 2
+
+        # a new journal: other files of the directory are kept
+        other = os.path.join(directory, "other.txt")
+        open(other, "w").close()
+        assert len(Journal(directory, resume=False)) == 0
+        assert os.path.exists(other)
+        assert os.listdir(os.path.join(directory, "rows")) == []
+
+        # a directory that is not a journal is not removed
+        os.remove(os.path.join(directory, "journal.jsonl"))
+        with pytest.raises(ValueError):
+            Journal(directory, resume=False)
+        assert os.path.exists(other)
+    finally:
+        shutil.rmtree(directory)
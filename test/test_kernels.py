@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from fragment_analyser import Line, fa_data
+from fragment_analyser import kernels
+from fragment_analyser.kernels import flatten_wells, segmented_argmax, segmented_mad
+
+
+def test_argmax():
+    line = Line(fa_data("alternate/peaktable.csv"))
+    line.set_guess()
+    sizes, values, offsets = flatten_wells(line.wells)
+    positions = segmented_argmax(sizes, values, offsets,
+                                 [well.guess for well in line.wells],
+                                 [well.sigma for well in line.wells],
+                                 use_numba=False)
+    for well, position in zip(line.wells, positions):
+        res = well.get_peak_and_index()
+        if res is None:
+            assert position == -1
+        else:
+            assert well.df.index[position] == res[1]
+    if kernels.numba is not None:
+        assert (segmented_argmax(sizes, values, offsets,
+                                 [well.guess for well in line.wells],
+                                 [well.sigma for well in line.wells],
+                                 use_numba=True) == positions).all()
+
+
+def test_mad():
+    values = np.array([1, 5, 3, np.nan, 10, 2, np.nan, 4., 8])
+    offsets = [0, 3, 4, 4, 7, 9]
+    median, mad = segmented_mad(values, offsets, use_numba=False)
+    assert np.allclose(median, [3, np.nan, np.nan, 6, 6], equal_nan=True)
+    assert np.allclose(mad, [2, np.nan, np.nan, 4, 2], equal_nan=True)
+    if kernels.numba is not None:
+        median2, mad2 = segmented_mad(values, offsets, use_numba=True)
+        assert np.allclose(median, median2, equal_nan=True)
+        assert np.allclose(mad, mad2, equal_nan=True)
+
+    # same as pandas per group
+    codes = np.array([2, 0, 2, 1, 0, 0, 1, 2, 2])
+    median, mad = kernels.get_group_statistics(values, codes, use_numba=False)
+    series = pd.Series(values)
+    expected = series.groupby(codes).transform("median")
+    assert np.allclose(median, expected, equal_nan=True)
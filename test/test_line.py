@@ -1,3 +1,5 @@
+import pytest
+
 from fragment_analyser import Line, fa_data
 
 
@@ -61,3 +63,46 @@ def _test_gap():
 
 
 
+def test_geometry():
+    # convert the alternate example (wells A1-A12) into the second half of
+    # the last line of a 384-well plate (wells P13-P24)
+    import os
+    import re
+    import tempfile
+    data = open(fa_data('alternate/peaktable.csv')).read()
+    data = re.sub(r"^A(\d+),", lambda x: "P%s," % (int(x.group(1))+12), data,
+                  flags=re.MULTILINE)
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as fout:
+        fout.write(data)
+
+    try:
+        l = Line(fout.name, geometry=384)
+        assert len(l.wells) == 12
+        assert l.wells[0].name == "P13"
+        assert l.get_peaks()[0:3] == [168, 584, 164]
+        l.diagnostic()
+
+        # P is not a valid line on a 96-well plate
+        with pytest.raises(ValueError):
+            Line(fout.name)
+    finally:
+        os.remove(fout.name)
+
+
+def test_top_k():
+    l = Line(fa_data('alternate/peaktable.csv'))
+    l.set_guess()
+    # the best peak is the one returned by get_peaks
+    assert [x[0] for x in l.get_peaks(top_k=1)] == l.get_peaks()
+    peaks = l.get_peaks(top_k=3)
+    assert peaks[0] == [608, 168, None]
+    assert peaks[2] == [584, 445, 275]
+    assert l.wells[0].get_top_peaks(2) == [(608, 3), (168, 2)]
+
+    # one peak around each expected product
+    peaks = l.get_peaks(guesses=[170, 600])
+    assert peaks[0:2] == [[168, 608], [169, 584]]
+
+    df = l.get_selected_peaks(top_k=2)
+    assert list(df['Rank'][0:4]) == [1, 2, 1, 2]
+    assert list(df['Size (bp)'][0:4]) == [608, 168, 584, 169]
@@ -0,0 +1,73 @@
+import shutil
+import tempfile
+
+from fragment_analyser import Plate, fa_data
+from fragment_analyser.peakindex import PeakIndex
+
+
+def test_index():
+    directory = tempfile.mkdtemp()
+    try:
+        index = PeakIndex(directory, max_segments=2)
+        plate = Plate([fa_data("alternate/peaktable.csv")], index=index)
+        plate.analyse()
+        N = len(index)
+        assert N > 0
+
+        # same file is not indexed twice
+        plate.analyse()
+        assert len(index) == N
+
+        for filename in ["examples/test_input_well_A.csv",
+                         "standard_mix_cases/peak_table.csv",
+                         "standard_with_flat_cases/peak_table.csv"]:
+            Plate([fa_data(filename)], index=index).analyse()
+        # segments were merged
+        assert len(index._state["segments"]) <= 2
+
+        # persistent
+        index = PeakIndex(directory)
+        assert len(index.runs) == 4
+        df = index.query(540, 620)
+        assert len(df)
+        assert df["Size (bp)"].between(540, 620).all()
+        assert df["Size (bp)"].is_monotonic_increasing
+        assert "peaktable.csv" in set(df.Run)
+        assert len(index.query(10000, 20000)) == 0
+
+        index.compact()
+        assert len(index.query(540, 620)) == len(df)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_index_shared():
+    import os
+    from fragment_analyser.cache import ResultCache
+    directory = tempfile.mkdtemp()
+    try:
+        # two runs adding peaks at the same time to the same index
+        first = PeakIndex(os.path.join(directory, "index"))
+        second = PeakIndex(os.path.join(directory, "index"))
+        Plate([fa_data("alternate/peaktable.csv")], index=first).analyse()
+        Plate([fa_data("examples/lineB.csv")], index=second).analyse()
+        index = PeakIndex(os.path.join(directory, "index"))
+        assert list(index.runs["id"]) == [0, 1]
+        # the second run read the manifest updated by the first one
+        assert len(index) == len(second) > len(first)
+        assert set(index.query(0, 20000)["Run"]) == {"peaktable.csv",
+                                                    "lineB.csv"}
+
+        # files whose results are read from the cache are indexed too
+        cache = ResultCache(os.path.join(directory, "cache"))
+        filenames = [fa_data("examples/test_input_well_B.csv")]
+        Plate(filenames, cache=cache).analyse()
+        plate = Plate(filenames, cache=cache, index=index)
+        plate.analyse()
+        assert plate.sources[0][1] is None
+        assert list(index.runs["name"]) == ["peaktable.csv", "lineB.csv",
+                                            "test_input_well_B.csv"]
+        assert set(index.query(0, 20000)["Run"]) == {
+            "peaktable.csv", "lineB.csv", "test_input_well_B.csv"}
+    finally:
+        shutil.rmtree(directory)
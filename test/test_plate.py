@@ -25,3 +25,100 @@ def test_plate():
     plate.analyse()
     plate.filterout()
     
+
+
+def test_threads():
+    # plates analysed concurrently give the same results
+    from concurrent.futures import ThreadPoolExecutor
+    from matplotlib.figure import Figure
+
+    filenames = [fa_data("examples/test_input_well_A.csv"),
+                 fa_data("examples/test_input_well_B.csv"),
+                 fa_data("standard_mix_cases/peak_table.csv"),
+                 fa_data("alternate/peaktable.csv")]
+
+    def analyse(filename):
+        plate = Plate([filename])
+        plate.analyse()
+        data = plate.data.copy()
+        plate.filterout()
+        # filterout does not modify the results
+        assert plate.data.equals(data)
+        fig = Figure()
+        plate.lines[0].diagnostic(ax=fig.add_subplot(111))
+        return plate.filtered
+
+    expected = [analyse(filename) for filename in filenames]
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(analyse, filenames * 4))
+    for i, df in enumerate(results):
+        assert df.equals(expected[i % len(filenames)])
+
+
+def test_top_k():
+    filenames = [fa_data("alternate/peaktable.csv")]
+    plate = Plate(filenames, top_k=2)
+    plate.analyse()
+    assert list(plate.data['Rank'][0:4]) == [1, 2, 1, 2]
+    plate.filterout()
+    # outliers are computed for each rank (and the ladder has no peak)
+    assert plate.filtered['Size (bp)'].isnull().sum() == 4
+    assert plate.filtered['Size (bp)'][5] != plate.filtered['Size (bp)'][5]
+    assert list(plate.filtered['Rank'][0:4]) == [1, 2, 1, 2]
+
+    plate = Plate(filenames)
+    plate.analyse(guesses=[170, 600])
+    assert list(plate.data['Size (bp)'][0:2]) == [168, 608]
+
+
+def test_views():
+    import os
+    import shutil
+    import tempfile
+    plate = Plate([fa_data("examples/test_input_well_A.csv"),
+                   fa_data("standard_mix_cases/peak_table.csv")])
+    plate.analyse()
+    data = plate.data.copy()
+    assert plate.filtered.equals(data) and plate.filtered is not plate.data
+    mask = plate.filterout()
+    assert plate.data.equals(data)
+    assert mask.sum() == 4
+
+    directory = tempfile.mkdtemp()
+    try:
+        names = [os.path.join(directory, x) for x in ["all.csv", "filtered.csv",
+                                                      "outliers.csv"]]
+        plate.write_views(*names)
+        plate.data.to_csv(names[0] + ".expected", index=False)
+        assert open(names[0]).read() == open(names[0] + ".expected").read()
+        plate.filtered.to_csv(names[0] + ".expected", index=False)
+        assert open(names[1]).read() == open(names[0] + ".expected").read()
+        assert len(pd.read_csv(names[2])) == 4
+        plate.to_csv(names[0] + ".outliers", view="outliers")
+        assert open(names[2]).read() == open(names[0] + ".outliers").read()
+        # once filtered, to_csv saves the filtered results by default
+        plate.to_csv(names[0] + ".default")
+        assert open(names[1]).read() == open(names[0] + ".default").read()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_montage():
+    import os
+    import shutil
+    import tempfile
+    filenames = [fa_data("examples/test_input_well_A.csv"),
+                 fa_data("examples/test_input_well_B.csv"),
+                 fa_data("alternate/peaktable.csv")]
+    plate = Plate(filenames)
+    plate.analyse()
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, "montage.png")
+        fig = plate.montage(filename)
+        assert os.path.exists(filename)
+        # one panel per line (and an empty one)
+        assert len(fig.axes) == 4
+        assert len([ax for ax in fig.axes if ax.get_visible()]) == 3
+    finally:
+        shutil.rmtree(directory)
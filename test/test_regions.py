@@ -0,0 +1,39 @@
+from fragment_analyser import Line, Plate, fa_data
+from fragment_analyser.regions import get_windows
+
+
+def test_windows():
+    names, lower, upper = get_windows((100, 200))
+    assert names == ["100-200"]
+    names, lower, upper = get_windows({"a": (100, 200), "b": (300, 400)})
+    assert list(lower) == [100, 300]
+    try:
+        get_windows((200, 100))
+        assert False
+    except ValueError:
+        assert True
+
+
+def test_integrate():
+    line = Line(fa_data("alternate/peaktable.csv"))
+    df = line.integrate({"all": (0, 10000), "small": (160, 170)})
+    assert len(df) == 2 * len(line.wells)
+
+    # compare with a naive sum over the peaks
+    for i, well in enumerate(line.wells):
+        data = well.df[(well.df["Size (bp)"] >= 160) & (well.df["Size (bp)"] <= 170)]
+        res = df[(df.Well == well.name) & (df.Region == "small")].iloc[0]
+        assert res["peaks"] == len(data)
+        assert abs(res["ng/ul"] - data["ng/ul"].astype(float).sum()) < 1e-10
+        assert abs(res["amount (nM)"] - data["amount (nM)"].sum()) < 1e-10
+
+    well = line.wells[2]
+    res = well.integrate((100, 600))
+    assert res["peaks"].iloc[0] == 4
+
+    plate = Plate([fa_data("alternate/peaktable.csv"),
+                   fa_data("standard_with_flat_cases/peak_table.csv")])
+    df = plate.integrate([(120, 200), (500, 700)])
+    assert len(df) == 48
+    # ladder wells have no sizes
+    assert (df[df["Sample ID"] == "Ladder"]["peaks"] == 0).all()
@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+
+from fragment_analyser import Plate, fa_data
+from fragment_analyser.report import get_diagnostic_data, line_to_svg, write_report
+
+
+def test_report():
+    plate = Plate([fa_data("examples/lineB.csv"),
+                   fa_data("standard_with_flat_cases/peak_table.csv")])
+    plate.analyse()
+
+    line = plate.lines[1]
+    data = get_diagnostic_data(line)
+    assert len(data["peaks"]) == len(line.wells)
+    assert data["median"] == line.guess_peak()
+    assert data["mad"] == line.get_mad()
+    for start, end in data["chunks"]:
+        assert not any(x is None for x in line.get_peaks()[start:end+1])
+
+    svg = line_to_svg(line, title="test")
+    assert svg.startswith("<svg") and svg.strip().endswith("</svg>")
+    assert svg.count("<circle") == sum(x is not None for x in line.get_peaks()) + 1
+
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, "report.html")
+        write_report(plate, filename)
+        html = open(filename).read()
+        assert html.count("<svg") == 2
+    finally:
+        shutil.rmtree(directory)
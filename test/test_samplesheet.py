@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+import pandas as pd
+
+from fragment_analyser import Plate, fa_data
+from fragment_analyser.samplesheet import SampleSheet
+
+
+def test_samplesheet():
+    # expected sizes of the first wells of the alternate example
+    sheet = pd.DataFrame({"Well": ["A1", "A2", "A3", "B1"],
+                          "Sample ID": ["BJ", "BK", "CV", "XX"],
+                          "Project": ["P1", "P1", "P2", "P3"],
+                          "Expected size (bp)": [170, 600, 440, 500]})
+    filename = tempfile.NamedTemporaryFile(suffix=".csv", delete=False).name
+    sheet.to_csv(filename, index=False)
+    try:
+        sheet = SampleSheet(filename)
+        # a sample ID is not matched on another well; a well is matched even
+        # if the sample ID differs
+        rows = sheet.lookup(["a1", "A3", "A4", "B1"], ["BJ", "CV", "BJ", "YY"])
+        assert list(rows) == [0, 2, -1, 3]
+
+        filenames = [fa_data("alternate/peaktable.csv")]
+        plate = Plate(filenames, sample_sheet=sheet)
+        plate.analyse()
+        assert list(plate.data["Size (bp)"][0:3]) == [168, 584, 445]
+        assert list(plate.data["Project"][0:4].fillna("")) == ["P1", "P1", "P2", ""]
+        assert plate.lines[0].wells[3].guess == plate.lines[0].wells[4].guess
+
+        # the columns of the sheet are kept in the filtered view
+        plate.masks["outliers"] = (plate.data["Well"] == "A2").values
+        filtered = plate.filtered
+        assert filtered["Size (bp)"].isnull()[1]
+        assert filtered["Project"][1] == "P1"
+        assert filtered["Expected size (bp)"][1] == 600
+        plate.to_csv(filename)
+        assert pd.read_csv(filename)["Project"][1] == "P1"
+
+        # sheet keyed by sample ID only
+        sheet = SampleSheet(pd.DataFrame({"Sample ID": ["BJ"],
+                                          "Expected size (bp)": [170]}))
+        plate = Plate(filenames, sample_sheet=sheet)
+        plate.analyse()
+        assert plate.data["Size (bp)"][0] == 168
+    finally:
+        os.remove(filename)
@@ -0,0 +1,74 @@
+import json
+import threading
+
+from fragment_analyser import fa_data
+from fragment_analyser.server import AnalysisService, LineCache, get_server
+
+try:
+    from urllib.request import urlopen, Request
+except ImportError:
+    from urllib2 import urlopen, Request
+
+
+def test_cache():
+    cache = LineCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["a"]
+    cache["c"] = 3
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.get("b") is None
+
+
+def test_service():
+    service = AnalysisService(cache_size=2)
+    key = service.load(filename=fa_data("alternate/peaktable.csv"))
+    assert service.load(filename=fa_data("alternate/peaktable.csv")) == key
+    # as in Plate, the guess is the median across the line by default
+    peaks = [x["Size (bp)"] for x in service.get_peaks(key)]
+    assert peaks[0:3] == [608, 584, 584]
+
+    peaks = [x["Size (bp)"] for x in service.get_peaks(key, guess=500)]
+    assert peaks[0:3] == [608., 584., 445.]
+
+    peaks = [x["Size (bp)"] for x in service.get_peaks(key, guess=500, sigma=100)]
+    assert peaks[0:3] == [608, 584, 584]
+
+    peaks = [x["Size (bp)"] for x in service.get_peaks(key, guess=1200, sigma=100)]
+    assert peaks[0:3] == [608, 584, 1169]
+
+    # back to the default guess
+    peaks = [x["Size (bp)"] for x in service.get_peaks(key)]
+    assert peaks[0:3] == [608, 584, 584]
+
+    peaks = [x["Size (bp)"] for x in service.get_peaks(key, method="concentration")]
+    assert peaks[0:3] == [168, 584, 445]
+
+    assert service.get_diagnostic(key).startswith(b"\x89PNG")
+
+    # lower bound is part of the identifier
+    other = service.load(filename=fa_data("alternate/peaktable.csv"),
+                         lower_bound=1)
+    assert other != key
+
+
+def test_server():
+    server = get_server(port=0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = "http://127.0.0.1:%s" % server.server_address[1]
+    try:
+        data = open(fa_data("alternate/peaktable.csv"), "rb").read()
+        res = json.loads(urlopen(Request(url + "/analyse", data=data)).read())
+        assert res["wells"][0]["Size (bp)"] == 608
+
+        res = json.loads(urlopen(url + "/lines/%s/peaks?guess=1200&sigma=100" % res["id"]).read())
+        assert res["wells"][2]["Size (bp)"] == 1169
+
+        res = json.loads(urlopen(url + "/status").read())
+        assert res["cached"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
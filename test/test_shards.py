@@ -0,0 +1,69 @@
+from fragment_analyser import Plate, fa_data
+from fragment_analyser.shards import get_shard, save_shard, merge_shards
+import os
+import shutil
+import tempfile
+
+
+def test_shards():
+    filenames = [fa_data("examples/test_input_well_A.csv"),
+                 fa_data("examples/test_input_well_B.csv"),
+                 fa_data("standard_mix_cases/peak_table.csv"),
+                 fa_data("alternate/peaktable.csv")]
+
+    plate = Plate(sorted(filenames))
+    plate.analyse()
+    data = plate.data
+    plate.filterout()
+
+    directory = tempfile.mkdtemp()
+    try:
+        shards = []
+        for i in [1, 2, 3]:
+            subset = get_shard(filenames, i, 3)
+            shard = Plate(subset)
+            shard.analyse()
+            shards.append(os.path.join(directory, "shard%s.pkl" % i))
+            save_shard(shards[-1], shard.data, i, 3, subset)
+
+        merged, mask = merge_shards(shards[::-1])
+        assert merged.equals(data)
+        assert (mask == plate.masks["outliers"].values).all()
+
+        # all shards are required
+        try:
+            merge_shards(shards[0:2])
+            assert False
+        except ValueError:
+            assert True
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_shards_confidence():
+    import numpy as np
+    filenames = sorted([fa_data("examples/test_input_well_A.csv"),
+                        fa_data("examples/test_input_well_B.csv"),
+                        fa_data("alternate/peaktable.csv")])
+    plate = Plate(filenames, confidence=True)
+    plate.analyse()
+
+    directory = tempfile.mkdtemp()
+    try:
+        shards = []
+        for i in [1, 2, 3]:
+            subset = get_shard(filenames, i, 3)
+            shard = Plate(subset, confidence=True)
+            shard.analyse()
+            shards.append(os.path.join(directory, "shard%s.pkl" % i))
+            save_shard(shards[-1], shard.data, i, 3, subset)
+        # the distance of the shards is not the distance of the plate
+        assert not np.allclose(shard.data["Plate MAD distance"],
+                               plate.data["Plate MAD distance"][-len(shard.data):],
+                               equal_nan=True)
+
+        merged, _ = merge_shards(shards)
+        assert np.allclose(merged["Plate MAD distance"],
+                           plate.data["Plate MAD distance"], equal_nan=True)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from fragment_analyser import Line, Plate, fa_data
+from fragment_analyser.sizing import get_markers, get_correction
+
+
+def test_sizing_qc():
+    line = Line(fa_data("alternate/peaktable.csv"))
+    nominal, measured = get_markers(line.wells)
+    assert (nominal[:, 0] == 1).all() and (nominal[:, 1] == 6000).all()
+    assert measured[0, 1] == 6012
+
+    qc = line.get_sizing_qc()
+    assert len(qc) == 12
+    assert qc["UM error (bp)"]["A1"] == 12
+    # the ladder (A12) has its own metrics
+    assert np.isnan(qc["Ladder error (%)"]["A1"])
+    assert qc["Ladder error (%)"]["A12"] > 0
+
+    # no markers: no correction
+    slope, offset = get_correction(np.full((1, 2), np.nan),
+                                   np.full((1, 2), np.nan))
+    assert slope[0] == 1 and offset[0] == 0
+
+
+def test_recalibrate():
+    line = Line(fa_data("alternate/peaktable.csv"))
+    sizes = line.wells[0].df["Size (bp)"].values.copy()
+    slope, offset = line.recalibrate()
+    assert np.allclose(line.wells[0].df["Size (bp)"].values,
+                       sizes * slope[0] + offset[0])
+    # the markers are mapped onto their nominal sizes
+    assert np.isclose(6012 * slope[0] + offset[0], 6000)
+
+    plate = Plate([fa_data("alternate/peaktable.csv")], recalibrate=True)
+    plate.analyse()
+    default = Plate([fa_data("alternate/peaktable.csv")])
+    default.analyse()
+    assert (plate.data["Size (bp)"] != default.data["Size (bp)"]).any()
+    assert len(plate.get_sizing_qc()) == 12
@@ -0,0 +1,68 @@
+import numpy as np
+
+from fragment_analyser import Line, Plate, fa_data
+from fragment_analyser.strategies import (AreaStrategy, Strategy,
+    get_strategy, register_strategy, strategies)
+
+
+def test_builtin():
+    line = Line(fa_data("alternate/peaktable.csv"), peak_mode="concentration")
+    # same as the selection of each well
+    expected = [well.get_most_concentrated_peak() for well in line.wells]
+    expected = [x[0] if x else x for x in expected]
+    assert line.get_peaks()[0:11] == expected[0:11]
+
+    line.peak_mode = "closest"
+    for well in line.wells:
+        well.guess = 500
+    peaks = line.get_peaks()
+    for well, peak in zip(line.wells[0:11], peaks):
+        sizes = well.df["Size (bp)"].astype(float)
+        assert peak == sizes.values[np.argmin(np.abs(sizes.values - 500))]
+
+    # nothing within the window
+    line.peak_mode = AreaStrategy(window=(10, 20))
+    assert line.get_peaks() == [None] * 12
+    line.peak_mode = "molarity"
+    assert line.get_peaks()[0] is not None
+
+    try:
+        get_strategy("unknown")
+        assert False
+    except ValueError:
+        pass
+
+
+def test_register():
+    @register_strategy
+    class Smallest(Strategy):
+        name = "smallest_test"
+        def get_scores(self, batch):
+            return -batch.sizes
+    try:
+        plate = Plate([fa_data("alternate/peaktable.csv")],
+                      peak_mode="smallest_test")
+        plate.analyse()
+        line = plate.lines[0]
+        assert plate.data["Size (bp)"].iloc[0] == \
+            line.wells[0].df["Size (bp)"].min()
+    finally:
+        del strategies["smallest_test"]
+
+
+def test_scores():
+    # the peaks ranked first and the confidence use the scores of the strategy
+    for mode in ["max", "closest", "area", "molarity"]:
+        line = Line(fa_data("alternate/peaktable.csv"), peak_mode=mode)
+        line.set_guess(300)
+        expected = line.get_peaks()
+        assert [x[0] for x in line.get_peaks(top_k=1)] == expected
+        if line.strategy.uses_guess:
+            assert [x[0] for x in line.get_peaks(guesses=[300])] == expected
+        sizes = line.get_confidence()["Size (bp)"]
+        assert [None if x != x else x for x in sizes] == expected
+
+    # the parameters of a strategy are part of the cache key
+    keys = [Plate([], peak_mode=AreaStrategy(window=x)).get_parameters()
+            for x in [(300, 800), (100, 200)]]
+    assert keys[0]["peak_mode"] != keys[1]["peak_mode"]
@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from fragment_analyser import Line
+from fragment_analyser.trace import TraceReader, call_peaks
+
+
+def _get_traces():
+    # 3 wells with the markers (1 and 6000 bp) and 0, 1 or 2 peaks
+    sizes = np.logspace(-0.5, 3.9, 2000)
+    x = np.log(sizes)
+    def gaussian(size, height):
+        return height * np.exp(-0.5 * ((x - np.log(size)) / 0.01)**2)
+    markers = gaussian(1, 1000) + gaussian(6000, 800) + 50 + 0.01 * sizes
+    df = pd.DataFrame({"Size (bp)": sizes,
+                       "A1: empty": markers,
+                       "A2: one": markers + gaussian(500, 2000),
+                       "A3: two": markers + gaussian(300, 500) + gaussian(1200, 1500)},
+                      columns=["Size (bp)", "A1: empty", "A2: one", "A3: two"])
+    return df
+
+
+def test_call_peaks():
+    df = _get_traces()
+    peaks = call_peaks(df["Size (bp)"], df.iloc[:, 1:].values.T)
+    assert list(np.bincount(peaks["trace"])) == [2, 3, 4]
+    assert np.allclose(peaks["size"][peaks["trace"] == 2], [1, 300, 1200, 6000], rtol=0.01)
+    assert (peaks["area"] > 0).all()
+
+
+def test_trace_reader():
+    df = _get_traces()
+    table = TraceReader(df).get_peak_table()
+    assert list(table["Well"].unique()) == ["A1", "A2", "A3"]
+    assert list(table["Sample ID"].unique()) == ["empty", "one", "two"]
+    two = table[table.Well == "A3"]
+    assert list(two["Peak ID"]) == [1, 2, 3, 4]
+    assert two["Size (bp)"].iloc[0] == 1 and two["Size (bp)"].iloc[-1] == 6000
+    assert np.isnan(two["% (Conc.)"].iloc[0])
+    assert two["% (Conc.)"].iloc[1:3].sum() == 100
+
+    fd, filename = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        df.to_csv(filename, index=False)
+        line = Line(filename)
+        peaks = line.get_peaks()
+        assert peaks[0] is None
+        assert abs(peaks[1] - 500) <= 5
+        assert abs(peaks[2] - 1200) <= 12
+    finally:
+        os.remove(filename)
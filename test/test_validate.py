@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+from fragment_analyser import Plate, fa_data
+from fragment_analyser.validate import validate_file, validate_files, main
+
+
+def _write(content):
+    fd, filename = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    with open(filename, "w", newline="") as fout:
+        fout.write(content)
+    return filename
+
+
+def _get_rows(filename):
+    with open(fa_data(filename), newline="") as fin:
+        return fin.read().split("\r\n")
+
+
+def test_valid_files():
+    filenames = [fa_data("alternate/peaktable.csv"),
+                 fa_data("examples/lineB.csv"),
+                 fa_data("examples/test_input_well_C.csv")]
+    results = validate_files(filenames)
+    assert [x.filename for x in results] == filenames
+    assert [x.format for x in results] == ["alternate", "alternate", "standard"]
+    for result in results:
+        assert result.ok, str(result)
+        assert result.wells == 12
+
+
+def test_invalid_alternate():
+    rows = _get_rows("examples/lineB.csv")
+    # the TIC of B1 is not a number and B2 is renamed B1
+    content = "\r\n".join(rows).replace(",TIC: ,", ",TIC: ,x", 1)
+    filename = _write(content.replace("B2,", "B1,", 1))
+    try:
+        result = validate_file(filename)
+        assert not result.ok
+        assert result.errors == [
+            "line 11: TIC of well B1 is not a number ('x1.8214')",
+            "line 15: well B1 is found twice"]
+    finally:
+        os.remove(filename)
+
+    # without the last empty row, the Total Conc. row of B12 is ignored
+    filename = _write("\r\n".join(rows[:-2]))
+    try:
+        result = validate_file(filename)
+        assert len(result.errors) == 1
+        assert "well B12 without Total Conc." in result.errors[0]
+    finally:
+        os.remove(filename)
+
+
+def test_invalid_standard():
+    rows = _get_rows("examples/test_input_well_C.csv")
+    rows[1] = rows[1].replace("D1,", "Z1,", 1)
+    rows[2] = rows[2].replace(",1388,", ",13x8,", 1)
+    filename = _write("\r\n".join(rows))
+    try:
+        result = validate_file(filename)
+        assert result.errors == ["line 2: invalid well name 'Z1'",
+                                 "line 3: Size (bp) is not a number ('13x8')"]
+        assert main(["validate", "--pattern", filename, "--json"]) == 1
+    finally:
+        os.remove(filename)
+
+
+def test_trace():
+    content = "Size (bp),A1: empty,A2: one\n1,10,12\n2,11,13\n3,10,x\n"
+    filename = _write(content)
+    try:
+        result = validate_file(filename)
+        assert result.format == "trace" and result.wells == 2
+        assert result.errors == ["line 4: A2: one is not a number ('x')"]
+    finally:
+        os.remove(filename)
+
+
+def test_plate_validate():
+    rows = _get_rows("examples/lineB.csv")
+    filename = _write("\r\n".join(rows[:-2]))
+    events = []
+    try:
+        plate = Plate([fa_data("examples/lineB.csv"), filename],
+                      validate=True, events=events.append)
+        assert list(plate.invalid) == [filename]
+        assert len(plate.lines) == 1
+        status = [x["status"] for x in events if x["event"] == "file_end"]
+        assert status == ["analysed", "invalid"]
+    finally:
+        os.remove(filename)